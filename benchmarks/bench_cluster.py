@@ -0,0 +1,133 @@
+'''
+Discovery, check, census and slot migration against an in-process fake
+cluster (tests/fakecluster.py), at several cluster sizes. Exits with 1
+when migration is slower than --min-migrate-rate or a scenario exceeds
+its --max-ms budget.
+
+    python -m benchmarks.bench_cluster [--nodes 6 100 1000] [--repeat 3]
+                                       [--keys-per-slot 1] [--latency 0]
+                                       [--only discover check census migrate]
+                                       [--min-migrate-rate 200]
+                                       [--max-ms SCENARIO=MS ...]
+'''
+import argparse
+import sys
+import timeit
+
+from redis_cm import (CheckCluster, ConnectionManager, MoveSlot, Nodes, SlotCensus,
+                      CLUSTER_HASH_SLOTS)
+from xprint import xprint, LOG_LEVEL_SILENT
+from tests.fakecluster import FakeCluster
+
+SIZES = (6, 100, 1000)
+SCENARIOS = ('discover', 'check', 'census', 'migrate')
+# Keys per second through MoveSlot on the fake cluster. With one key per
+# slot this is mostly per-slot overhead, about 450 keys/sec on a laptop;
+# the margin is wide so that only real regressions trip it.
+MIN_MIGRATE_RATE = 200
+
+
+def discover(cluster, manager):
+    return Nodes.discover([cluster.seed], raw=True, manager=manager)
+
+
+def check(cluster, manager):
+    check = CheckCluster(discover(cluster, manager), silent=True)
+    check.check(quiet=True)
+    return check
+
+
+def census(cluster, manager):
+    return SlotCensus.take(discover(cluster, manager))
+
+
+def migrate(cluster, manager):
+    '''
+    Move the first slot of the first master to the second master and back,
+    so every repeat starts from the same layout. Returns the keys moved
+    and the seconds spent in MoveSlot.
+    '''
+    nodes = discover(cluster, manager)
+    masters = sorted(nodes.masters, key=lambda n: min(n.slots))
+    src, dst = masters[0], masters[1]
+    slot = min(src.slots)
+    keys, elapsed = 0, 0.0
+    for a, b in ((src, dst), (dst, src)):
+        b.cluster_setslot_importing(slot, a)
+        a.cluster_setslot_migrating(slot, b)
+        stats = MoveSlot(slot, a, b).move_slot().stats
+        keys += stats.keys
+        elapsed += stats.elapsed
+        for n in (b, a):
+            n.cluster_setslot_node(slot, b)
+    return keys, elapsed
+
+
+def run(num_nodes, scenarios, repeat, keys_per_slot, latency, min_migrate_rate, max_ms):
+    '''
+    Print the best time of each scenario and return the thresholds missed.
+    '''
+    masters = max(3, num_nodes // 2)
+    replicas = max(0, num_nodes // masters - 1)
+    missed = []
+    with FakeCluster(masters, replicas, keys_per_slot=keys_per_slot,
+                     latency=latency) as cluster:
+        for name in scenarios:
+            func = globals()[name]
+            results = []
+            # Fresh pools per repeat: connection setup is part of the cost.
+            def once():
+                with ConnectionManager() as manager:
+                    results.append(func(cluster, manager))
+            best = min(timeit.repeat(once, number=1, repeat=repeat))
+            label = f"{name} with {len(cluster.nodes)} nodes"
+            line = (f"{name:<9} {len(cluster.nodes):>5} nodes "
+                    f"({masters} masters, {keys_per_slot * CLUSTER_HASH_SLOTS} keys): "
+                    f"{best * 1000:10.2f}ms")
+            if name == 'migrate':
+                rate = max(keys / elapsed for keys, elapsed in results if elapsed > 0)
+                line += f", {rate:.0f} keys/sec"
+                if rate < min_migrate_rate:
+                    missed.append(f"{label}: {rate:.0f} keys/sec, "
+                                  f"below {min_migrate_rate:.0f}")
+            print(line)
+            if name in max_ms and best * 1000 > max_ms[name]:
+                missed.append(f"{label}: {best * 1000:.2f}ms, over {max_ms[name]:.0f}ms")
+    return missed
+
+
+def parse_max_ms(value):
+    name, sep, ms = value.partition('=')
+    if not sep or name not in SCENARIOS:
+        raise argparse.ArgumentTypeError(f"use SCENARIO=MS with one of {', '.join(SCENARIOS)}")
+    return name, float(ms)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--keys-per-slot', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='injected reply latency per node, seconds')
+    parser.add_argument('--only', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--min-migrate-rate', type=float, default=MIN_MIGRATE_RATE,
+                        metavar='KEYS/SEC', help='fail when MoveSlot is slower than this')
+    parser.add_argument('--max-ms', type=parse_max_ms, action='append', default=[],
+                        metavar='SCENARIO=MS',
+                        help='fail when the best run of SCENARIO takes longer')
+    args = parser.parse_args()
+
+    # Only the figures below are printed, and timed runs pay for no output.
+    xprint.set_loglevel(LOG_LEVEL_SILENT)
+    missed = []
+    for num_nodes in args.nodes:
+        missed += run(num_nodes, args.only, args.repeat, args.keys_per_slot, args.latency,
+                      args.min_migrate_rate, dict(args.max_ms))
+    for message in missed:
+        print(f"REGRESSION {message}", file=sys.stderr)
+    return 1 if missed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
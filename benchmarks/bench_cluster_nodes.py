@@ -0,0 +1,88 @@
+'''
+CLUSTER NODES parsing: redis-py dict parsing + Node.load_info versus the
+single-pass raw parser. Exits with 1 when the raw parser takes more than
+--max-ratio of the redis-py time.
+
+    python -m benchmarks.bench_cluster_nodes [--nodes 1000] [--repeat 20]
+                                             [--max-ratio 0.9]
+'''
+import argparse
+import sys
+import timeit
+from unittest.mock import patch
+
+try:
+    from redis._parsers.helpers import parse_cluster_nodes
+except ImportError:
+    from redis.client import parse_cluster_nodes
+
+from redis_cm import Node, CLUSTER_HASH_SLOTS
+
+# The raw parser usually runs in 0.45-0.6 of the redis-py time, but
+# machine noise alone can push a run to about 0.85.
+MAX_RATIO = 0.9
+
+
+def synthetic_cluster_nodes(num_nodes):
+    masters = max(1, num_nodes // 2)
+    per_master = CLUSTER_HASH_SLOTS // masters
+    lines = []
+    for i in range(num_nodes):
+        node_id = f"{i:040x}"
+        addr = f"10.0.{i // 250}.{i % 250}:7000@17000"
+        flags = 'myself,master' if i == 0 else 'master'
+        if i < masters:
+            start = i * per_master
+            end = CLUSTER_HASH_SLOTS - 1 if i == masters - 1 else start + per_master - 1
+            lines.append(f"{node_id} {addr} {flags} - 0 1604380080000 {i + 1} connected "
+                         f"{start}-{end}")
+        else:
+            lines.append(f"{node_id} {addr} slave {i - masters:040x} 0 1604380080000 "
+                         f"{i - masters + 1} connected")
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--max-ratio', type=float, default=MAX_RATIO,
+                        help='fail when raw takes more than this fraction of redis-py')
+    args = parser.parse_args()
+
+    text = synthetic_cluster_nodes(args.nodes)
+    node = Node('10.0.0.0:7000')
+
+    def parsed(with_friends):
+        with patch.object(Node, '_cluster_nodes', return_value=parse_cluster_nodes(text)):
+            node.load_info(with_friends=with_friends)
+
+    def raw(with_friends):
+        with patch.object(Node, '_cluster_nodes_raw', return_value=text):
+            node.load_info(with_friends=with_friends, raw=True)
+
+    missed = []
+    for with_friends in (True, False):
+        funcs = (('redis-py + load_info', parsed), ('raw', raw))
+        times = {name: [] for name, _ in funcs}
+        # Interleaved, so that both see the same machine noise.
+        for _ in range(args.repeat):
+            for name, func in funcs:
+                times[name].append(timeit.timeit(lambda: func(with_friends), number=1))
+        times = {name: min(elapsed) for name, elapsed in times.items()}
+        for name, best in times.items():
+            print(f"{name:<22} with_friends={with_friends!s:<5} {args.nodes} lines: "
+                  f"{best * 1000:8.2f}ms per reply, "
+                  f"{best * args.nodes:8.2f}s per cluster load")
+        ratio = times['raw'] / times['redis-py + load_info']
+        print(f"{'raw / redis-py':<22} with_friends={with_friends!s:<5} {ratio:.2f}")
+        if ratio > args.max_ratio:
+            missed.append(f"raw parser with_friends={with_friends}: {ratio:.2f} "
+                          f"of redis-py, over {args.max_ratio}")
+    for message in missed:
+        print(f"REGRESSION {message}", file=sys.stderr)
+    return 1 if missed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,29 +1,187 @@
+import argparse
+import asyncio
+import gzip
+import hashlib
+import heapq
+import json
+import math
+import os
+import queue
+import shlex
+import socket
+import sys
+import threading
+import time
 import redis
-from xprint import xprint
+import redis.asyncio
+from array import array
+from binascii import crc_hqx
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from xprint import xprint, XPrint, LOG_LEVEL_ERROR, LOG_LEVEL_SILENT, LOG_LEVEL_VERBOSE
+
+CLUSTER_HASH_SLOTS = 16384
+
+
+class SlotSet:
+    '''
+    Set of hash slots kept as a CLUSTER_HASH_SLOTS-bit bitmap (bit N is slot N).
+    Union, difference and count are single big-int operations, and ranges
+    are walked run by run instead of slot by slot.
+    '''
+    __slots__ = ('_bits',)
+    __hash__ = None
+
+    def __init__(self, slots=()):
+        if isinstance(slots, SlotSet):
+            self._bits = slots._bits
+            return
+        bits = 0
+        for slot in slots:
+            bits |= 1 << slot
+        self._bits = bits
+
+    @classmethod
+    def _from_bits(cls, bits):
+        slot_set = cls.__new__(cls)
+        slot_set._bits = bits
+        return slot_set
+
+    @classmethod
+    def from_range(cls, start, end):
+        '''
+        Slots from start to end, both inclusive.
+        '''
+        return cls._from_bits(((1 << (end - start + 1)) - 1) << start)
+
+    @classmethod
+    def from_ranges(cls, ranges):
+        bits = 0
+        for start, end in ranges:
+            bits |= ((1 << (end - start + 1)) - 1) << start
+        return cls._from_bits(bits)
+
+    @classmethod
+    def all(cls):
+        return cls.from_range(0, CLUSTER_HASH_SLOTS - 1)
+
+    def add(self, slot):
+        self._bits |= 1 << slot
+
+    def discard(self, slot):
+        self._bits &= ~(1 << slot)
+
+    def update(self, slots):
+        self._bits |= SlotSet(slots)._bits
+
+    def copy(self):
+        return SlotSet._from_bits(self._bits)
+
+    def ranges(self):
+        '''
+        Yield (start, end) for each run of consecutive slots, end inclusive.
+        '''
+        bits = self._bits
+        while bits:
+            start = (bits & -bits).bit_length() - 1
+            run = bits >> start
+            length = (run ^ (run + 1)).bit_length() - 1
+            yield start, start + length - 1
+            bits &= ~(((1 << length) - 1) << start)
+
+    def summarize(self):
+        return ','.join(f"{start}-{end}" if start != end else str(start)
+                        for start, end in self.ranges())
+
+    def __iter__(self):
+        for start, end in self.ranges():
+            yield from range(start, end + 1)
+
+    def __len__(self):
+        return bin(self._bits).count('1')
+
+    def __bool__(self):
+        return self._bits != 0
+
+    def __contains__(self, slot):
+        return slot >= 0 and (self._bits >> slot) & 1 == 1
+
+    def __or__(self, other):
+        return SlotSet._from_bits(self._bits | SlotSet(other)._bits)
+
+    def __and__(self, other):
+        return SlotSet._from_bits(self._bits & SlotSet(other)._bits)
+
+    def __sub__(self, other):
+        return SlotSet._from_bits(self._bits & ~SlotSet(other)._bits)
+
+    def __xor__(self, other):
+        return SlotSet._from_bits(self._bits ^ SlotSet(other)._bits)
+
+    def __ior__(self, other):
+        self._bits |= SlotSet(other)._bits
+        return self
+
+    def __isub__(self, other):
+        self._bits &= ~SlotSet(other)._bits
+        return self
+
+    union = __or__
+    intersection = __and__
+    difference = __sub__
+
+    def __eq__(self, other):
+        if isinstance(other, SlotSet):
+            return self._bits == other._bits
+        if isinstance(other, (set, frozenset, list, tuple, range)):
+            return self._bits == SlotSet(other)._bits
+        return NotImplemented
+
+    def __repr__(self):
+        return f"SlotSet('{self.summarize()}')"
+
 
 def summarize_slots(slots):
-    _temp_slots = []
-    for slot in sorted(slots):
-        if not _temp_slots or _temp_slots[-1][-1] != (slot-1): 
-            _temp_slots.append([])
-        _temp_slots[-1][1:] = [slot]
-    return ','.join(map(lambda slot_exp: '-'.join(map(str, slot_exp)), _temp_slots)) 
+    return SlotSet(slots).summarize()
 
 
 def parse_slots(slots):
-    parsed_slots = []
+    parsed_slots = SlotSet()
     for s in slots:
         # ["0", "5460"]
         if len(s) == 2:
-            start = int(s[0])
-            end = int(s[1]) + 1
-            parsed_slots += list(range(start, end))
+            parsed_slots |= SlotSet.from_range(int(s[0]), int(s[1]))
         # ["5462"]
         else:
-            parsed_slots += [int(s[0])]
+            parsed_slots.add(int(s[0]))
 
     return parsed_slots
 
+
+def _hash_tag(key):
+    start = key.index(b'{')
+    end = key.find(b'}', start + 1)
+    return key[start + 1:end] if end > start + 1 else key
+
+
+def key_slot(key):
+    '''
+    Hash slot of a key: CRC16-XMODEM (binascii.crc_hqx) of the key, or of
+    its {hash tag} when it has a non-empty one, modulo 16384.
+    '''
+    if isinstance(key, str):
+        key = key.encode()
+    return crc_hqx(_hash_tag(key) if b'{' in key else key, 0) & (CLUSTER_HASH_SLOTS - 1)
+
+
+def key_slots(keys):
+    '''
+    Slots of a batch of bytes keys as an array('H'): one comprehension with
+    the CRC in C, about 2M keys/sec.
+    '''
+    crc, tag, mask = crc_hqx, _hash_tag, CLUSTER_HASH_SLOTS - 1
+    return array('H', [crc(tag(k) if b'{' in k else k, 0) & mask for k in keys])
+
 class ParseHelperError(Exception): pass
 class ParseHelper:
     @classmethod
@@ -37,16 +195,16 @@ class ParseHelper:
 
     @classmethod
     def parse_slots(cls, slots):
-        parsed_slots = []
+        parsed_slots = SlotSet()
         migrating = {}
         importing = {}
         for s in slots:
             s_len = len(s)
             if s_len == 1:
-                parsed_slots += [int(s[0])]
+                parsed_slots.add(int(s[0]))
             elif s_len == 2:
                 start, end = map(int, s)
-                parsed_slots += list(range(start, end+1))
+                parsed_slots |= SlotSet.from_range(start, end)
             elif s_len == 3:
                 slot, direction, node_id = s
                 slot = int(slot[1:])
@@ -56,452 +214,2876 @@ class ParseHelper:
                 else:
                     importing.update({slot: node_id})
 
-        return sorted(parsed_slots), migrating, importing        
+        return parsed_slots, migrating, importing
 
     @classmethod
     def parse_flags(cls, flags):
         return flags.split(',')
- 
-
-class NodeException(Exception): pass
-class Node:
-    def __init__(self, addr, password=None):
-        self._origin_addr = addr
-        self._password = password
-        self._friends = []
-        self._host, self._port = ParseHelper.parse_addr(addr)
-        self._r = None
-        self._info = {}
-
-    def connect(self):
-        if self._r:
-            return
-        xprint.verbose(f"Connecting to node {self}: ", end="")
-        try:
-            self._r = redis.StrictRedis(self._host, self._port,
-                                        password=self._password,
-                                        socket_timeout=3, decode_responses=True)
-            self._r.ping()
-        except redis.exceptions.RedisError as e:
-            xprint.verbose("FAIL", ignore_header=True)
-            self._r = None
-            raise NodeException(f"Sorry, can't connect to node '{self}'. Reason: {e}")
-        xprint.verbose("OK", ignore_header=True)
-
-    def _cluster_nodes(self):
-        return self._r.cluster('NODES')
-
-    def load_info(self, with_friends=False):
-        self._friends = []
-        nodes = self._cluster_nodes() 
-
-        for addr, info in nodes.items():
-            host, port = ParseHelper.parse_addr(addr)
-            flags = ParseHelper.parse_flags(info['flags'])
-            if 'myself' in flags:
-                slots, migrating, importing = ParseHelper.parse_slots(info['slots'])
-                replicate = info['master_id'] if info['master_id'] != '-' else None
-                self._info = {
-                    'node_id': info['node_id'],
-                    'host': host,
-                    'port': port,
-                    'flags': flags,
-                    'slots': slots,
-                    'migrating': migrating,
-                    'importing': importing,
-                    'replicate': replicate,
-                }
-            elif with_friends:
-                self._friends.append({f"{host}:{port}": flags})
-
-    @property
-    def friends(self):
-        return self._friends
-
-    def __str__(self):
-        return f"{self._host}:{self._port}" 
-
-    @property
-    def host(self):
-        return self._info.get('host')
-
-    @property
-    def port(self):
-        return self._info.get('port')
-
-    @property
-    def node_id(self):
-        return self._info.get('node_id')
-
-    @property
-    def migrating(self):
-        return self._info.get('migrating') or {}
-
-    @property
-    def importing(self):
-        return self._info.get('importing') or {}
-
-    @property
-    def friends(self):
-        return self._friends 
-
-    @property
-    def slots(self):
-        return self._info.get('slots')
 
-    @property
-    def flags(self):
-        return self._info.get('flags') 
+    @classmethod
+    def parse_flag_bits(cls, flags):
+        bits = _FLAG_BITS_CACHE.get(flags)
+        if bits is None:
+            bits = 0
+            for flag in flags.split(','):
+                bits |= NODE_FLAGS.get(flag, 0)
+            _FLAG_BITS_CACHE[flags] = bits
+        return bits
 
-    def is_master(self):
-        return 'master' in self._info.get('flags')
+    @classmethod
+    def parse_migrations(cls, migrations):
+        migrating = {}
+        importing = {}
+        for m in migrations:
+            if m['state'] == 'migrating':
+                migrating[int(m['slot'])] = m['node_id']
+            else:
+                importing[int(m['slot'])] = m['node_id']
+        return migrating, importing
 
-    def is_slave(self):
-        return 'slave' in self._info.get('flags')
-   
-    def config_signature(self):
-        signature = []
-        for n in [self._node] + self._friends:
-            signature.append(f"{n['node_id']}:{summarize_slots(parse_slots(n['slots']))}")
-        return '|'.join(sorted(signature))
-            
-    def cluster_count_keys_in_slot(self, slot):
+    @classmethod
+    def config_digest(cls, entries):
         '''
-        CLUSTER COUNTKEYSINSLOT __slot__
+        Fixed-size digest of a node's view of the cluster, like redis-trib's
+        config signature: sorted node_id:slots of every node owning slots.
+        `entries` yields (node_id, slot tokens) with migrating/importing
+        tokens left out; Redis prints the ranges canonically.
         '''
-        return 0
+        signature = sorted(f"{node_id}:{','.join(sorted(tokens))}"
+                           for node_id, tokens in entries if tokens)
+        return hashlib.blake2b('|'.join(signature).encode(), digest_size=16).hexdigest()
 
-    def clear_slot(self, slot):
-        # CLUSTER SETSLOT __slot__ STABLE
-        pass
+    @classmethod
+    def raw_config_entries(cls, text):
+        for line in text.splitlines():
+            fields = line.split(' ', 8)
+            if len(fields) == 9:
+                yield fields[0], [t for t in fields[8].split() if t[0] != '[']
 
-    def set_slot_owner(self, slot):
+    @classmethod
+    def parsed_config_entries(cls, nodes):
+        for info in nodes.values():
+            yield info['node_id'], ['-'.join(s) for s in info['slots'] if len(s) != 3]
+
+    @classmethod
+    def parse_config_view(cls, text):
         '''
-        self._r.pipeline()\
-            .cluster('DELSLOTS', slot)\
-            .cluster('ADDSLOTS', slot)\
-            .cluster('BUMPEPOCH')\
-            .execute() 
+        {node_id: SlotSet} of every node owning slots in a raw CLUSTER NODES reply.
         '''
+        return {r.node_id: r.slots for r in cls.parse_cluster_nodes(text) if r.slots}
 
-    def cluster_bumpepoch(self):
+    @classmethod
+    def parse_cluster_nodes(cls, text, myself_only=False):
         '''
-        CLUSTER BUMPEPOCH
+        Single pass over the raw CLUSTER NODES reply:
+        <id> <ip:port@cport[,hostname]> <flags> <master> <ping-sent> <pong-recv> <config-epoch> <link-state> <slot> ...
+        With `myself_only`, every other line is skipped after a cheap split.
         '''
+        records = []
+        append = records.append
+        intern = sys.intern
+        flag_bits = cls.parse_flag_bits
+        slot_set = SlotSet._from_bits
+        for line in text.splitlines():
+            if myself_only:
+                head = line.split(' ', 3)
+                if len(head) < 4 or 'myself' not in head[2]:
+                    continue
+            fields = line.split(' ', 8)
+            if len(fields) < 8:
+                continue
+            node_id, addr, flags, master_id, _, _, epoch, link = fields[:8]
+            host, sep, port = addr.partition('@')[0].rpartition(':')
+            if not sep:
+                raise ParseHelperError(f"Invalid IP or Port (given as {addr}) - use IP:Port format")
 
-    def cluster_setslot_stable(self, slot):
-        pass
-
-    def cluster_setslot_node(self, slot, owner):
-        self._r.cluster('SETSLOT', slot, 'NODE', owner.node_id)
+            bits = 0
+            migrating = {}
+            importing = {}
+            if len(fields) == 9:
+                for token in fields[8].split():
+                    if token[0] == '[':
+                        # [slot->-node_id] or [slot-<-node_id]
+                        slot, direction, peer = token[1:-1].partition('->-')
+                        if direction:
+                            migrating[int(slot)] = intern(peer)
+                        else:
+                            slot, _, peer = token[1:-1].partition('-<-')
+                            importing[int(slot)] = intern(peer)
+                        continue
+                    start, _, end = token.partition('-')
+                    start = int(start)
+                    end = int(end) if end else start
+                    bits |= ((1 << (end - start + 1)) - 1) << start
 
-    def cluster_setslot_migrating(self, slot, target):
-        self._r.cluster('SETSLOT', slot, 'MIGRATING', target.node_id)
- 
-    def cluster_setslot_importing(self, slot, source):
-        self._r.cluster('SETSLOT', slot, 'IMPORTING', source.node_id)
+            append(NodeRecord(
+                intern(node_id), host, int(port), flag_bits(flags),
+                intern(master_id) if master_id != '-' else None,
+                int(epoch), link == 'connected',
+                slot_set(bits), migrating, importing))
+        return records
 
-    def cluster_delslots(self, slots):
-        pass
 
-    def cluster_get_keys_in_slot(self, slot, count):
-        return self._r.cluster('GETKEYSINSLOT', slot, count)
+NODE_FLAG_MYSELF = 1 << 0
+NODE_FLAG_MASTER = 1 << 1
+NODE_FLAG_SLAVE = 1 << 2
+NODE_FLAG_PFAIL = 1 << 3
+NODE_FLAG_FAIL = 1 << 4
+NODE_FLAG_HANDSHAKE = 1 << 5
+NODE_FLAG_NOADDR = 1 << 6
+NODE_FLAG_NOFAILOVER = 1 << 7
+NODE_FLAG_NOFLAGS = 1 << 8
 
-    def migrate(self, dst, keys_in_slot, password, timeout=60, replace=False): 
-        # migrate(self, host, port, keys, destination_db, timeout, copy=False, replace=False, auth=None)
-        self._r.migrate(dst.host, dst.port, keys_in_slot, 0, timeout,
-                        auth=password, replace=replace)
-   
+NODE_FLAGS = {
+    'myself': NODE_FLAG_MYSELF,
+    'master': NODE_FLAG_MASTER,
+    'slave': NODE_FLAG_SLAVE,
+    'fail?': NODE_FLAG_PFAIL,
+    'fail': NODE_FLAG_FAIL,
+    'handshake': NODE_FLAG_HANDSHAKE,
+    'noaddr': NODE_FLAG_NOADDR,
+    'nofailover': NODE_FLAG_NOFAILOVER,
+    'noflags': NODE_FLAG_NOFLAGS,
+}
+_FLAG_BITS_CACHE = {}
+_FLAG_NAMES_CACHE = {}
 
 
-class Nodes:
-    def __init__(self, nodes, password=None):
-        self._nodes = nodes
-        self._password = password
+class NodeRecord:
+    '''
+    One line of CLUSTER NODES.
+    '''
+    __slots__ = ('node_id', 'host', 'port', 'flags', 'master_id',
+                 'config_epoch', 'connected', 'slots', 'migrating', 'importing')
 
-    def __getitem__(self, key):
-        return self._nodes[key]
+    def __init__(self, node_id, host, port, flags, master_id,
+                 config_epoch, connected, slots, migrating, importing):
+        self.node_id = node_id
+        self.host = host
+        self.port = port
+        self.flags = flags
+        self.master_id = master_id
+        self.config_epoch = config_epoch
+        self.connected = connected
+        self.slots = slots
+        self.migrating = migrating
+        self.importing = importing
 
     @property
-    def covered_slots(self):
-        return set(slot for n in self
-                        for slot in n.slots)
+    def addr(self):
+        return f"{self.host}:{self.port}"
 
-    @property
-    def open_slots(self):
-        total_open_slots = set()
-        for node in self:
-            for open_type in [MIGRATING, IMPORTING]:
-                slots = getattr(node, open_type) 
-                if slots:
-                    total_open_slots = total_open_slots.union(set(slots.keys()))
-        return sorted(total_open_slots)
+    def has_flag(self, flag):
+        return self.flags & flag != 0
 
+    def flag_names(self):
+        return _flag_names(self.flags)
 
-    def __iter__(self):
-        for node in self._nodes:
-            yield node
 
-    def __eq__(self, _nodes):
-        return self._nodes == _nodes
+def _cluster_state(info):
+    return (int(info['cluster_current_epoch']), int(info['cluster_my_epoch']),
+            int(info['cluster_known_nodes']))
 
-    @property
-    def masters(self):
-        for node in self._nodes:
-            if node.is_master():
-                yield node
 
+def _flag_names(flags):
+    names = _FLAG_NAMES_CACHE.get(flags)
+    if names is None:
+        names = [name for name, bit in NODE_FLAGS.items() if flags & bit]
+        _FLAG_NAMES_CACHE[flags] = names
+    return list(names)
 
-IMPORTING = 'importing'
-MIGRATING = 'migrating'
 
+DISCOVERY_CONCURRENCY = 32
+CENSUS_CONCURRENCY = 32
+CENSUS_PIPELINE = 1000
+MIGRATE_MIN_BATCH = 10
+MIGRATE_MAX_BATCH = 1000
+MIGRATE_LATENCY_BUDGET = 0.1
+# MIGRATE takes its timeout in milliseconds.
+MIGRATE_TIMEOUT = 60000
+MIGRATE_MAX_BATCH_BYTES = 16 * 1024 * 1024
+MIGRATE_BIG_KEY_BYTES = 8 * 1024 * 1024
+# Pessimistic transfer rate used to scale the timeout of big batches.
+MIGRATE_MIN_BYTES_PER_SEC = 10 * 1024 * 1024
+THROTTLE_SAMPLE_INTERVAL = 1.0
+SKIP_FRIEND_FLAGS = ('noaddr', 'handshake', 'fail')
+RESHARD_CONCURRENCY = 16
+RESHARD_PER_SOURCE = 1
+RESHARD_PER_DESTINATION = 1
+RESHARD_PROGRESS_INTERVAL = 1.0
+NOTIFY_CONCURRENCY = 32
+NOTIFY_BATCH = 256
+NOTIFY_INTERVAL = 0.1
 
-class CheckCluster:
 
-    def __init__(self, nodes=None):
-        self._nodes = nodes
+SOCKET_TIMEOUT = 3
+SOCKET_CONNECT_TIMEOUT = 3
+HEALTH_CHECK_INTERVAL = 30
 
-    def check(self, quiet=False):
-        if not quiet:
-            self._show_nodes()
-        self._check_config_consistency()
-        self._check_open_slots()
-        self._check_slots_coverage()
 
-    def _check_config_consistency(self):
-        if not self._is_config_consistent():
-            self._increase_num_errors()
-            xprint.error("Nodes don't agree about configuration!")
-        else:
-            xprint.ok("All nodes agree about slots configuration.")
+def _keepalive_options():
+    options = {}
+    for name, value in (('TCP_KEEPIDLE', 60), ('TCP_KEEPINTVL', 10), ('TCP_KEEPCNT', 3)):
+        if hasattr(socket, name):
+            options[getattr(socket, name)] = value
+    return options
 
-    def check_open_slots(self):
-        opened_slots = set()
-        for node in self._nodes:
-            for open_type in [MIGRATING, IMPORTING]:
-                slots = getattr(node, open_type) 
-                if slots:
-                    xprint.warning(self._warn_opened_slot(node, open_type, slots.keys()))
-                    opened_slots = opened_slots.union(set(slots.keys()))
-        return opened_slots
 
-    def _check_open_slots(self):
-        xprint(">>> Check for open slots...")
-        open_slots = set()
-        for n, migrating, importing in self._get_opened_slots():
-            if len(migrating) > 0:
-                self._increase_num_errors()
-                xprint.warning(self._warn_opened_slot(n, 'migrating', migrating.keys()))
-                open_slots = open_slots.union(set(migrating.keys()))
-            if len(importing) > 0:
-                self._increase_num_errors()
-                xprint.warning(self._warn_opened_slot(n, 'importing', importing.keys()))
-                open_slots = open_slots.union(set(importing.keys()))
+# Guards the lazily created per-node clients.
+_client_lock = threading.Lock()
 
-        if len(open_slots) > 0:
-            xprint.warning(f"The following slots are open: "\
-                           f"{','.join(map(str, open_slots))}")
 
-        return open_slots
+# Commands whose first argument names what they do, profiled as e.g. 'CONFIG GET'.
+_CONTAINER_COMMANDS = frozenset(('CLUSTER', 'CONFIG', 'CLIENT', 'MEMORY', 'LATENCY',
+                                 'DEBUG', 'SCRIPT', 'OBJECT', 'COMMAND', 'FUNCTION'))
+PROFILE_FORMATS = ('summary', 'json', 'prometheus')
+PROFILE_TOP = 10
 
-    def check_slots_coverage(self):
-        return list(set(range(CLUSTER_HASH_SLOTS)) - self._nodes.covered_slots)
 
-    def _check_slots_coverage(self):
-        xprint(">>> Check slots coverage...")
-        covered_slots = self._get_covered_slots()
-        if len(covered_slots) == CLUSTER_HASH_SLOTS:
-            xprint.ok(f"All {CLUSTER_HASH_SLOTS} slots covered.")
-        else:
-            self._increase_num_errors()
-            xprint.error(f"Not all {CLUSTER_HASH_SLOTS} {summarize_slots(covered_slots)} "
-                         f"slots are covered by nodes.")
+def _command_name(args):
+    name = args[0]
+    name = (name.decode() if isinstance(name, bytes) else str(name)).upper()
+    if name in _CONTAINER_COMMANDS and len(args) > 1:
+        sub = args[1]
+        name += ' ' + (sub.decode() if isinstance(sub, bytes) else str(sub)).upper()
+    return name
 
-        return list(set(range(CLUSTER_HASH_SLOTS)) - covered_slots)
 
-    def _warn_opened_slot(self, node, open_type, slots):
-        return f"Node {node} has slots in {open_type} "\
-               f"state {','.join(map(str, slots))}"
+def _pipeline_name(command_stack):
+    names = []
+    for args, _ in command_stack:
+        name = _command_name(args)
+        if name not in names:
+            names.append(name)
+    return '+'.join(names)
 
-    def is_config_consistent(self):
-        return len(set(n.config_signature() for n in self._nodes)) == 1
 
-class MoveSlot:
-    def __init__(self, src, dst, slot):
-        self._src = src
-        self._dst = dst
-        self._slot = slot
+class CommandStats:
+    '''
+    Calls, errors and a latency histogram for one command on one node.
+    Bucket i holds latencies up to 2 ** (i / 4) microseconds, so quantiles
+    are exact to within 19% in constant memory.
+    '''
+    _BUCKETS_PER_DOUBLING = 4
+    __slots__ = ('_buckets', 'calls', 'commands', 'errors', 'total', 'max')
 
-    def move_slot(self):
-        return self
+    def __init__(self):
+        self._buckets = Counter()
+        self.calls = 0
+        self.commands = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
 
-    def moving(self):
-        return self
+    def add(self, elapsed, commands=1, error=False):
+        micros = elapsed * 1e6
+        bucket = math.ceil(math.log2(micros) * self._BUCKETS_PER_DOUBLING) if micros > 1 else 0
+        self._buckets[bucket] += 1
+        self.calls += 1
+        self.commands += commands
+        self.errors += error
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
 
-    def update(self):
+    def merge(self, other):
+        self._buckets.update(other._buckets)
+        self.calls += other.calls
+        self.commands += other.commands
+        self.errors += other.errors
+        self.total += other.total
+        self.max = max(self.max, other.max)
         return self
 
-    def notify(self):
-        return self
+    def quantile(self, q):
+        if not self.calls:
+            return 0.0
+        rank = q * self.calls
+        seen = 0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen >= rank:
+                return min(self.max, 2 ** (bucket / self._BUCKETS_PER_DOUBLING) / 1e6)
+        return self.max
 
+    @property
+    def p50(self):
+        return self.quantile(0.5)
 
-class FixCluster:
-    def __init__(self, nodes):
-        self._nodes = nodes
+    @property
+    def p99(self):
+        return self.quantile(0.99)
 
+    def to_dict(self):
+        return {'calls': self.calls, 'commands': self.commands, 'errors': self.errors,
+                'total': round(self.total, 6), 'p50': round(self.p50, 6),
+                'p99': round(self.p99, 6), 'max': round(self.max, 6)}
 
-class FixOpenSlot:
-    def __init__(self, nodes, slot):
-        self._nodes = nodes
-        self._owner = None
-        self._candidates = []
-        self._migrating = []
-        self._importing = []
 
-    @property
-    def nodes(self):
-        return self._nodes
+class CommandProfile:
+    '''
+    Per-node, per-command latency of every call made through a Node's
+    clients, plus the bytes migrated or imported per node. Off until
+    `enabled` is set; a pipeline counts as one call named after the
+    commands in it, e.g. 'MIGRATE+CLUSTER GETKEYSINSLOT'.
+    '''
+    def __init__(self):
+        self.enabled = False
+        self._stats = {}
+        self._bytes = Counter()
+        self._lock = threading.Lock()
 
-    def get_node_with_most_keys_in_slot(self, nodes, slot):
-        best = None
-        best_numkeys = 0
+    def record(self, addr, command, elapsed, commands=1, error=False):
+        with self._lock:
+            stats = self._stats.get((addr, command))
+            if stats is None:
+                stats = self._stats[(addr, command)] = CommandStats()
+            stats.add(elapsed, commands, error)
 
-        for n in nodes:
-            numkeys = n.cluster_count_keys_in_slot(slot)
-            if numkeys > best_numkeys or best is None:
-                numkeys = n.cluster_count_keys_in_slot(slot)
-                best = n
-                best_numkeys = numkeys
+    def add_bytes(self, node, nbytes):
+        if self.enabled:
+            with self._lock:
+                self._bytes[str(node)] += nbytes
 
-        return best
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._bytes.clear()
 
-    def assert_owner(self):
-        if self._owner is None:
-            raise BaseException()
+    @property
+    def stats(self):
+        '''
+        {(addr, command): CommandStats}
+        '''
+        with self._lock:
+            return dict(self._stats)
 
-    def fix_open_slot(self, slot):
-        self.set_owner_candidates(slot)
-        owner = self.elect_owner()
-        self.change_owner_to_donor()
+    @property
+    def bytes(self):
+        with self._lock:
+            return dict(self._bytes)
 
-        if (len(self._migrating) == 1
-            and len(self._importing) == 1):
-            src = self._migrating[0]
-            dst = self._importing[0]
-            move_slot(src, dst, slot, update=True)
-        elif (len(self._migrating) == 0
-              and len(self._importing) > 0):
-            for n in self._importing:
-                if n == owner:
-                    continue
-                move_slot(n, owner, slot, cold=True)
-                n.clear_slot(slot)
-                m = MoveSlot(n, owner, slot)
-                m.move_slot()
-        elif (len(self._migrating) == 1
-              and len(self._importing) > 1):
-            src = self._migrating[0]
-            dst = None
-            target_id = src.migrating['id']
-            for n in self._importing:
-                if n.cluster_count_keys_in_slot(slot) > 0:
-                    raise BaseException()
-                if target_id == n.node_id:
-                    dst = n
-            if dst:
-                move_slot(src, dst, slot)
-                for n in self._importing:
-                    if n == dst:
-                        continue
-                    n.clear_slot(slot)
-            else:
-                src.clear_slot(slot)
-                for n in self._importing:
-                    n.clear_slot(n)
+    def _merged(self, key):
+        merged = {}
+        for (addr, command), stats in self.stats.items():
+            merged.setdefault(key(addr, command), CommandStats()).merge(stats)
+        return merged
 
+    def by_command(self):
+        return self._merged(lambda addr, command: command)
 
-    def set_owner_candidates(self):
-        self._candidates = []
-        for n in self._nodes.masters:
-            if slot in n.slots:
-                self._candidates.append(n)
-            elif n.cluster_count_keys_in_slot(self._slot):
-                self._candidates.append(n)
+    def by_node(self):
+        return self._merged(lambda addr, command: addr)
 
+    def to_dict(self):
+        nbytes = self.bytes
+        nodes = {}
+        for (addr, command), stats in sorted(self.stats.items()):
+            node = nodes.setdefault(addr, {'bytes': nbytes.get(addr, 0), 'commands': {}})
+            node['commands'][command] = stats.to_dict()
+        return {'nodes': nodes,
+                'commands': {command: stats.to_dict()
+                             for command, stats in sorted(self.by_command().items())}}
 
-    def elect_owner_from_candidates(self):
-        owner = self.get_node_with_most_keys_in_slot(self._nodes, slot)
-        owner.clear_slot(slot)
-        owner.set_slot_owner(slot)
-        owner.add_slots(slot)
-        owner.cluster_bumpepoch()
-        self._importing = [n for n in self._importing if n != owner]
-        self._migrating = [n for n in self._migrating if n != owner]
+    def to_prometheus(self):
+        metric = 'redis_cm_command_duration_seconds'
+        lines = [f"# HELP {metric} Latency of commands sent by redis-cm.",
+                 f"# TYPE {metric} summary"]
+        gauges = [f"# HELP {metric}_max Slowest call.", f"# TYPE {metric}_max gauge"]
+        errors = ["# HELP redis_cm_command_errors_total Calls that returned an error.",
+                  "# TYPE redis_cm_command_errors_total counter"]
+        for (addr, command), stats in sorted(self.stats.items()):
+            labels = f'node="{addr}",command="{command}"'
+            for q in (0.5, 0.99):
+                lines.append(f'{metric}{{{labels},quantile="{q}"}} {stats.quantile(q):.6f}')
+            lines.append(f"{metric}_sum{{{labels}}} {stats.total:.6f}")
+            lines.append(f"{metric}_count{{{labels}}} {stats.calls}")
+            gauges.append(f"{metric}_max{{{labels}}} {stats.max:.6f}")
+            errors.append(f"redis_cm_command_errors_total{{{labels}}} {stats.errors}")
+        moved = ["# HELP redis_cm_bytes_moved_total Bytes migrated or imported per node.",
+                 "# TYPE redis_cm_bytes_moved_total counter"]
+        moved += [f'redis_cm_bytes_moved_total{{node="{addr}"}} {nbytes}'
+                  for addr, nbytes in sorted(self.bytes.items())]
+        return '\n'.join(lines + gauges + errors + moved) + '\n'
 
+    def show_summary(self, top=PROFILE_TOP):
+        def row(name, stats):
+            return (f"   {name:<40} {stats.calls:>8} {stats.errors:>6} "
+                    f"{stats.p50 * 1000:>9.2f} {stats.p99 * 1000:>9.2f} "
+                    f"{stats.max * 1000:>9.2f} {stats.total:>9.2f}")
+        header = (f"   {'':<40} {'calls':>8} {'errors':>6} {'p50 ms':>9} "
+                  f"{'p99 ms':>9} {'max ms':>9} {'total s':>9}")
+        by_total = lambda item: item[1].total
 
-    def change_owner_to_donor(self):
-        if self._owner is None:
-            raise BaseException('No owner')
-        for n in self._owners:
-            if n == self._owner:
-                continue
-            n.del_slots(slot)
-            n.cluster_setslot_stable(slot)
-            n.cluster_setslot_importing(slot, owner)
-            self._importing = [_n for _n in self._importing if _n != n] 
-            self._importing.append(n)
-            self._migrating = [_n for _n in self._migrating if _n != n]
+        xprint(">>> Commands by total time")
+        xprint(header)
+        for command, stats in sorted(self.by_command().items(), key=by_total, reverse=True):
+            xprint(row(command, stats))
+        xprint(f">>> Slowest nodes by p99 (top {top})")
+        xprint(header)
+        nbytes = self.bytes
+        for addr, stats in sorted(self.by_node().items(),
+                                  key=lambda item: item[1].p99, reverse=True)[:top]:
+            moved = f" {nbytes[addr] / 1048576:.1f}MB moved" if addr in nbytes else ""
+            xprint(row(addr, stats) + moved)
+        xprint(f">>> Slowest calls by max (top {top})")
+        xprint(header)
+        for (addr, command), stats in sorted(self.stats.items(),
+                                             key=lambda item: item[1].max,
+                                             reverse=True)[:top]:
+            xprint(row(f"{addr} {command}", stats))
 
+    def report(self, fmt='summary', path=None):
+        '''
+        Show the summary, or write JSON or a Prometheus textfile to `path`
+        (stdout without one). Textfiles are replaced atomically so a
+        collector never reads half of one.
+        '''
+        if fmt == 'summary':
+            self.show_summary()
+            return
+        text = (json.dumps(self.to_dict(), indent=2) + '\n' if fmt == 'json'
+                else self.to_prometheus())
+        if path is None:
+            xprint(text, end='', flush=True)
+            return
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(text)
+        os.replace(tmp, path)
 
-    def moving_slots(self, slot, owner):
-        self._migrating = []
-        self._importing = []
 
-        for n in self._nodes.masters:
-            if n.migrating.get(slot):
-                self._migrating.append(n)
-            elif n.importing.get(slot):
-                self._importing.append(n)
-            elif n != owner and n.cluster_count_keys_in_slot(slot) > 0:
-                self._importing.append(n)
+command_profile = CommandProfile()
 
 
-    def fix_open_slot_strategy(self, owners):
-        # owners 구하기
-        # owner is None ?
-        # 1) owners가 0일 때,
-        # 2) owners가 2 이상일 때
-        # 즉, owners가 1이 아닐 때
-        if not owners:
-            return FixOpenSlotNoOwner
-        return FixOpenSlotMultipleOwner
+class _ProfiledPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        if not command_profile.enabled or not self.command_stack:
+            return super().execute(raise_on_error)
+        name = _pipeline_name(self.command_stack)
+        commands = len(self.command_stack)
+        started = time.perf_counter()
+        error = True
+        try:
+            replies = super().execute(raise_on_error)
+            error = any(isinstance(reply, Exception) for reply in replies)
+            return replies
+        finally:
+            command_profile.record(self.addr, name, time.perf_counter() - started,
+                                   commands, error)
 
 
-    def fix_on_case_1(self):
-        src = self._migrating[0]
-        dst = self._importing[0]
-        move_slot(src, dst, slot, update=True)
+class ProfiledRedis(redis.StrictRedis):
+    '''
+    StrictRedis that reports every command and pipeline to command_profile.
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        kwargs = self.connection_pool.connection_kwargs
+        self.addr = f"{kwargs.get('host')}:{kwargs.get('port')}"
 
-    def fix_on_case_2(self):
-        pass
+    def execute_command(self, *args, **options):
+        if not command_profile.enabled:
+            return super().execute_command(*args, **options)
+        started = time.perf_counter()
+        error = True
+        try:
+            reply = super().execute_command(*args, **options)
+            error = False
+            return reply
+        finally:
+            command_profile.record(self.addr, _command_name(args),
+                                   time.perf_counter() - started, error=error)
 
-    def fix_on_case_3(self):
-        pass
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = _ProfiledPipeline(self.connection_pool, self.response_callbacks,
+                                 transaction, shard_hint)
+        pipe.addr = self.addr
+        return pipe
 
-    def fix_on_case_4(self):
-        pass
+
+class _ProfiledAsyncPipeline(redis.asyncio.client.Pipeline):
+    async def execute(self, raise_on_error=True):
+        if not command_profile.enabled or not self.command_stack:
+            return await super().execute(raise_on_error)
+        name = _pipeline_name(self.command_stack)
+        commands = len(self.command_stack)
+        started = time.perf_counter()
+        error = True
+        try:
+            replies = await super().execute(raise_on_error)
+            error = any(isinstance(reply, Exception) for reply in replies)
+            return replies
+        finally:
+            command_profile.record(self.addr, name, time.perf_counter() - started,
+                                   commands, error)
+
+
+class ProfiledAsyncRedis(redis.asyncio.StrictRedis):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        kwargs = self.connection_pool.connection_kwargs
+        self.addr = f"{kwargs.get('host')}:{kwargs.get('port')}"
+
+    async def execute_command(self, *args, **options):
+        if not command_profile.enabled:
+            return await super().execute_command(*args, **options)
+        started = time.perf_counter()
+        error = True
+        try:
+            reply = await super().execute_command(*args, **options)
+            error = False
+            return reply
+        finally:
+            command_profile.record(self.addr, _command_name(args),
+                                   time.perf_counter() - started, error=error)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = _ProfiledAsyncPipeline(self.connection_pool, self.response_callbacks,
+                                      transaction, shard_hint)
+        pipe.addr = self.addr
+        return pipe
+
+
+class ConnectionManager:
+    '''
+    One connection pool per host:port, shared by every Node that points at
+    the same endpoint. Pooled connections keep their AUTH and are held open
+    with TCP keepalive, so repeated operations in one process don't
+    reconnect.
+    '''
+    def __init__(self, password=None, socket_timeout=SOCKET_TIMEOUT,
+                 socket_connect_timeout=SOCKET_CONNECT_TIMEOUT,
+                 health_check_interval=HEALTH_CHECK_INTERVAL,
+                 max_connections=None):
+        self._password = password
+        self._socket_timeout = socket_timeout
+        self._socket_connect_timeout = socket_connect_timeout
+        self._health_check_interval = health_check_interval
+        self._max_connections = max_connections
+        self._clients = {}
+        self._verified = set()
+        self._lock = threading.Lock()
+
+    def get(self, host, port, password=None, blocking=False, binary=False):
+        '''
+        Shared client for host:port. `blocking` clients have no read timeout,
+        for commands bounded by their own server-side timeout like MIGRATE.
+        `binary` clients leave replies as bytes.
+        '''
+        key = (host, port, blocking, binary)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                pool = redis.ConnectionPool(
+                    host=host, port=port,
+                    password=password if password is not None else self._password,
+                    socket_timeout=None if blocking else self._socket_timeout,
+                    socket_connect_timeout=self._socket_connect_timeout,
+                    socket_keepalive=True,
+                    socket_keepalive_options=_keepalive_options(),
+                    health_check_interval=self._health_check_interval,
+                    max_connections=self._max_connections,
+                    decode_responses=not binary)
+                client = ProfiledRedis(connection_pool=pool)
+                self._clients[key] = client
+        return client
+
+    def connect(self, host, port, password=None):
+        '''
+        Shared client for host:port, checked with PING the first time only.
+        '''
+        client = self.get(host, port, password)
+        if (host, port) not in self._verified:
+            client.ping()
+            self._verified.add((host, port))
+        return client
+
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.connection_pool.disconnect()
+            self._clients.clear()
+            self._verified.clear()
+
+    def __len__(self):
+        return len(self._clients)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncConnectionManager:
+    '''
+    ConnectionManager for redis.asyncio clients, shared by every AsyncNode
+    that points at the same endpoint within one event loop.
+    '''
+    def __init__(self, password=None, socket_timeout=SOCKET_TIMEOUT,
+                 socket_connect_timeout=SOCKET_CONNECT_TIMEOUT,
+                 health_check_interval=HEALTH_CHECK_INTERVAL,
+                 max_connections=None):
+        self._password = password
+        self._socket_timeout = socket_timeout
+        self._socket_connect_timeout = socket_connect_timeout
+        self._health_check_interval = health_check_interval
+        self._max_connections = max_connections
+        self._clients = {}
+        self._verified = set()
+
+    def get(self, host, port, password=None, blocking=False):
+        '''
+        Shared client for host:port; `blocking` clients have no read timeout.
+        '''
+        key = (host, port, blocking)
+        client = self._clients.get(key)
+        if client is None:
+            pool = redis.asyncio.ConnectionPool(
+                host=host, port=port,
+                password=password if password is not None else self._password,
+                socket_timeout=None if blocking else self._socket_timeout,
+                socket_connect_timeout=self._socket_connect_timeout,
+                socket_keepalive=True,
+                socket_keepalive_options=_keepalive_options(),
+                health_check_interval=self._health_check_interval,
+                max_connections=self._max_connections,
+                decode_responses=True)
+            client = ProfiledAsyncRedis(connection_pool=pool)
+            self._clients[key] = client
+        return client
+
+    async def connect(self, host, port, password=None):
+        '''
+        Shared client for host:port, checked with PING the first time only.
+        '''
+        client = self.get(host, port, password)
+        if (host, port) not in self._verified:
+            await client.ping()
+            self._verified.add((host, port))
+        return client
+
+    async def close(self):
+        clients, self._clients = self._clients, {}
+        self._verified.clear()
+        for client in clients.values():
+            await client.connection_pool.disconnect()
+
+    def __len__(self):
+        return len(self._clients)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class NodeRegistry:
+    '''
+    One NodeRecord per node of a cluster, handed out to every Node whose
+    view agrees on that node's address, flags, master and slots. N views
+    of a converged N-node cluster then hold N records between them instead
+    of N*N; a view that disagrees keeps its own record.
+    '''
+    def __init__(self):
+        self._records = {}
+
+    def share(self, record):
+        known = self._records.setdefault(record.node_id, record)
+        if known is record or (known.port == record.port and known.flags == record.flags
+                               and known.host == record.host
+                               and known.master_id == record.master_id
+                               and known.slots == record.slots
+                               and known.migrating == record.migrating
+                               and known.importing == record.importing):
+            return known
+        return record
+
+    def __len__(self):
+        return len(self._records)
+
+
+class NodeException(Exception): pass
+class BaseNode:
+    '''
+    What is known about a node from its CLUSTER NODES view: parsing and
+    properties only. Node and AsyncNode each add their own commands, so
+    a sync command can't be called on an asyncio client or the reverse.
+    '''
+    __slots__ = ('_origin_addr', '_password', '_manager', '_registry', '_friends',
+                 '_host', '_port', '_r', '_blocking_r', '_binary_r', '_config_digest',
+                 '_node_id', '_announced_host', '_announced_port', '_flags', '_slots',
+                 '_migrating', '_importing', '_replicate', '_cluster_state', '__weakref__')
+
+    def __init__(self, addr, password=None, manager=None, registry=None):
+        self._origin_addr = addr
+        self._password = password
+        self._manager = manager
+        self._registry = registry
+        self._friends = ()
+        self._host, self._port = ParseHelper.parse_addr(addr)
+        self._r = None
+        self._blocking_r = None
+        self._binary_r = None
+        self._config_digest = None
+        self._node_id = None
+        self._announced_host = None
+        self._announced_port = None
+        self._flags = 0
+        self._slots = None
+        self._migrating = None
+        self._importing = None
+        self._replicate = None
+        self._cluster_state = None
+
+    def _load_raw(self, text, with_friends=False):
+        self._config_digest = ParseHelper.config_digest(ParseHelper.raw_config_entries(text))
+        self._load_records(ParseHelper.parse_cluster_nodes(text, myself_only=not with_friends),
+                           with_friends)
+
+    def _load_parsed(self, nodes, with_friends=False):
+        self._config_digest = ParseHelper.config_digest(ParseHelper.parsed_config_entries(nodes))
+        records = []
+        for addr, info in nodes.items():
+            flags = ParseHelper.parse_flag_bits(info['flags'])
+            if not with_friends and not flags & NODE_FLAG_MYSELF:
+                continue
+            host, port = ParseHelper.parse_addr(addr)
+            slots, migrating, importing = ParseHelper.parse_slots(info['slots'])
+            if info.get('migrations'):
+                migrating, importing = ParseHelper.parse_migrations(info['migrations'])
+            master_id = info['master_id']
+            records.append(NodeRecord(
+                sys.intern(info['node_id']), host, port, flags,
+                sys.intern(master_id) if master_id != '-' else None,
+                int(info.get('epoch') or 0), info.get('connected', True),
+                slots, migrating, importing))
+        self._load_records(records, with_friends)
+
+    def _load_records(self, records, with_friends=False):
+        friends = []
+        share = self._registry.share if self._registry is not None else None
+        for record in records:
+            if record.flags & NODE_FLAG_MYSELF:
+                self._node_id = record.node_id
+                self._announced_host = record.host
+                self._announced_port = record.port
+                self._flags = record.flags
+                self._slots = record.slots or None
+                self._migrating = record.migrating or None
+                self._importing = record.importing or None
+                self._replicate = record.master_id
+            elif with_friends:
+                friends.append(share(record) if share else record)
+        self._friends = tuple(friends)
+
+    def __str__(self):
+        return f"{self._host}:{self._port}" 
+
+    @property
+    def host(self):
+        return self._announced_host
+
+    @property
+    def port(self):
+        return self._announced_port
+
+    @property
+    def origin(self):
+        '''
+        (host, port) this node was reached at. Unlike `host`, it is known
+        before the node joins a cluster: until then the node reports an
+        empty IP for itself.
+        '''
+        return self._host, self._port
+
+    @property
+    def node_id(self):
+        return self._node_id
+
+    @property
+    def migrating(self):
+        return self._migrating or {}
+
+    @property
+    def importing(self):
+        return self._importing or {}
+
+    @property
+    def friends(self):
+        '''
+        NodeRecords of the other nodes in this node's view.
+        '''
+        return self._friends
+
+    @property
+    def slots(self):
+        return self._slots or SlotSet()
+
+    @property
+    def flags(self):
+        return _flag_names(self._flags)
+
+    @property
+    def flag_bits(self):
+        return self._flags
+
+    @property
+    def replicate(self):
+        return self._replicate
+
+    @property
+    def cluster_state(self):
+        '''
+        (cluster_current_epoch, cluster_my_epoch, cluster_known_nodes) as of
+        the last load_info with `epochs`, or None.
+        '''
+        return self._cluster_state
+
+    def is_master(self):
+        return self._flags & NODE_FLAG_MASTER != 0
+
+    def is_slave(self):
+        return self._flags & NODE_FLAG_SLAVE != 0
+   
+    @property
+    def config_digest(self):
+        return self._config_digest
+
+
+class Node(BaseNode):
+    __slots__ = ()
+
+    def connect(self):
+        if self._r:
+            return
+        xprint.verbose(f"Connecting to node {self}: ", end="")
+        try:
+            if self._manager is not None:
+                self._r = self._manager.connect(self._host, self._port, self._password)
+            else:
+                self._r = ProfiledRedis(self._host, self._port,
+                                        password=self._password,
+                                        socket_timeout=SOCKET_TIMEOUT,
+                                        decode_responses=True)
+                self._r.ping()
+        except redis.exceptions.RedisError as e:
+            xprint.verbose("FAIL", ignore_header=True)
+            self._r = None
+            raise NodeException(f"Sorry, can't connect to node '{self}'. Reason: {e}")
+        xprint.verbose("OK", ignore_header=True)
+
+    def _cluster_nodes(self):
+        return self._r.cluster('NODES')
+
+    def _cluster_nodes_raw(self):
+        # No response callback is registered for plain 'CLUSTER', so the
+        # reply comes back as the unparsed text.
+        return self._r.execute_command('CLUSTER', 'NODES')
+
+    def load_info(self, with_friends=False, raw=False, epochs=False):
+        '''
+        With `epochs`, CLUSTER INFO comes along in the same round trip and
+        its epochs are kept as `cluster_state`.
+        '''
+        if epochs:
+            pipe = self._r.pipeline(transaction=False)
+            pipe.cluster('INFO')
+            pipe.execute_command('CLUSTER', 'NODES')
+            info, text = pipe.execute()
+            self._cluster_state = _cluster_state(info)
+            return self._load_raw(text, with_friends)
+        if raw:
+            return self._load_raw(self._cluster_nodes_raw(), with_friends)
+        return self._load_parsed(self._cluster_nodes(), with_friends)
+
+    def fetch_cluster_state(self):
+        return _cluster_state(self._r.cluster('INFO'))
+
+    def release(self):
+        '''
+        Close this node's open connections. Its clients stay usable and
+        reconnect on their next command.
+        '''
+        for client in (self._r, self._blocking_r, self._binary_r):
+            if client is not None:
+                client.connection_pool.disconnect()
+
+    def config_view(self):
+        '''
+        Fetch this node's current {node_id: SlotSet} view of slot ownership.
+        '''
+        return ParseHelper.parse_config_view(self._cluster_nodes_raw())
+
+    def config_signature(self):
+        view = self.config_view()
+        return '|'.join(sorted(f"{node_id}:{slots.summarize()}"
+                               for node_id, slots in view.items()))
+
+    def cluster_count_keys_in_slot(self, slot):
+        return self._r.cluster('COUNTKEYSINSLOT', slot)
+
+    def cluster_count_keys_in_slots(self, slots, pipeline=CENSUS_PIPELINE):
+        '''
+        CLUSTER COUNTKEYSINSLOT for many slots, `pipeline` commands per round trip.
+        '''
+        slots = list(slots)
+        counts = []
+        for i in range(0, len(slots), pipeline):
+            pipe = self._r.pipeline(transaction=False)
+            for slot in slots[i:i + pipeline]:
+                pipe.cluster('COUNTKEYSINSLOT', slot)
+            counts += pipe.execute()
+        return counts
+
+    def clear_slot(self, slot):
+        self.cluster_setslot_stable(slot)
+
+    def set_slot_owner(self, slot):
+        '''
+        Make this node the only owner of the slot and bump its epoch so the
+        claim wins over stale ones, as one MULTI/EXEC.
+        '''
+        pipe = self._r.pipeline(transaction=True)
+        pipe.cluster('DELSLOTS', slot)
+        pipe.cluster('ADDSLOTS', slot)
+        pipe.cluster('BUMPEPOCH')
+        # DELSLOTS fails when this node didn't have the slot; that's fine.
+        pipe.execute(raise_on_error=False)
+
+    def cluster_bumpepoch(self):
+        return self._r.cluster('BUMPEPOCH')
+
+    def ping_latency(self):
+        started = time.monotonic()
+        self._r.ping()
+        return time.monotonic() - started
+
+    def latency_latest(self, since=None):
+        '''
+        Highest LATENCY LATEST spike in seconds, only counting events newer
+        than `since` (unix time) when given.
+        '''
+        worst = 0.0
+        for event in self._r.execute_command('LATENCY', 'LATEST') or []:
+            _, timestamp, latest_ms = event[:3]
+            if since is None or int(timestamp) >= since:
+                worst = max(worst, int(latest_ms) / 1000)
+        return worst
+
+    def instantaneous_ops_per_sec(self):
+        return self._r.info('stats').get('instantaneous_ops_per_sec', 0)
+
+    def cluster_setslot_stable(self, slot):
+        self._r.cluster('SETSLOT', slot, 'STABLE')
+
+    def cluster_setslot_node(self, slot, owner):
+        self._r.cluster('SETSLOT', slot, 'NODE', owner.node_id)
+
+    def cluster_setslot_migrating(self, slot, target):
+        self._r.cluster('SETSLOT', slot, 'MIGRATING', target.node_id)
+ 
+    def cluster_setslot_importing(self, slot, source):
+        self._r.cluster('SETSLOT', slot, 'IMPORTING', source.node_id)
+
+    def cluster_addslots(self, *slots):
+        self._r.cluster('ADDSLOTS', *slots)
+
+    def cluster_delslots(self, *slots):
+        self._r.cluster('DELSLOTS', *slots)
+
+    def cluster_addslotsrange(self, *ranges):
+        '''
+        Assign (start, end) slot ranges, end inclusive, in one command.
+        Servers before 7.0 get the equivalent ADDSLOTS instead.
+        '''
+        try:
+            self._r.cluster('ADDSLOTSRANGE', *(n for r in ranges for n in r))
+        except redis.exceptions.ResponseError as e:
+            if 'unknown subcommand' not in str(e).lower():
+                raise
+            self.cluster_addslots(*SlotSet.from_ranges(ranges))
+
+    def cluster_meet(self, host, port):
+        self._r.cluster('MEET', host, port)
+
+    def cluster_replicate(self, master):
+        self._r.cluster('REPLICATE', master.node_id)
+
+    def cluster_set_config_epoch(self, epoch):
+        self._r.cluster('SET-CONFIG-EPOCH', epoch)
+
+    def cluster_info(self):
+        return self._r.cluster('INFO')
+
+    def dbsize(self):
+        return self._r.dbsize()
+
+    def call(self, commands, binary=False):
+        '''
+        Send every command in one pipeline. Failed commands come back as
+        their exception instead of aborting the others.
+        '''
+        client = self._binary_client() if binary else self._r
+        pipe = client.pipeline(transaction=False)
+        for args in commands:
+            pipe.execute_command(*args)
+        return pipe.execute(raise_on_error=False)
+
+    def fetch_config_digest(self):
+        '''
+        Digest of this node's current slot configuration, computed from the
+        raw CLUSTER NODES text without building the full node records.
+        '''
+        return ParseHelper.config_digest(
+            ParseHelper.raw_config_entries(self._cluster_nodes_raw()))
+
+    def cluster_get_keys_in_slot(self, slot, count):
+        return self._r.cluster('GETKEYSINSLOT', slot, count)
+
+    def _blocking_client(self):
+        # MIGRATE may run far longer than SOCKET_TIMEOUT; its own timeout
+        # argument bounds it on the server side.
+        with _client_lock:
+            # Fixes of different slots share nodes: a client created twice
+            # would disconnect its pool under the other thread when dropped.
+            if self._blocking_r is None:
+                if self._manager is not None:
+                    self._blocking_r = self._manager.get(self._host, self._port,
+                                                         self._password, blocking=True)
+                else:
+                    self._blocking_r = ProfiledRedis(
+                        self._host, self._port, password=self._password,
+                        socket_timeout=None,
+                        socket_connect_timeout=SOCKET_CONNECT_TIMEOUT,
+                        socket_keepalive=True, decode_responses=True)
+            return self._blocking_r
+
+    def _binary_client(self):
+        # Keys and DUMP payloads are arbitrary bytes.
+        with _client_lock:
+            if self._binary_r is None:
+                if self._manager is not None:
+                    self._binary_r = self._manager.get(self._host, self._port,
+                                                       self._password, binary=True)
+                else:
+                    self._binary_r = ProfiledRedis(
+                        self._host, self._port, password=self._password,
+                        socket_timeout=SOCKET_TIMEOUT,
+                        socket_connect_timeout=SOCKET_CONNECT_TIMEOUT)
+            return self._binary_r
+
+    def memory_usage(self, keys):
+        '''
+        Approximate size in bytes of each key, with pipelined MEMORY USAGE,
+        or DEBUG OBJECT serializedlength on servers without it. None when
+        neither command is available.
+        '''
+        try:
+            pipe = self._r.pipeline(transaction=False)
+            for key in keys:
+                pipe.memory_usage(key)
+            return pipe.execute()
+        except redis.exceptions.ResponseError:
+            pass
+        pipe = self._r.pipeline(transaction=False)
+        for key in keys:
+            pipe.debug_object(key)
+        infos = pipe.execute(raise_on_error=False)
+        if all(isinstance(info, Exception) for info in infos):
+            return None
+        return [0 if isinstance(info, Exception) else info.get('serializedlength', 0)
+                for info in infos]
+
+    def migrate(self, dst, keys_in_slot, password, timeout=MIGRATE_TIMEOUT, replace=False): 
+        # migrate(self, host, port, keys, destination_db, timeout, copy=False, replace=False, auth=None)
+        self._blocking_client().migrate(dst.host, dst.port, keys_in_slot, 0, timeout,
+                                        auth=password, replace=replace)
+
+    def migrate_and_get_keys_in_slot(self, dst, keys_in_slot, slot, count,
+                                     password, timeout=MIGRATE_TIMEOUT, replace=False):
+        '''
+        MIGRATE the given keys and fetch the next keys of the slot in the
+        same round trip. GETKEYSINSLOT runs after MIGRATE on the server,
+        so it never returns the keys that were just moved.
+        '''
+        pipe = self._blocking_client().pipeline(transaction=False)
+        pipe.migrate(dst.host, dst.port, keys_in_slot, 0, timeout,
+                     auth=password, replace=replace)
+        pipe.cluster('GETKEYSINSLOT', slot, count)
+        _, next_keys = pipe.execute()
+        return next_keys
+   
+
+
+class Nodes:
+    '''
+    The nodes of one cluster, sharing a NodeRegistry for their friends.
+    Lookups by node id, role and slot owner go through indexes built on
+    first use and rebuilt after `add` or `reindex`.
+    '''
+    def __init__(self, nodes, password=None, manager=None, registry=None):
+        self._nodes = nodes
+        self._password = password
+        self._manager = manager
+        self._registry = registry if registry is not None else NodeRegistry()
+        self._unreachable = {}
+        self._raw = False
+        self._epochs = False
+        self._release = False
+        self._by_id = None
+        self._masters = None
+        self._replicas = None
+        self._replicas_of = None
+        self._owners = None
+
+    @classmethod
+    def discover(cls, seed_addrs, password=None, concurrency=DISCOVERY_CONCURRENCY,
+                 raw=False, manager=None, epochs=False, executor=None, release=False):
+        '''
+        Load the whole cluster starting from the first reachable seed.
+        Friends are connected and loaded concurrently, so a dead node costs
+        one socket timeout in its own worker instead of stalling the others.
+        Nodes, seeds included, are loaded on `executor` when given, e.g. one
+        shared by several discoveries, or friends on `concurrency` threads of
+        their own. With `release`, each node's connections are closed once
+        it is loaded, so no more are open than loads are running.
+        '''
+        if isinstance(seed_addrs, str):
+            seed_addrs = [seed_addrs]
+
+        nodes = cls([], password=password, manager=manager)
+        nodes._raw = raw
+        nodes._epochs = epochs
+        nodes._release = release
+        seed = None
+        for addr in seed_addrs:
+            try:
+                if executor is not None:
+                    seed = executor.submit(nodes._load_friend, addr).result()
+                else:
+                    seed = nodes._load_friend(addr)
+            except NodeException as e:
+                xprint.warning(str(e))
+                continue
+            break
+
+        if seed is None:
+            raise NodeException(f"Sorry, can't connect to any of the seed nodes "
+                                f"({','.join(seed_addrs)}).")
+
+        nodes.add(seed)
+        seen = {str(seed), f"{seed.host}:{seed.port}"}
+        nodes._load_friends(nodes._friend_addrs(seed, seen), seen, concurrency, executor)
+        return nodes
+
+    def _load_friends(self, pending, seen, concurrency=DISCOVERY_CONCURRENCY,
+                      executor=None):
+        if executor is None:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                return self._load_friends(pending, seen, executor=executor)
+        futures = {executor.submit(self._load_friend, addr): addr
+                   for addr in pending}
+        while futures:
+            for future in as_completed(list(futures)):
+                addr = futures.pop(future)
+                try:
+                    node = future.result()
+                except NodeException as e:
+                    xprint.warning(str(e))
+                    self._unreachable[addr] = str(e)
+                    continue
+                self.add(node)
+                # Views may differ while the cluster is converging.
+                for friend in self._friend_addrs(node, seen):
+                    futures[executor.submit(self._load_friend, friend)] = friend
+
+    @staticmethod
+    def _friend_addrs(node, seen):
+        addrs = []
+        skip = ParseHelper.parse_flag_bits(','.join(SKIP_FRIEND_FLAGS))
+        for friend in node.friends:
+            if friend.flags & skip:
+                continue
+            addr = friend.addr
+            if addr not in seen:
+                seen.add(addr)
+                addrs.append(addr)
+        return addrs
+
+    def _load_friend(self, addr):
+        node = Node(addr, password=self._password, manager=self._manager,
+                    registry=self._registry)
+        node.connect()
+        try:
+            node.load_info(with_friends=True, raw=self._raw, epochs=self._epochs)
+        except redis.exceptions.RedisError as e:
+            raise NodeException(f"Sorry, can't load node '{node}'. Reason: {e}")
+        finally:
+            if self._release:
+                node.release()
+        return node
+
+    @property
+    def unreachable(self):
+        return self._unreachable
+
+    def __getitem__(self, key):
+        return self._nodes[key]
+
+    @property
+    def covered_slots(self):
+        covered_slots = SlotSet()
+        for n in self:
+            covered_slots |= n.slots
+        return covered_slots
+
+    @property
+    def open_slots(self):
+        total_open_slots = SlotSet()
+        for node in self:
+            for open_type in [MIGRATING, IMPORTING]:
+                slots = getattr(node, open_type) 
+                if slots:
+                    total_open_slots |= slots.keys()
+        return total_open_slots
+
+
+    def __iter__(self):
+        for node in self._nodes:
+            yield node
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __eq__(self, _nodes):
+        return self._nodes == _nodes
+
+    def add(self, node):
+        self._nodes.append(node)
+        self.reindex()
+
+    def reindex(self):
+        '''
+        Drop the indexes, e.g. after the nodes were reloaded.
+        '''
+        self._by_id = None
+
+    def _index(self):
+        if self._by_id is not None:
+            return
+        by_id, masters, replicas, replicas_of = {}, [], [], {}
+        owners = [None] * CLUSTER_HASH_SLOTS
+        for node in self._nodes:
+            by_id[node.node_id] = node
+            if node.is_master():
+                masters.append(node)
+                for start, end in node.slots.ranges():
+                    owners[start:end + 1] = [node] * (end - start + 1)
+            elif node.is_slave():
+                replicas.append(node)
+                replicas_of.setdefault(node.replicate, []).append(node)
+        self._masters, self._replicas = tuple(masters), tuple(replicas)
+        self._replicas_of, self._owners = replicas_of, owners
+        self._by_id = by_id
+
+    @property
+    def masters(self):
+        self._index()
+        return self._masters
+
+    @property
+    def replicas(self):
+        self._index()
+        return self._replicas
+
+    def replicas_of(self, master):
+        self._index()
+        return tuple(self._replicas_of.get(master.node_id, ()))
+
+    def owner(self, slot):
+        '''
+        Master serving `slot`, or None when no master claims it.
+        '''
+        self._index()
+        return self._owners[slot]
+
+    def get_by_node_id(self, node_id):
+        self._index()
+        return self._by_id.get(node_id)
+
+
+class AsyncNode(BaseNode):
+    '''
+    Node on redis.asyncio: the same parsing and properties, with every
+    command a coroutine, so one event loop can drive hundreds of nodes.
+    `manager` is an AsyncConnectionManager.
+    '''
+    __slots__ = ()
+
+    async def connect(self):
+        if self._r:
+            return
+        xprint.verbose(f"Connecting to node {self}")
+        try:
+            if self._manager is not None:
+                self._r = await self._manager.connect(self._host, self._port,
+                                                      self._password)
+            else:
+                self._r = ProfiledAsyncRedis(host=self._host, port=self._port,
+                                             password=self._password,
+                                             socket_timeout=SOCKET_TIMEOUT,
+                                             socket_connect_timeout=SOCKET_CONNECT_TIMEOUT,
+                                             decode_responses=True)
+                await self._r.ping()
+        except (redis.exceptions.RedisError, asyncio.TimeoutError) as e:
+            await self.close()
+            raise NodeException(f"Sorry, can't connect to node '{self}'. Reason: {e}")
+
+    def _blocking_client(self):
+        # MIGRATE may run far longer than SOCKET_TIMEOUT; it is bounded by
+        # its own server-side timeout instead.
+        if self._blocking_r is None:
+            if self._manager is not None:
+                self._blocking_r = self._manager.get(self._host, self._port,
+                                                     self._password, blocking=True)
+            else:
+                self._blocking_r = ProfiledAsyncRedis(
+                    host=self._host, port=self._port, password=self._password,
+                    socket_timeout=None,
+                    socket_connect_timeout=SOCKET_CONNECT_TIMEOUT,
+                    decode_responses=True)
+        return self._blocking_r
+
+    async def close(self):
+        clients = (self._r, self._blocking_r)
+        self._r = self._blocking_r = None
+        if self._manager is not None:
+            # Shared clients are closed with their manager.
+            return
+        for client in clients:
+            if client is not None:
+                await client.aclose()
+
+    async def _cluster_nodes(self):
+        return await self._r.cluster('NODES')
+
+    async def _cluster_nodes_raw(self):
+        return await self._r.execute_command('CLUSTER', 'NODES')
+
+    async def load_info(self, with_friends=False, raw=False):
+        if raw:
+            return self._load_raw(await self._cluster_nodes_raw(), with_friends)
+        return self._load_parsed(await self._cluster_nodes(), with_friends)
+
+    async def config_view(self):
+        return ParseHelper.parse_config_view(await self._cluster_nodes_raw())
+
+    async def cluster_count_keys_in_slot(self, slot):
+        return await self._r.cluster('COUNTKEYSINSLOT', slot)
+
+    async def cluster_setslot_stable(self, slot):
+        await self._r.cluster('SETSLOT', slot, 'STABLE')
+
+    async def cluster_setslot_node(self, slot, owner):
+        await self._r.cluster('SETSLOT', slot, 'NODE', owner.node_id)
+
+    async def cluster_setslot_migrating(self, slot, target):
+        await self._r.cluster('SETSLOT', slot, 'MIGRATING', target.node_id)
+
+    async def cluster_setslot_importing(self, slot, source):
+        await self._r.cluster('SETSLOT', slot, 'IMPORTING', source.node_id)
+
+    async def cluster_get_keys_in_slot(self, slot, count):
+        return await self._r.cluster('GETKEYSINSLOT', slot, count)
+
+    async def migrate(self, dst, keys_in_slot, password, timeout=MIGRATE_TIMEOUT, replace=False):
+        await self._blocking_client().migrate(dst.host, dst.port, keys_in_slot, 0, timeout,
+                                              auth=password, replace=replace)
+
+    async def migrate_and_get_keys_in_slot(self, dst, keys_in_slot, slot, count,
+                                           password, timeout=MIGRATE_TIMEOUT, replace=False):
+        pipe = self._blocking_client().pipeline(transaction=False)
+        pipe.migrate(dst.host, dst.port, keys_in_slot, 0, timeout,
+                     auth=password, replace=replace)
+        pipe.cluster('GETKEYSINSLOT', slot, count)
+        _, next_keys = await pipe.execute()
+        return next_keys
+
+
+class AsyncNodes(Nodes):
+    @classmethod
+    async def discover(cls, seed_addrs, password=None,
+                       concurrency=DISCOVERY_CONCURRENCY, raw=False, manager=None):
+        '''
+        Nodes.discover on one event loop. `manager` is an
+        AsyncConnectionManager shared by the nodes.
+        '''
+        if isinstance(seed_addrs, str):
+            seed_addrs = [seed_addrs]
+
+        registry = NodeRegistry()
+        seed = None
+        for addr in seed_addrs:
+            node = AsyncNode(addr, password=password, manager=manager, registry=registry)
+            try:
+                await node.connect()
+                try:
+                    await node.load_info(with_friends=True, raw=raw)
+                except redis.exceptions.RedisError as e:
+                    await node.close()
+                    raise NodeException(f"Sorry, can't load node '{node}'. Reason: {e}")
+            except NodeException as e:
+                xprint.warning(str(e))
+                continue
+            seed = node
+            break
+
+        if seed is None:
+            raise NodeException(f"Sorry, can't connect to any of the seed nodes "
+                                f"({','.join(seed_addrs)}).")
+
+        nodes = cls([seed], password=password, manager=manager, registry=registry)
+        nodes._raw = raw
+        seen = {str(seed), f"{seed.host}:{seed.port}"}
+        await nodes._load_friends(nodes._friend_addrs(seed, seen), seen, concurrency)
+        return nodes
+
+    async def _load_friends(self, pending, seen, concurrency=DISCOVERY_CONCURRENCY):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def load(addr):
+            async with semaphore:
+                return await self._load_friend(addr)
+
+        tasks = {asyncio.ensure_future(load(addr)): addr for addr in pending}
+        while tasks:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                addr = tasks.pop(task)
+                try:
+                    node = task.result()
+                except NodeException as e:
+                    xprint.warning(str(e))
+                    self._unreachable[addr] = str(e)
+                    continue
+                self.add(node)
+                for friend in self._friend_addrs(node, seen):
+                    tasks[asyncio.ensure_future(load(friend))] = friend
+
+    async def _load_friend(self, addr):
+        node = AsyncNode(addr, password=self._password, manager=self._manager,
+                         registry=self._registry)
+        await node.connect()
+        try:
+            await node.load_info(with_friends=True, raw=self._raw)
+        except redis.exceptions.RedisError as e:
+            await node.close()
+            raise NodeException(f"Sorry, can't load node '{node}'. Reason: {e}")
+        return node
+
+    async def close(self):
+        await asyncio.gather(*(n.close() for n in self))
+
+
+SNAPSHOT_VERSION = 1
+# Open slots don't move any epoch, so every node is reloaded at least
+# this often (seconds) even when its epochs say nothing changed.
+SNAPSHOT_MAX_AGE = 300
+
+
+class SnapshotNode(Node):
+    '''
+    A Node restored from a snapshot. Until it connects, config_view()
+    answers from the view saved with it, when there is one.
+    '''
+    __slots__ = ('_view', '_fetched')
+
+    def __init__(self, addr, password=None, manager=None, registry=None):
+        super().__init__(addr, password, manager, registry)
+        self._view = None
+        self._fetched = None
+
+    @property
+    def fetched(self):
+        return self._fetched
+
+    def config_view(self):
+        if self._r is None and self._view is not None:
+            return self._view
+        return super().config_view()
+
+
+class SnapshotException(Exception): pass
+class ClusterSnapshot:
+    '''
+    The nodes of a cluster saved as gzipped JSON, slots as ranges.
+    `discover` starts from it with one CLUSTER INFO per node and reloads
+    only the nodes whose epochs or open slots say they changed; `nodes`
+    alone serves offline checks and plans without touching the cluster.
+    '''
+    def __init__(self, nodes, taken):
+        self._nodes = nodes
+        self._taken = taken
+
+    @property
+    def nodes(self):
+        return self._nodes
+
+    @property
+    def taken(self):
+        return self._taken
+
+    @staticmethod
+    def _ranges(slots):
+        return [list(r) for r in slots.ranges()]
+
+    @classmethod
+    def _entry(cls, node, fetched, view=None):
+        entry = {'addr': str(node), 'id': node.node_id, 'host': node.host,
+                 'port': node.port, 'flags': node.flag_bits, 'master': node.replicate,
+                 'slots': cls._ranges(node.slots), 'migrating': node.migrating,
+                 'importing': node.importing, 'digest': node.config_digest,
+                 'state': node.cluster_state, 'fetched': fetched}
+        if view is not None:
+            entry['view'] = {node_id: cls._ranges(slots) for node_id, slots in view.items()}
+        return entry
+
+    @classmethod
+    def save(cls, nodes, path):
+        '''
+        Write `nodes` to `path`, replacing it atomically. While the views
+        disagree, the view of every node outside the largest group and of
+        one node inside it is saved too, for an offline config diff.
+        '''
+        now = time.time()
+        groups = {}
+        for n in nodes:
+            groups.setdefault(n.config_digest, []).append(n)
+        views = {}
+        if len(groups) > 1:
+            groups = sorted(groups.values(), key=len, reverse=True)
+            for n in [groups[0][0]] + [n for group in groups[1:] for n in group]:
+                views[n] = n.config_view()
+        snapshot = {'version': SNAPSHOT_VERSION, 'taken': now,
+                    'unreachable': nodes.unreachable,
+                    'nodes': [cls._entry(n, getattr(n, 'fetched', None) or now, views.get(n))
+                              for n in nodes]}
+        tmp = f"{path}.tmp"
+        with gzip.open(tmp, 'wt') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(tmp, path)
+
+    @classmethod
+    def read(cls, path, password=None, manager=None):
+        try:
+            with gzip.open(path, 'rt') as f:
+                snapshot = json.load(f)
+        except (OSError, EOFError, ValueError) as e:
+            raise SnapshotException(f"Can't read snapshot '{path}'. Reason: {e}")
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            raise SnapshotException(f"Snapshot '{path}' has version "
+                                    f"{snapshot.get('version')}, expected {SNAPSHOT_VERSION}")
+
+        registry = NodeRegistry()
+        loaded = []
+        for entry in snapshot['nodes']:
+            node = SnapshotNode(entry['addr'], password, manager, registry)
+            master = entry['master']
+            node._load_records([NodeRecord(
+                sys.intern(entry['id']), entry['host'], entry['port'], entry['flags'],
+                sys.intern(master) if master else None, 0, True,
+                SlotSet.from_ranges(entry['slots']),
+                {int(slot): node_id for slot, node_id in entry['migrating'].items()},
+                {int(slot): node_id for slot, node_id in entry['importing'].items()})])
+            node._config_digest = entry['digest']
+            node._cluster_state = tuple(entry['state']) if entry['state'] else None
+            node._fetched = entry['fetched']
+            if 'view' in entry:
+                node._view = {node_id: SlotSet.from_ranges(ranges)
+                              for node_id, ranges in entry['view'].items()}
+            loaded.append(node)
+        nodes = Nodes(loaded, password, manager, registry)
+        nodes._unreachable = snapshot['unreachable']
+        nodes._raw = True
+        nodes._epochs = True
+        return cls(nodes, snapshot['taken'])
+
+    def _validate(self, node, now, max_age):
+        # True when the node has to be reloaded.
+        node.connect()
+        state = node.fetch_cluster_state()
+        if node.cluster_state is None or state[2] != node.cluster_state[2]:
+            raise SnapshotException(f"Node {node} knows {state[2]} nodes, "
+                                    f"the cluster changed")
+        return (state != node.cluster_state or bool(node.migrating or node.importing)
+                or now - node.fetched > max_age)
+
+    def _reachable(self, addr):
+        # A node that was unreachable when the snapshot was taken may be back.
+        node = Node(addr, self._nodes._password, self._nodes._manager)
+        try:
+            node.connect()
+            node.fetch_cluster_state()
+        except (NodeException, redis.exceptions.RedisError):
+            return False
+        return True
+
+    def _reload(self, node, now):
+        node.load_info(raw=True, epochs=True)
+        node._view = None
+        node._fetched = now
+
+    def refresh(self, concurrency=DISCOVERY_CONCURRENCY, max_age=SNAPSHOT_MAX_AGE):
+        '''
+        Bring the snapshot's nodes up to date, reloading only those that
+        changed. Raise SnapshotException when nodes joined or left, a node
+        can't be reached, or a node unreachable last time answers again,
+        which calls for a full discovery instead.
+        '''
+        now = time.time()
+        nodes = self._nodes
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                retries = {executor.submit(self._reachable, addr): addr
+                           for addr in nodes.unreachable}
+                futures = {executor.submit(self._validate, n, now, max_age): n
+                           for n in nodes}
+                stale = [futures[f] for f in as_completed(futures) if f.result()]
+                back = [retries[f] for f in as_completed(retries) if f.result()]
+                if back:
+                    raise SnapshotException(f"Node {', '.join(sorted(back))} is "
+                                            f"reachable again")
+                for future in as_completed([executor.submit(self._reload, n, now)
+                                            for n in stale]):
+                    future.result()
+        except (NodeException, redis.exceptions.RedisError) as e:
+            raise SnapshotException(str(e))
+        nodes.reindex()
+        xprint.verbose(f"Snapshot: reloaded {len(stale)} of {len(nodes)} nodes")
+        xprint.event('snapshot_refresh', nodes=len(nodes), reloaded=len(stale),
+                     age=round(now - self._taken, 3))
+        return nodes
+
+    @classmethod
+    def discover(cls, path, seed_addrs, password=None, manager=None,
+                 concurrency=DISCOVERY_CONCURRENCY, max_age=SNAPSHOT_MAX_AGE):
+        '''
+        Nodes.discover, starting from the snapshot at `path` when it is of
+        the same cluster, and saving the result back to it.
+        '''
+        if isinstance(seed_addrs, str):
+            seed_addrs = [seed_addrs]
+        nodes = None
+        try:
+            snapshot = cls.read(path, password, manager)
+            known = {str(n) for n in snapshot.nodes} | {f"{n.host}:{n.port}"
+                                                        for n in snapshot.nodes}
+            if not known.intersection(seed_addrs):
+                raise SnapshotException(f"Snapshot '{path}' is of another cluster")
+            nodes = snapshot.refresh(concurrency, max_age)
+        except SnapshotException as e:
+            xprint.verbose(f"Snapshot not used: {e}")
+        if nodes is None:
+            nodes = Nodes.discover(seed_addrs, password, concurrency, raw=True,
+                                   manager=manager, epochs=True)
+        cls.save(nodes, path)
+        return nodes
+
+
+WATCH_INTERVAL = 5.0
+# Flags that only say who answered, or that the node can't be asked.
+_WATCH_IGNORED_FLAGS = NODE_FLAG_MYSELF
+_WATCH_UNPOLLED_FLAGS = NODE_FLAG_FAIL | NODE_FLAG_NOADDR | NODE_FLAG_HANDSHAKE
+
+
+class TopologyWatch:
+    '''
+    Poll a cluster every `interval` seconds and report what changed since
+    the previous poll: nodes joining or leaving, flag and role changes,
+    slot ownership moves and slots opening or closing. Each poll reads the
+    full view of one observer node and the own line of every master,
+    which is the only place MIGRATING/IMPORTING states show up.
+    '''
+    _MESSAGES = {
+        'node_added': ('info', "Node {node} joined as {role} ({node_id})"),
+        'node_removed': ('warning', "Node {node} left the cluster ({node_id})"),
+        'node_moved': ('info', "Node {node_id} moved from {old} to {node}"),
+        'flags_changed': ('warning', "Node {node} flags {old} -> {new}"),
+        'role_changed': ('warning', "Node {node} is now {role}"),
+        'slots_moved': ('info', "Slots {slots} ({count}) moved from {src} to {dst}"),
+        'slots_assigned': ('info', "Slots {slots} ({count}) assigned to {dst}"),
+        'slots_unassigned': ('warning', "Slots {slots} ({count}) no longer served by {src}"),
+        'slot_opened': ('warning', "Slot {slot} is {state} on {node} (peer {peer})"),
+        'slot_closed': ('info', "Slot {slot} is no longer {state} on {node}"),
+        'node_unreachable': ('warning', "Node {node} is unreachable: {error}"),
+        'node_reachable': ('info', "Node {node} is reachable again"),
+    }
+
+    def __init__(self, seed_addrs, password=None, manager=None,
+                 interval=WATCH_INTERVAL, concurrency=DISCOVERY_CONCURRENCY):
+        if isinstance(seed_addrs, str):
+            seed_addrs = [seed_addrs]
+        self._seeds = list(seed_addrs)
+        self._password = password
+        self._manager = manager
+        self._interval = interval
+        self._concurrency = concurrency
+        self._observer = None
+        self._nodes = {}
+        self._records = None
+        self._unreachable = {}
+
+    @property
+    def records(self):
+        '''
+        {node_id: NodeRecord} as of the last poll, open slots included.
+        '''
+        return self._records
+
+    def _node(self, addr):
+        node = self._nodes.get(addr)
+        if node is None:
+            node = self._nodes[addr] = Node(addr, self._password, self._manager)
+        return node
+
+    def _view(self):
+        candidates = [self._observer] if self._observer else []
+        candidates += self._seeds
+        if self._records:
+            candidates += [r.addr for r in self._records.values()
+                           if not r.flags & _WATCH_UNPOLLED_FLAGS]
+        for addr in dict.fromkeys(candidates):
+            node = self._node(addr)
+            try:
+                node.connect()
+                text = node._cluster_nodes_raw()
+            except (NodeException, redis.exceptions.RedisError):
+                self._nodes.pop(addr, None)
+                continue
+            # Stick to one observer: PFAIL is its own opinion.
+            self._observer = addr
+            return ParseHelper.parse_cluster_nodes(text)
+        raise NodeException(f"Sorry, can't reach any node of the cluster "
+                            f"({','.join(self._seeds)}).")
+
+    def _load_own(self, addr):
+        node = self._node(addr)
+        node.connect()
+        try:
+            node.load_info(raw=True)
+        except redis.exceptions.RedisError as e:
+            raise NodeException(f"Sorry, can't load node '{node}'. Reason: {e}")
+        return node
+
+    def poll(self):
+        '''
+        Fetch the current topology, returning the changes since the
+        previous poll as (event, fields). The first poll only sets the
+        baseline and returns no changes.
+        '''
+        records = {r.node_id: r for r in self._view()}
+        changes = []
+        masters = [r for r in records.values()
+                   if r.flags & NODE_FLAG_MASTER and not r.flags & _WATCH_UNPOLLED_FLAGS]
+        with ThreadPoolExecutor(max_workers=self._concurrency) as executor:
+            futures = {executor.submit(self._load_own, r.addr): r for r in masters}
+            for future in as_completed(futures):
+                record = futures[future]
+                try:
+                    node = future.result()
+                except NodeException as e:
+                    if record.addr not in self._unreachable:
+                        changes.append(('node_unreachable', {'node': record.addr,
+                                                             'error': str(e)}))
+                    self._unreachable[record.addr] = str(e)
+                    # Keep the last known open slots rather than report them closed.
+                    before = (self._records or {}).get(record.node_id)
+                    if before is not None:
+                        record.migrating, record.importing = before.migrating, before.importing
+                    continue
+                if self._unreachable.pop(record.addr, None) is not None:
+                    changes.append(('node_reachable', {'node': record.addr}))
+                record.migrating, record.importing = node.migrating, node.importing
+
+        if self._records is not None:
+            changes = self.diff(self._records, records) + changes
+        self._records = records
+        return changes
+
+    @staticmethod
+    def _role(record, records):
+        if record.master_id is None:
+            return 'master'
+        master = records.get(record.master_id)
+        return f"replica of {master.addr if master else record.master_id}"
+
+    @classmethod
+    def diff(cls, old, new):
+        '''
+        Changes from `old` to `new`, both {node_id: NodeRecord}, as a list
+        of (event, fields). Unchanged nodes cost a few comparisons each;
+        slots are only walked for nodes whose slots changed.
+        '''
+        changes = []
+        for node_id in new.keys() - old.keys():
+            record = new[node_id]
+            changes.append(('node_added', {'node': record.addr, 'node_id': node_id,
+                                           'role': cls._role(record, new)}))
+        for node_id in old.keys() - new.keys():
+            changes.append(('node_removed', {'node': old[node_id].addr, 'node_id': node_id}))
+
+        gained, lost = [], []
+        for node_id, record in new.items():
+            before = old.get(node_id)
+            if before is None:
+                if record.slots:
+                    gained.append((record, record.slots))
+                continue
+            addr = record.addr
+            if before.addr != addr:
+                changes.append(('node_moved', {'node': addr, 'node_id': node_id,
+                                               'old': before.addr}))
+            old_flags = before.flags & ~_WATCH_IGNORED_FLAGS
+            new_flags = record.flags & ~_WATCH_IGNORED_FLAGS
+            if old_flags != new_flags:
+                changes.append(('flags_changed', {'node': addr,
+                                                  'old': ','.join(_flag_names(old_flags)),
+                                                  'new': ','.join(_flag_names(new_flags))}))
+            if before.master_id != record.master_id:
+                changes.append(('role_changed', {'node': addr,
+                                                 'role': cls._role(record, new)}))
+            if before.slots != record.slots:
+                if record.slots - before.slots:
+                    gained.append((record, record.slots - before.slots))
+                if before.slots - record.slots:
+                    lost.append((before, before.slots - record.slots))
+            for state, was, now in ((MIGRATING, before.migrating, record.migrating),
+                                    (IMPORTING, before.importing, record.importing)):
+                if was == now:
+                    continue
+                for slot in sorted(now.keys() - was.keys()):
+                    peer = new.get(now[slot])
+                    changes.append(('slot_opened', {'node': addr, 'slot': slot,
+                                                    'state': state,
+                                                    'peer': peer.addr if peer else now[slot]}))
+                for slot in sorted(was.keys() - now.keys()):
+                    changes.append(('slot_closed', {'node': addr, 'slot': slot,
+                                                    'state': state}))
+        for node_id in old.keys() - new.keys():
+            if old[node_id].slots:
+                lost.append((old[node_id], old[node_id].slots))
+
+        for dst, slots in gained:
+            for src, given in lost:
+                moved = slots & given
+                if moved:
+                    changes.append(('slots_moved', {'src': src.addr, 'dst': dst.addr,
+                                                    'slots': moved.summarize(),
+                                                    'count': len(moved)}))
+                    slots = slots - moved
+            if slots:
+                changes.append(('slots_assigned', {'dst': dst.addr, 'count': len(slots),
+                                                   'slots': slots.summarize()}))
+        taken = SlotSet()
+        for dst, slots in gained:
+            taken |= slots
+        for src, given in lost:
+            unassigned = given - taken
+            if unassigned:
+                changes.append(('slots_unassigned', {'src': src.addr,
+                                                     'count': len(unassigned),
+                                                     'slots': unassigned.summarize()}))
+        return changes
+
+    @classmethod
+    def show(cls, event, fields):
+        level, message = cls._MESSAGES[event]
+        getattr(xprint, level)(lambda: message.format(**fields))
+        xprint.event(event, **fields)
+
+    def run(self, count=None):
+        '''
+        Poll until interrupted, or `count` times, showing every change.
+        '''
+        polls = 0
+        while count is None or polls < count:
+            started = time.monotonic()
+            try:
+                for event, fields in self.poll():
+                    self.show(event, fields)
+            except NodeException as e:
+                xprint.error(str(e))
+            if polls == 0 and self._records is not None:
+                masters = sum(1 for r in self._records.values() if r.flags & NODE_FLAG_MASTER)
+                xprint(f">>> Watching {len(self._records)} nodes ({masters} masters) "
+                       f"every {self._interval}s")
+            polls += 1
+            xprint.flush()
+            if count is None or polls < count:
+                time.sleep(max(0.0, self._interval - (time.monotonic() - started)))
+        return self
+
+
+class SlotCensus:
+    '''
+    Number of keys in every slot on every master, gathered with pipelined
+    CLUSTER COUNTKEYSINSLOT on all masters at once. Counts are kept per
+    master as slot-indexed arrays, so readers never need a round trip.
+    '''
+    _HEAT = ' .:-=+*#%@'
+
+    def __init__(self, counts):
+        self._counts = counts
+        self._total = array('Q', [0]) * CLUSTER_HASH_SLOTS
+        for node_counts in counts.values():
+            for slot, count in enumerate(node_counts):
+                if count:
+                    self._total[slot] += count
+
+    @classmethod
+    def take(cls, nodes, slots=None, concurrency=CENSUS_CONCURRENCY,
+             pipeline=CENSUS_PIPELINE):
+        slots = list(range(CLUSTER_HASH_SLOTS) if slots is None else slots)
+        masters = list(nodes.masters)
+        counts = {}
+
+        def count(node):
+            node_counts = array('Q', [0]) * CLUSTER_HASH_SLOTS
+            for slot, numkeys in zip(slots, node.cluster_count_keys_in_slots(slots, pipeline)):
+                node_counts[slot] = numkeys
+            return node_counts
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {executor.submit(count, n): n for n in masters}
+            for future in as_completed(futures):
+                counts[futures[future].node_id] = future.result()
+        return cls(counts)
+
+    def keys(self, slot, node=None):
+        if node is None:
+            return self._total[slot]
+        node_counts = self._counts.get(node.node_id)
+        return node_counts[slot] if node_counts is not None else 0
+
+    @property
+    def keys_in_slot(self):
+        return self._total
+
+    @property
+    def total_keys(self):
+        return sum(self._total)
+
+    def top(self, n=10):
+        return heapq.nlargest(n, ((slot, count) for slot, count in enumerate(self._total)
+                                  if count), key=lambda s: s[1])
+
+    def heatmap(self, buckets=64):
+        size = math.ceil(CLUSTER_HASH_SLOTS / buckets)
+        return [sum(self._total[i:i + size]) for i in range(0, CLUSTER_HASH_SLOTS, size)]
+
+    def show_top(self, n=10):
+        xprint(f">>> Top {n} slots by number of keys")
+        for slot, count in self.top(n):
+            xprint(f"   slot {slot}: {count} keys")
+
+    def show_heatmap(self, buckets=64, width=64):
+        heatmap = self.heatmap(buckets)
+        size = math.ceil(CLUSTER_HASH_SLOTS / buckets)
+        hottest = max(heatmap) or 1
+        shades = ''.join(self._HEAT[min(len(self._HEAT) - 1,
+                                        count * len(self._HEAT) // hottest)]
+                         for count in heatmap)
+        xprint(f">>> Keys per {size} slots (hottest {hottest} keys)")
+        for i in range(0, len(shades), width):
+            xprint(f"{i * size:>5} |{shades[i:i + width]}|")
+
+
+IMPORTING = 'importing'
+MIGRATING = 'migrating'
+
+
+_silent_xprint = XPrint(LOG_LEVEL_SILENT)
+
+
+class CheckCluster:
+
+    def __init__(self, nodes=None, silent=False):
+        self._nodes = nodes
+        self._num_errors = 0
+        self._config_consistent = None
+        self._open_slots = None
+        self._uncovered_slots = None
+        self._xprint = _silent_xprint if silent else xprint
+
+    @property
+    def num_errors(self):
+        return self._num_errors
+
+    @property
+    def config_consistent(self):
+        return self._config_consistent
+
+    @property
+    def open_slots(self):
+        return self._open_slots
+
+    @property
+    def uncovered_slots(self):
+        return self._uncovered_slots
+
+    def _increase_num_errors(self):
+        self._num_errors += 1
+
+    def check(self, quiet=False):
+        if not quiet:
+            self._show_nodes()
+        self._config_consistent = self._check_config_consistency()
+        self._open_slots = open_slots = self._check_open_slots()
+        self._uncovered_slots = uncovered_slots = self._check_slots_coverage()
+        self._xprint.event('check', nodes=len(self._nodes), errors=self._num_errors,
+                           open_slots=len(open_slots), uncovered_slots=len(uncovered_slots))
+
+    def _show_nodes(self):
+        for n in self._nodes:
+            role = 'M' if n.is_master() else 'S'
+            self._xprint(f"{role}: {n.node_id} {n}")
+            if n.is_master():
+                self._xprint(f"   slots:{n.slots.summarize()} ({len(n.slots)} slots) master")
+                replicas = len(self._nodes.replicas_of(n))
+                if replicas:
+                    self._xprint(f"   {replicas} additional replica(s)")
+            else:
+                self._xprint(f"   slots: ({len(n.slots)} slots) slave")
+                self._xprint(f"   replicates {n.replicate}")
+
+    def _check_config_consistency(self):
+        self._xprint(">>> Check config consistency...")
+        if not self.is_config_consistent():
+            self._increase_num_errors()
+            self._xprint.error("Nodes don't agree about configuration!")
+            if not self._xprint.enabled(LOG_LEVEL_ERROR):
+                # Nobody would read the diff: don't query the nodes for it.
+                return False
+            for node, diff in self.config_diff().items():
+                for node_id, (slots, expected) in diff.items():
+                    self._xprint.error(f"Node {node} sees {node_id} with slots "
+                                       f"'{slots.summarize()}', majority sees "
+                                       f"'{expected.summarize()}'")
+            return False
+        self._xprint.ok("All nodes agree about slots configuration.")
+        return True
+
+    def check_open_slots(self):
+        opened_slots = set()
+        for node in self._nodes:
+            for open_type in [MIGRATING, IMPORTING]:
+                slots = getattr(node, open_type) 
+                if slots:
+                    self._xprint.warning(
+                        lambda: self._warn_opened_slot(node, open_type, slots.keys()))
+                    opened_slots = opened_slots.union(set(slots.keys()))
+        return opened_slots
+
+    def _get_opened_slots(self):
+        for n in self._nodes:
+            yield n, n.migrating, n.importing
+
+    def _check_open_slots(self):
+        self._xprint(">>> Check for open slots...")
+        open_slots = set()
+        for n, migrating, importing in self._get_opened_slots():
+            for open_type, slots in ((MIGRATING, migrating), (IMPORTING, importing)):
+                if len(slots) > 0:
+                    self._increase_num_errors()
+                    self._xprint.warning(
+                        lambda: self._warn_opened_slot(n, open_type, slots.keys()))
+                    self._xprint.event('open_slots', node=n, state=open_type,
+                                       slots=lambda: sorted(slots))
+                    open_slots = open_slots.union(set(slots.keys()))
+
+        if len(open_slots) > 0:
+            self._xprint.warning(lambda: f"The following slots are open: "
+                                         f"{','.join(map(str, open_slots))}")
+
+        return open_slots
+
+    def check_slots_coverage(self):
+        return SlotSet.all() - self._nodes.covered_slots
+
+    def _check_slots_coverage(self):
+        self._xprint(">>> Check slots coverage...")
+        uncovered_slots = self.check_slots_coverage()
+        if not uncovered_slots:
+            self._xprint.ok(f"All {CLUSTER_HASH_SLOTS} slots covered.")
+        else:
+            self._increase_num_errors()
+            self._xprint.error(f"Not all {CLUSTER_HASH_SLOTS} slots are covered by nodes. "
+                               f"Uncovered slots: {uncovered_slots.summarize()}")
+
+        return uncovered_slots
+
+    def _warn_opened_slot(self, node, open_type, slots):
+        return f"Node {node} has slots in {open_type} "\
+               f"state {','.join(map(str, slots))}"
+
+    def _digest_groups(self):
+        groups = {}
+        for n in self._nodes:
+            groups.setdefault(n.config_digest, []).append(n)
+        return sorted(groups.values(), key=len, reverse=True)
+
+    def is_config_consistent(self):
+        return len(self._digest_groups()) == 1
+
+    def config_diff(self):
+        '''
+        For every node outside the largest digest group, the node ids whose
+        slots it sees differently: {node: {node_id: (its slots, majority slots)}}.
+        Only those nodes and one majority node are queried again.
+        '''
+        groups = self._digest_groups()
+        if len(groups) < 2:
+            return {}
+        expected = groups[0][0].config_view()
+        diffs = {}
+        for group in groups[1:]:
+            for n in group:
+                view = n.config_view()
+                diff = {}
+                for node_id in view.keys() | expected.keys():
+                    slots = view.get(node_id, SlotSet())
+                    expected_slots = expected.get(node_id, SlotSet())
+                    if slots != expected_slots:
+                        diff[node_id] = (slots, expected_slots)
+                diffs[n] = diff
+        return diffs
+
+# Connections open at once across all the clusters of a fleet check.
+FLEET_BUDGET = 64
+
+
+class FleetException(Exception): pass
+class FleetCheck:
+    '''
+    Discover and check many clusters at once. Clusters run concurrently
+    and every node load, seeds included, runs on one shared pool of
+    `budget` workers that close each node's connection once it is loaded,
+    so no more than `budget` connections are open at once. A big cluster
+    gets every worker the others leave idle, and checking a fleet takes
+    about as long as checking its slowest cluster.
+    '''
+    def __init__(self, clusters, budget=FLEET_BUDGET):
+        '''
+        `clusters` is a list of (name, seed addrs, password).
+        '''
+        self._clusters = clusters
+        self._budget = budget
+        self._results = []
+        self._elapsed = 0.0
+
+    @property
+    def results(self):
+        return self._results
+
+    @property
+    def elapsed(self):
+        return self._elapsed
+
+    @staticmethod
+    def read_inventory(lines):
+        '''
+        One cluster per line: <name> <seed>[,<seed>...] [<password>].
+        Blank lines and lines starting with '#' are skipped.
+        '''
+        clusters = []
+        names = set()
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = shlex.split(line)
+            if len(fields) not in (2, 3):
+                raise FleetException(f"Inventory line {number}: expected "
+                                     f"'<name> <seed>[,<seed>...] [<password>]'")
+            name, seeds = fields[0], fields[1].split(',')
+            for seed in seeds:
+                try:
+                    ParseHelper.parse_addr(seed)
+                except (ParseHelperError, ValueError):
+                    raise FleetException(f"Inventory line {number}: invalid seed "
+                                         f"'{seed}', expected <host>:<port>")
+            if name in names:
+                raise FleetException(f"Inventory line {number}: duplicate cluster '{name}'")
+            names.add(name)
+            clusters.append((name, seeds, fields[2] if len(fields) == 3 else None))
+        return clusters
+
+    def _check(self, name, seeds, password, executor):
+        result = {'cluster': name, 'seeds': seeds, 'error': None, 'nodes': 0,
+                  'masters': 0, 'unreachable': [], 'config_consistent': None,
+                  'open_slots': [], 'uncovered_slots': '', 'errors': 0}
+        started = time.monotonic()
+        try:
+            # A silent check works from the loaded views alone, so nothing
+            # reconnects once discovery is done.
+            with ConnectionManager(password) as manager:
+                nodes = Nodes.discover(seeds, password, raw=True, manager=manager,
+                                       executor=executor, release=True)
+            discovered = time.monotonic()
+            check = CheckCluster(nodes, silent=True)
+            check.check(quiet=True)
+        except Exception as e:
+            # Whatever goes wrong with one cluster is that cluster's failure.
+            result.update(error=str(e) or type(e).__name__, errors=1,
+                          elapsed=round(time.monotonic() - started, 3))
+            return result
+        result.update(nodes=len(nodes), masters=len(nodes.masters),
+                      unreachable=sorted(nodes.unreachable),
+                      config_consistent=check.config_consistent,
+                      open_slots=sorted(check.open_slots),
+                      uncovered_slots=check.uncovered_slots.summarize(),
+                      errors=check.num_errors + len(nodes.unreachable),
+                      discover=round(discovered - started, 3),
+                      check=round(time.monotonic() - discovered, 3),
+                      elapsed=round(time.monotonic() - started, 3))
+        return result
+
+    def run(self):
+        started = time.monotonic()
+        workers = max(1, min(len(self._clusters), self._budget))
+        # Cluster workers only wait on the loaders, never the other way
+        # round, so the two pools can't deadlock.
+        with ThreadPoolExecutor(max_workers=self._budget) as loaders, \
+                ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self._check, *cluster, loaders)
+                       for cluster in self._clusters]
+            for future in as_completed(futures):
+                result = future.result()
+                xprint.verbose(f"{result['cluster']}: checked in {result['elapsed']}s")
+                xprint.event('cluster_checked', **result)
+            self._results = [future.result() for future in futures]
+        self._elapsed = time.monotonic() - started
+        return self
+
+    @property
+    def num_errors(self):
+        return sum(1 for r in self._results if r['errors'])
+
+    def show_report(self):
+        xprint(f"{'cluster':<24} {'nodes':>6} {'masters':>7} {'errors':>6} {'time':>8}")
+        for r in self._results:
+            status = 'FAIL' if r['errors'] else 'OK'
+            xprint(f"{r['cluster']:<24} {r['nodes']:>6} {r['masters']:>7} "
+                   f"{r['errors']:>6} {r['elapsed']:>7.2f}s {status}")
+
+        for r in self._results:
+            name = r['cluster']
+            if r['error']:
+                xprint.error(f"{name}: {r['error']}")
+                continue
+            for addr in r['unreachable']:
+                xprint.warning(f"{name}: node {addr} is unreachable")
+            if r['config_consistent'] is False:
+                xprint.error(f"{name}: nodes don't agree about configuration")
+            if r['open_slots']:
+                xprint.warning(lambda: f"{name}: open slots "
+                                       f"{SlotSet(r['open_slots']).summarize()}")
+            if r['uncovered_slots']:
+                xprint.error(f"{name}: uncovered slots {r['uncovered_slots']}")
+
+        slowest = max(self._results, key=lambda r: r['elapsed'], default=None)
+        failed = self.num_errors
+        message = (f"Checked {len(self._results)} clusters in {self._elapsed:.2f}s"
+                   + (f" (slowest: {slowest['cluster']} {slowest['elapsed']:.2f}s)"
+                      if slowest else ""))
+        if failed:
+            xprint.fail(f"{message}, {failed} with problems.")
+        else:
+            xprint.ok(f"{message}, no problems.")
+
+
+FIX_CASE_MOVE = 'move'
+FIX_CASE_MOVE_TO_OWNER = 'move-to-owner'
+FIX_CASE_MOVE_TO_TARGET = 'move-to-target'
+FIX_CASE_CLOSE = 'close'
+FIX_CASE_UNHANDLED = 'unhandled'
+
+
+class FixException(Exception): pass
+class FixCluster:
+    '''
+    Repair every open slot at once: one pipelined key census over the
+    open slots on each master, then the independent per-slot repairs run
+    concurrently, at most `per_node` of them touching any node.
+    '''
+    def __init__(self, nodes, password=None, concurrency=RESHARD_CONCURRENCY,
+                 per_node=RESHARD_PER_SOURCE):
+        if per_node < 1:
+            raise ValueError('per_node must be at least 1')
+        self._nodes = nodes
+        self._password = password
+        self._concurrency = concurrency
+        self._per_node = per_node
+        self._failures = []
+        self._notifier = None
+
+    @property
+    def failures(self):
+        return self._failures
+
+    def classify(self):
+        open_slots = list(self._nodes.open_slots)
+        if not open_slots:
+            return []
+        xprint(f">>> Counting keys in {len(open_slots)} open slots...")
+        census = SlotCensus.take(self._nodes, slots=open_slots)
+        fixes = [FixOpenSlot(self._nodes, slot, census, self._password,
+                             notifier=self._notifier)
+                 for slot in open_slots]
+        for fix in fixes:
+            fix.classify()
+        return fixes
+
+    def _dispatch(self, executor, pending, running, busy):
+        for fix in list(pending):
+            if len(running) >= self._concurrency:
+                break
+            involved = fix.involved
+            if any(busy[n] >= self._per_node for n in involved):
+                continue
+            pending.remove(fix)
+            for n in involved:
+                busy[n] += 1
+            running[executor.submit(fix.fix)] = fix
+
+    def fix(self):
+        # Every moved slot is told to the other masters through one notifier,
+        # flushed after the last fix.
+        with SlotNotifier(self._nodes) as notifier:
+            self._notifier = notifier
+            return self._fix()
+
+    def _fix(self):
+        fixes = self.classify()
+        if not fixes:
+            xprint.ok("No open slots to fix.")
+            return self
+
+        cases = Counter(fix.case for fix in fixes)
+        xprint(f">>> Fixing {len(fixes)} open slots: " +
+               ', '.join(f"{count} {case}" for case, count in sorted(cases.items())))
+        for fix in fixes:
+            if fix.case == FIX_CASE_UNHANDLED:
+                self._failures.append((fix.slot, FixException(fix.describe())))
+                xprint.error(f"Sorry, can't fix slot {fix.slot} yet. {fix.describe()}")
+
+        pending = [fix for fix in fixes if fix.case != FIX_CASE_UNHANDLED]
+        running = {}
+        busy = Counter()
+        with ThreadPoolExecutor(max_workers=self._concurrency) as executor:
+            while pending or running:
+                self._dispatch(executor, pending, running, busy)
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    fix = running.pop(future)
+                    for n in fix.involved:
+                        busy[n] -= 1
+                    try:
+                        future.result()
+                    except (NodeException, MoveSlotException, FixException,
+                            redis.exceptions.RedisError) as e:
+                        xprint.error(f"Slot {fix.slot}: fix failed. Reason: {e}")
+                        xprint.event('fix_failed', slot=fix.slot, case=fix.case, error=e)
+                        self._failures.append((fix.slot, e))
+                    else:
+                        xprint.event('slot_fixed', slot=fix.slot, case=fix.case)
+
+        if self._failures:
+            raise FixException(f"{len(self._failures)} of {len(fixes)} open slots "
+                               f"could not be fixed")
+        xprint.ok(f"Fixed {len(fixes)} open slots.")
+        return self
+
+
+class FixOpenSlot:
+    '''
+    Fix one open slot, following redis-cli's cases:
+    - migrating in one node and importing in one: finish the move.
+    - importing (or holding keys) only: move all keys to the owner.
+    - migrating in one node, importing in several without keys: move to
+      the migrating node's target, or close the slot everywhere.
+    - migrating in one node with no keys left elsewhere: close it.
+    A missing owner is elected by key count first, and extra owners are
+    turned into importing nodes.
+    '''
+    def __init__(self, nodes, slot, census=None, password=None, notifier=None):
+        self._nodes = nodes
+        self._slot = slot
+        self._census = census
+        self._password = password
+        self._notifier = notifier
+        self._owner = None
+        self._owners = []
+        self._migrating = []
+        self._importing = []
+        self._case = None
+
+    @property
+    def nodes(self):
+        return self._nodes
+
+    @property
+    def slot(self):
+        return self._slot
+
+    @property
+    def case(self):
+        return self._case
+
+    @property
+    def owner(self):
+        return self._owner
+
+    @property
+    def involved(self):
+        return {n for n in [self._owner, *self._owners, *self._migrating, *self._importing]
+                if n is not None}
+
+    def count_keys_in_slot(self, node, slot):
+        if self._census is not None:
+            return self._census.keys(slot, node)
+        return node.cluster_count_keys_in_slot(slot)
+
+    def get_node_with_most_keys_in_slot(self, nodes, slot):
+        best = None
+        best_numkeys = 0
+
+        for n in nodes:
+            numkeys = self.count_keys_in_slot(n, slot)
+            if numkeys > best_numkeys or best is None:
+                best = n
+                best_numkeys = numkeys
+
+        return best
+
+    def describe(self):
+        return f"Slot {self._slot} is migrating in " \
+               f"[{','.join(map(str, self._migrating))}], importing in " \
+               f"[{','.join(map(str, self._importing))}], owner is {self._owner}"
+
+    def classify(self):
+        slot = self._slot
+        masters = list(self._nodes.masters)
+        self._owners = [n for n in masters if slot in n.slots]
+        self._migrating = []
+        self._importing = []
+        for n in masters:
+            if slot in n.migrating:
+                self._migrating.append(n)
+            elif slot in n.importing:
+                self._importing.append(n)
+            elif n not in self._owners and self.count_keys_in_slot(n, slot) > 0:
+                self._importing.append(n)
+
+        if not self._owners:
+            self._owner = self.get_node_with_most_keys_in_slot(masters, slot)
+        else:
+            self._owner = self.get_node_with_most_keys_in_slot(self._owners, slot)
+        if self._owner is None:
+            self._case = FIX_CASE_UNHANDLED
+            return self._case
+
+        self._migrating = [n for n in self._migrating if n is not self._owner]
+        self._importing = [n for n in self._importing if n is not self._owner]
+        for n in self._owners:
+            if n is self._owner:
+                continue
+            self._migrating = [m for m in self._migrating if m is not n]
+            if n not in self._importing:
+                self._importing.append(n)
+        # An existing owner may itself be the migrating node.
+        if self._owners and slot in self._owner.migrating:
+            self._migrating.insert(0, self._owner)
+
+        self._case = self._classify_moving()
+        return self._case
+
+    def _classify_moving(self):
+        if len(self._migrating) == 1 and len(self._importing) == 1:
+            return FIX_CASE_MOVE
+        if not self._migrating and self._importing:
+            return FIX_CASE_MOVE_TO_OWNER
+        if len(self._migrating) == 1 and len(self._importing) > 1:
+            if any(self.count_keys_in_slot(n, self._slot) > 0 for n in self._importing):
+                return FIX_CASE_UNHANDLED
+            return FIX_CASE_MOVE_TO_TARGET
+        if len(self._migrating) == 1 and not self._importing:
+            n = self._migrating[0]
+            if n is self._owner or self.count_keys_in_slot(n, self._slot) == 0:
+                return FIX_CASE_CLOSE
+        return FIX_CASE_UNHANDLED
+
+    def _set_owner(self):
+        slot = self._slot
+        if not self._owners:
+            xprint(f">>> Slot {slot}: setting owner to {self._owner}")
+            self._owner.clear_slot(slot)
+            self._owner.set_slot_owner(slot)
+        for n in self._owners:
+            if n is self._owner:
+                continue
+            xprint(f">>> Slot {slot}: {n} gives up ownership to {self._owner}")
+            n.cluster_delslots(slot)
+            n.cluster_setslot_importing(slot, self._owner)
+
+    def _move(self, src, dst, cold=False):
+        move = MoveSlot(self._slot, src, dst, self._password, fix=True,
+                        notifier=self._notifier)
+        if not cold:
+            move.set_moving()
+        return move.move_slot()
+
+    def fix(self):
+        if self._case is None:
+            self.classify()
+        slot = self._slot
+        if self._case == FIX_CASE_UNHANDLED:
+            raise FixException(f"Sorry, can't fix slot {slot} yet. {self.describe()}")
+
+        self._set_owner()
+        if self._case == FIX_CASE_MOVE:
+            src, dst = self._migrating[0], self._importing[0]
+            xprint(f">>> Slot {slot}: moving from {src} to {dst}")
+            self._move(src, dst).notify(self._nodes)
+        elif self._case == FIX_CASE_MOVE_TO_OWNER:
+            xprint(f">>> Slot {slot}: moving all keys to its owner {self._owner}")
+            for n in self._importing:
+                self._move(n, self._owner, cold=True)
+                n.clear_slot(slot)
+            for n in self._nodes.masters:
+                if n is not self._owner:
+                    n.cluster_setslot_node(slot, self._owner)
+        elif self._case == FIX_CASE_MOVE_TO_TARGET:
+            src = self._migrating[0]
+            target_id = src.migrating[slot]
+            dst = next((n for n in self._importing if n.node_id == target_id), None)
+            if dst is not None:
+                xprint(f">>> Slot {slot}: moving from {src} to its target {dst}")
+                self._move(src, dst).notify(self._nodes)
+                for n in self._importing:
+                    if n is not dst:
+                        n.clear_slot(slot)
+            else:
+                xprint(f">>> Slot {slot}: closing on {src} and all importing nodes")
+                src.clear_slot(slot)
+                for n in self._importing:
+                    n.clear_slot(slot)
+        elif self._case == FIX_CASE_CLOSE:
+            n = self._migrating[0]
+            xprint(f">>> Slot {slot}: closing on {n}")
+            n.clear_slot(slot)
+        return self
+
+
+class AdaptiveBatch:
+    '''
+    Number of keys per MIGRATE, tuned from the observed cost of each key so
+    that a single call stays within `latency_budget` seconds. Larger values
+    cost more per key, so the per-key latency already reflects payload size.
+    '''
+    def __init__(self, min_size=MIGRATE_MIN_BATCH, max_size=MIGRATE_MAX_BATCH,
+                 latency_budget=MIGRATE_LATENCY_BUDGET, smoothing=0.5):
+        if not 0 < min_size <= max_size:
+            raise ValueError('Invalid batch bounds')
+        self._min_size = min_size
+        self._max_size = max_size
+        self._latency_budget = latency_budget
+        self._smoothing = smoothing
+        self._size = min_size
+
+    @property
+    def size(self):
+        return self._size
+
+    def update(self, nkeys, elapsed):
+        if nkeys <= 0:
+            return self._size
+        per_key = max(elapsed, 1e-6) / nkeys
+        ideal = self._latency_budget / per_key
+        # Grow at most 2x per batch so one fast call can't overshoot the budget.
+        ideal = min(ideal, self._size * 2)
+        size = self._size + (ideal - self._size) * self._smoothing
+        self._size = int(min(max(size, self._min_size), self._max_size))
+        return self._size
+
+
+class MigrationStats:
+    def __init__(self):
+        self._started = time.monotonic()
+        self._keys = 0
+        self._bytes = 0
+        self._batches = 0
+        self._busy = 0.0
+
+    def add(self, nkeys, elapsed, nbytes=0):
+        self._keys += nkeys
+        self._bytes += nbytes
+        self._batches += 1
+        self._busy += elapsed
+
+    @property
+    def keys(self):
+        return self._keys
+
+    @property
+    def bytes(self):
+        return self._bytes
+
+    @property
+    def batches(self):
+        return self._batches
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self._started
+
+    @property
+    def keys_per_sec(self):
+        elapsed = self.elapsed
+        return self._keys / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self):
+        size = f", {self._bytes / 1048576:.1f}MB" if self._bytes else ""
+        return f"{self._keys} keys{size} in {self._batches} batches, " \
+               f"{self.elapsed:.2f}s ({self.keys_per_sec:.0f} keys/sec)"
+
+
+class MigrationThrottle:
+    '''
+    Rate limit shared by every slot migration of a job. Static caps are
+    given as keys/sec and bytes/sec. With `latency_ceiling` (seconds) the
+    throttle also samples the nodes it migrates between (PING RTT, recent
+    LATENCY LATEST spikes) and cuts the rate and batch size when they go
+    over the ceiling, then slowly raises them again while under half of it.
+    '''
+    _DECREASE = 0.7
+    _INCREASE = 1.1
+
+    def __init__(self, ops_per_sec=None, bytes_per_sec=None, latency_ceiling=None,
+                 sample_interval=THROTTLE_SAMPLE_INTERVAL):
+        self._max_ops = ops_per_sec
+        self._max_bytes = bytes_per_sec
+        self._ops_per_sec = ops_per_sec
+        self._bytes_per_sec = bytes_per_sec
+        self._latency_ceiling = latency_ceiling
+        self._sample_interval = sample_interval
+        self._batch_scale = 1.0
+        self._next_ops = self._next_bytes = time.monotonic()
+        self._last_sample = 0.0
+        self._sampled_keys = 0
+        self._latency = 0.0
+        self._node_ops = 0
+        self._lock = threading.Lock()
+
+    @property
+    def ops_per_sec(self):
+        return self._ops_per_sec
+
+    @property
+    def bytes_per_sec(self):
+        return self._bytes_per_sec
+
+    @property
+    def latency(self):
+        return self._latency
+
+    @property
+    def node_ops(self):
+        return self._node_ops
+
+    def limit_batch(self, size, min_size=1):
+        return max(min_size, int(size * self._batch_scale))
+
+    def acquire(self, nkeys, nbytes=0, nodes=()):
+        '''
+        Block until `nkeys` keys / `nbytes` bytes may be sent.
+        '''
+        if self._latency_ceiling is not None and nodes:
+            self._maybe_sample(nodes)
+        with self._lock:
+            now = time.monotonic()
+            wait_until = now
+            self._sampled_keys += nkeys
+            if self._ops_per_sec:
+                self._next_ops = max(self._next_ops, now) + nkeys / self._ops_per_sec
+                wait_until = max(wait_until, self._next_ops - nkeys / self._ops_per_sec)
+            if self._bytes_per_sec and nbytes:
+                self._next_bytes = max(self._next_bytes, now) + nbytes / self._bytes_per_sec
+                wait_until = max(wait_until, self._next_bytes - nbytes / self._bytes_per_sec)
+        if wait_until > now:
+            time.sleep(wait_until - now)
+
+    def _maybe_sample(self, nodes):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_sample < self._sample_interval:
+                return
+            elapsed = now - self._last_sample if self._last_sample else None
+            self._last_sample = now
+            observed_ops = self._sampled_keys / elapsed if elapsed else None
+            self._sampled_keys = 0
+
+        latency, load = 0.0, 0
+        since = int(time.time() - 2 * self._sample_interval)
+        for n in nodes:
+            try:
+                latency = max(latency, n.ping_latency(), n.latency_latest(since))
+                load = max(load, n.instantaneous_ops_per_sec())
+            except redis.exceptions.RedisError:
+                continue
+        self._node_ops = load
+        self._adjust(latency, observed_ops)
+
+    def _adjust(self, latency, observed_ops=None):
+        with self._lock:
+            self._latency = latency
+            if latency > self._latency_ceiling:
+                if self._ops_per_sec is None and observed_ops:
+                    self._ops_per_sec = observed_ops
+                if self._ops_per_sec:
+                    self._ops_per_sec *= self._DECREASE
+                if self._bytes_per_sec:
+                    self._bytes_per_sec *= self._DECREASE
+                self._batch_scale = max(0.05, self._batch_scale * self._DECREASE)
+                xprint.verbose(lambda: f"Throttle: latency {latency * 1000:.1f}ms over ceiling "
+                                       f"at {self._node_ops} ops/sec on the nodes, "
+                                       f"rate {self._ops_per_sec or 0:.0f} keys/sec, "
+                                       f"batch scale {self._batch_scale:.2f}")
+                xprint.event('throttle', latency_ms=round(latency * 1000, 3),
+                             node_ops=self._node_ops, keys_per_sec=self._ops_per_sec,
+                             bytes_per_sec=self._bytes_per_sec,
+                             batch_scale=round(self._batch_scale, 3))
+            elif latency < self._latency_ceiling / 2:
+                self._batch_scale = min(1.0, self._batch_scale * self._INCREASE)
+                if self._ops_per_sec:
+                    self._ops_per_sec *= self._INCREASE
+                    if self._max_ops is not None:
+                        self._ops_per_sec = min(self._ops_per_sec, self._max_ops)
+                    elif self._batch_scale >= 1.0 and observed_ops \
+                            and self._ops_per_sec > observed_ops * 4:
+                        # Far above what we achieve anyway: stop limiting.
+                        self._ops_per_sec = None
+                if self._bytes_per_sec:
+                    self._bytes_per_sec *= self._INCREASE
+                    if self._max_bytes is not None:
+                        self._bytes_per_sec = min(self._bytes_per_sec, self._max_bytes)
+
+
+class MoveSlotException(Exception): pass
+class SlotNotifier:
+    '''
+    Send CLUSTER SETSLOT NODE for moved slots to the masters that were
+    neither source nor destination. Slots are queued and flushed once
+    `batch` are pending or `interval` seconds passed since the last flush
+    (and on close), as one pipeline per master with the masters in
+    parallel. Failures are only reported: the new owner spreads over the
+    cluster bus anyway, this just gets there sooner.
+    '''
+    def __init__(self, nodes, concurrency=NOTIFY_CONCURRENCY,
+                 batch=NOTIFY_BATCH, interval=NOTIFY_INTERVAL):
+        self._nodes = nodes
+        self._batch = batch
+        self._interval = interval
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._last_flush = 0
+        self._failures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def failures(self):
+        return self._failures
+
+    def add(self, slot, src, dst):
+        with self._lock:
+            self._pending.append((slot, src, dst))
+            if (len(self._pending) < self._batch
+                    and time.monotonic() - self._last_flush < self._interval):
+                return self
+        return self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+        if not pending:
+            return self
+
+        commands = {}
+        for master in self._nodes.masters:
+            slots = [(slot, ('CLUSTER', 'SETSLOT', slot, 'NODE', dst.node_id))
+                     for slot, src, dst in pending if master not in (src, dst)]
+            if slots:
+                commands[master] = slots
+        futures = {self._executor.submit(master.call, [args for _, args in slots]): master
+                   for master, slots in commands.items()}
+        for future in as_completed(futures):
+            master = futures[future]
+            slots = commands[master]
+            try:
+                replies = future.result()
+            except (NodeException, redis.exceptions.RedisError) as e:
+                replies = [e] * len(slots)
+            failed = [(slot, reply) for (slot, _), reply in zip(slots, replies)
+                      if isinstance(reply, Exception)]
+            if failed:
+                xprint.warning(f"{master} wasn't told the new owner of {len(failed)} "
+                               f"slots. Reason: {failed[0][1]}")
+                self._failures.extend((slot, master, e) for slot, e in failed)
+        xprint.event('slots_notified', slots=len(pending), masters=len(commands))
+        return self
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown()
 
 
 class MoveSlot:
-    def __init__(self, slot, src, dst, password=None):
+    def __init__(self, slot, src, dst, password=None,
+                 min_batch=MIGRATE_MIN_BATCH, max_batch=MIGRATE_MAX_BATCH,
+                 latency_budget=MIGRATE_LATENCY_BUDGET,
+                 timeout=MIGRATE_TIMEOUT, fix=False,
+                 max_batch_bytes=MIGRATE_MAX_BATCH_BYTES,
+                 big_key_bytes=MIGRATE_BIG_KEY_BYTES, throttle=None,
+                 notifier=None):
         self._slot = slot
         self._src = src
         self._dst = dst
         self._password = password
-        self._pipeline = 10
-        self._timeout = 60
-        self._fix = False
-        self._dots = True
+        self._batch = AdaptiveBatch(min_batch, max_batch, latency_budget)
+        self._timeout = timeout
+        self._fix = fix
+        self._max_batch_bytes = max_batch_bytes
+        self._big_key_bytes = big_key_bytes
+        self._throttle = throttle
+        self._notifier = notifier
+        self._stats = MigrationStats()
+
+    @property
+    def slot(self):
+        return self._slot
+
+    @property
+    def stats(self):
+        return self._stats
 
     def set_moving(self):
         self._dst.cluster_setslot_importing(self._slot, self._src) 
@@ -514,22 +3096,1446 @@ class MoveSlot:
         return self
 
     def notify(self, nodes):
+        '''
+        Destination first, so it bumps the epoch and claims the slot, then
+        the source. The other masters are told through the notifier when
+        there is one, all at once otherwise.
+        '''
         self._dst.cluster_setslot_node(self._slot, self._dst)
         self._src.cluster_setslot_node(self._slot, self._dst)
-        for n in [n for n in nodes.masters
-                    if n not in (self._src, self._dst)]:
-            n.cluster_setslot_node(self._slot, self._dst)
+        if self._notifier is not None:
+            self._notifier.add(self._slot, self._src, self._dst)
+        else:
+            with SlotNotifier(nodes) as notifier:
+                notifier.add(self._slot, self._src, self._dst)
         return self
 
+    def _call_migrate(self, keys_in_slot, count, timeout, replace=False):
+        if count is None:
+            self._src.migrate(self._dst, keys_in_slot, self._password,
+                              timeout, replace=replace)
+            return None
+        return self._src.migrate_and_get_keys_in_slot(
+            self._dst, keys_in_slot, self._slot, count,
+            self._password, timeout, replace=replace)
+
+    def _migrate(self, keys_in_slot, count, timeout):
+        '''
+        MIGRATE keys_in_slot and, unless count is None, fetch the next keys.
+        '''
+        try:
+            return self._call_migrate(keys_in_slot, count, timeout)
+        except redis.exceptions.ResponseError as e:
+            if not (self._fix and 'BUSYKEY' in str(e)):
+                raise MoveSlotException(f"Slot {self._slot}: {self._src} -> {self._dst} "
+                                        f"failed to migrate keys. Reason: {e}")
+            xprint.warning("Target key exists. Replacing it for FIX.")
+            return self._call_migrate(keys_in_slot, count, timeout, replace=True)
+
+    def _timeout_for(self, nbytes):
+        if not nbytes:
+            return self._timeout
+        return max(self._timeout, int(nbytes * 1000 / MIGRATE_MIN_BYTES_PER_SEC))
+
+    def _split_by_size(self, keys_in_slot):
+        '''
+        Yield (keys, bytes) batches of at most max_batch_bytes. Keys of
+        big_key_bytes or more get a batch of their own.
+        '''
+        if self._max_batch_bytes is None:
+            yield keys_in_slot, 0
+            return
+        sizes = self._src.memory_usage(keys_in_slot)
+        if sizes is None:
+            xprint.warning(f"Slot {self._slot}: key sizes are not available on "
+                           f"{self._src}, batching by key count only.")
+            self._max_batch_bytes = None
+            yield keys_in_slot, 0
+            return
+
+        batch, batch_bytes = [], 0
+        for key, size in zip(keys_in_slot, sizes):
+            size = size or 0
+            if size >= self._big_key_bytes:
+                yield [key], size
+                continue
+            if batch and batch_bytes + size > self._max_batch_bytes:
+                yield batch, batch_bytes
+                batch, batch_bytes = [], 0
+            batch.append(key)
+            batch_bytes += size
+        if batch:
+            yield batch, batch_bytes
+
+    def _batch_size(self):
+        if self._throttle is None:
+            return self._batch.size
+        return self._throttle.limit_batch(self._batch.size)
+
     def move_slot(self):
         # only for 3.0.7++
-        while keys_in_slot := self._src.cluster_get_keys_in_slot(self._slot, self._pipeline): 
-            print(keys_in_slot)
+        self._stats = MigrationStats()
+        keys_in_slot = self._src.cluster_get_keys_in_slot(self._slot, self._batch_size())
+        while keys_in_slot:
+            batches = list(self._split_by_size(keys_in_slot))
+            next_keys = None
+            for i, (batch, nbytes) in enumerate(batches):
+                # The last MIGRATE of the round also fetches the next keys.
+                count = self._batch_size() if i == len(batches) - 1 else None
+                if self._throttle is not None:
+                    self._throttle.acquire(len(batch), nbytes, (self._src, self._dst))
+                started = time.monotonic()
+                next_keys = self._migrate(batch, count, self._timeout_for(nbytes))
+                elapsed = time.monotonic() - started
+                self._stats.add(len(batch), elapsed, nbytes)
+                command_profile.add_bytes(self._src, nbytes)
+
+                if len(batch) == 1 and nbytes >= self._big_key_bytes:
+                    xprint.info(f"Slot {self._slot}: big key '{batch[0]}' "
+                                f"({nbytes / 1048576:.1f}MB) moved to {self._dst} "
+                                f"in {elapsed * 1000:.1f}ms")
+                    continue
+                self._batch.update(len(batch), elapsed)
+                xprint.verbose(lambda: f"Slot {self._slot}: moved {len(batch)} keys "
+                                       f"in {elapsed * 1000:.1f}ms, "
+                                       f"next batch {self._batch.size}, "
+                                       f"{self._stats.keys_per_sec:.0f} keys/sec")
+                xprint.event('migrate_batch', slot=self._slot, src=self._src,
+                             dst=self._dst, keys=len(batch), bytes=nbytes,
+                             latency_ms=round(elapsed * 1000, 3))
+            keys_in_slot = next_keys
+        xprint.verbose(lambda: f"Slot {self._slot}: {self._src} -> {self._dst} {self._stats}")
+        xprint.event('slot_moved', slot=self._slot, src=self._src, dst=self._dst,
+                     keys=self._stats.keys, bytes=self._stats.bytes,
+                     elapsed_ms=round(self._stats.elapsed * 1000, 3))
+        return self
+
+
+class ReshardProgress:
+    def __init__(self, total):
+        self._total = total
+        self._done = 0
+        self._keys = 0
+        self._started = time.monotonic()
+
+    def add(self, move):
+        self._done += 1
+        self._keys += move.stats.keys
+
+    @property
+    def done(self):
+        return self._done
+
+    @property
+    def total(self):
+        return self._total
+
+    @property
+    def keys(self):
+        return self._keys
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self._started
+
+    @property
+    def eta(self):
+        if not self._done:
+            return None
+        return self.elapsed / self._done * (self._total - self._done)
+
+    def __str__(self):
+        percent = self._done * 100 / self._total if self._total else 100
+        eta = self.eta
+        eta = f"{eta:.0f}s" if eta is not None else "-"
+        return f"Moved {self._done}/{self._total} slots ({percent:.1f}%), " \
+               f"{self._keys} keys, elapsed {self.elapsed:.0f}s, ETA {eta}"
+
+
+JOURNAL_PLAN = 'plan'
+JOURNAL_MOVING = 'moving'
+JOURNAL_DRAINED = 'drained'
+JOURNAL_NOTIFIED = 'notified'
+
+
+class ReshardJournalException(Exception): pass
+class ReshardJournal:
+    '''
+    Append-only JSON-lines record of a reshard: the plan first, then one
+    line per slot step (set_moving done, keys drained, notify done) with
+    the throughput of the drain. Lines are flushed as they are written, so
+    a killed process leaves a journal that `load` can resume from.
+    '''
+    def __init__(self, path):
+        self._path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return self._path
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Return the plan as (slot, src node_id, dst node_id) tuples and the
+        last recorded step of each slot.
+        '''
+        plan = None
+        states = {}
+        try:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-write.
+                        continue
+                    if entry['event'] == JOURNAL_PLAN:
+                        plan = [tuple(move) for move in entry['moves']]
+                        states = {}
+                    else:
+                        states[entry['slot']] = entry['event']
+        except OSError as e:
+            raise ReshardJournalException(f"Can't read journal '{path}'. Reason: {e}")
+        if plan is None:
+            raise ReshardJournalException(f"Journal '{path}' has no plan")
+        return plan, states
+
+    def _write(self, entry):
+        entry['time'] = round(time.time(), 3)
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self._lock:
+            if self._file is None:
+                self._file = open(self._path, 'a+')
+                # Terminate a line torn by a crash so the next entry stays parseable.
+                if self._file.tell() > 0:
+                    self._file.seek(self._file.tell() - 1)
+                    if self._file.read(1) != '\n':
+                        self._file.write('\n')
+            self._file.write(line)
+            self._file.flush()
+
+    def write_plan(self, plan):
+        self._write({'event': JOURNAL_PLAN,
+                     'moves': [[slot, src.node_id, dst.node_id] for slot, src, dst in plan]})
+        with self._lock:
+            os.fsync(self._file.fileno())
+
+    def record(self, event, slot, **fields):
+        self._write({'event': event, 'slot': slot, **fields})
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class ReshardException(Exception): pass
+class ReshardScheduler:
+    '''
+    Run a plan of (slot, src, dst) moves with several slot migrations in
+    flight, never exceeding `per_source` streams out of a node or
+    `per_destination` streams into a node.
+    '''
+    def __init__(self, nodes, plan, password=None,
+                 concurrency=RESHARD_CONCURRENCY,
+                 per_source=RESHARD_PER_SOURCE,
+                 per_destination=RESHARD_PER_DESTINATION,
+                 journal=None, states=None,
+                 **move_options):
+        if per_source < 1 or per_destination < 1:
+            raise ValueError('per_source and per_destination must be at least 1')
+        self._nodes = nodes
+        self._password = password
+        self._concurrency = concurrency
+        self._per_source = per_source
+        self._per_destination = per_destination
+        self._journal = journal
+        self._states = states
+        self._move_options = move_options
+        self._plan = [move for move in plan
+                      if (states or {}).get(move[0]) != JOURNAL_NOTIFIED]
+        self._progress = ReshardProgress(len(self._plan))
+        self._failures = []
+        self._notifier = None
+
+    @classmethod
+    def resume(cls, nodes, journal_path, password=None, **options):
+        '''
+        Continue the reshard recorded in `journal_path`: finished slots are
+        skipped, drained slots only need notify, and the rest start over
+        from set_moving, which is safe to repeat.
+        '''
+        moves, states = ReshardJournal.load(journal_path)
+        plan = []
+        for slot, src_id, dst_id in moves:
+            src = nodes.get_by_node_id(src_id)
+            dst = nodes.get_by_node_id(dst_id)
+            if src is None or dst is None:
+                raise ReshardJournalException(
+                    f"Slot {slot}: node {src_id if src is None else dst_id} "
+                    f"from the journal is not in the cluster")
+            plan.append((slot, src, dst))
+        done = sum(1 for state in states.values() if state == JOURNAL_NOTIFIED)
+        xprint.info(f"Resuming reshard from '{journal_path}': "
+                    f"{done}/{len(plan)} slots already done")
+        return cls(nodes, plan, password, journal=ReshardJournal(journal_path),
+                   states=states, **options)
+
+    @property
+    def progress(self):
+        return self._progress
+
+    @property
+    def failures(self):
+        return self._failures
+
+    def _report(self):
+        progress = self._progress
+        xprint.info(progress)
+        xprint.event('reshard_progress', done=progress.done, total=progress.total,
+                     keys=progress.keys, elapsed=round(progress.elapsed, 3),
+                     eta=progress.eta)
+
+    def _record(self, event, slot, **fields):
+        if self._journal is not None:
+            self._journal.record(event, slot, **fields)
+
+    def _move(self, slot, src, dst):
+        move = MoveSlot(slot, src, dst, self._password, notifier=self._notifier,
+                        **self._move_options)
+        if (self._states or {}).get(slot) != JOURNAL_DRAINED:
+            move.set_moving()
+            self._record(JOURNAL_MOVING, slot)
+            move.move_slot()
+            self._record(JOURNAL_DRAINED, slot, keys=move.stats.keys,
+                         bytes=move.stats.bytes,
+                         elapsed=round(move.stats.elapsed, 3))
+        move.notify(self._nodes)
+        self._record(JOURNAL_NOTIFIED, slot)
+        return move
+
+    def _queues(self):
+        queues = {}
+        for slot, src, dst in self._plan:
+            queues.setdefault((src, dst), deque()).append(slot)
+        return queues
+
+    def _dispatch(self, executor, queues, running, sources, destinations):
+        # Round-robin over node pairs so every pair gets its share of workers.
+        dispatched = True
+        while dispatched and len(running) < self._concurrency:
+            dispatched = False
+            for (src, dst), slots in list(queues.items()):
+                if len(running) >= self._concurrency:
+                    break
+                if (sources[src] >= self._per_source
+                        or destinations[dst] >= self._per_destination):
+                    continue
+                slot = slots.popleft()
+                if not slots:
+                    del queues[(src, dst)]
+                else:
+                    queues[(src, dst)] = queues.pop((src, dst))
+                sources[src] += 1
+                destinations[dst] += 1
+                running[executor.submit(self._move, slot, src, dst)] = (slot, src, dst)
+                dispatched = True
+
+    def run(self):
+        queues = self._queues()
+        running = {}
+        sources, destinations = Counter(), Counter()
+        last_report = 0
+
+        if self._journal is not None and self._states is None:
+            self._journal.write_plan(self._plan)
+        xprint.info(f"Moving {self._progress.total} slots with up to "
+                    f"{self._concurrency} concurrent migrations")
+        # The executor exits first, so the notifier flushes after the last move.
+        with SlotNotifier(self._nodes) as notifier, \
+                ThreadPoolExecutor(max_workers=self._concurrency) as executor:
+            self._notifier = notifier
+            while queues or running:
+                if not self._failures:
+                    self._dispatch(executor, queues, running, sources, destinations)
+                elif not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    slot, src, dst = running.pop(future)
+                    sources[src] -= 1
+                    destinations[dst] -= 1
+                    try:
+                        self._progress.add(future.result())
+                    except (NodeException, MoveSlotException,
+                            redis.exceptions.RedisError) as e:
+                        xprint.error(f"Slot {slot}: {src} -> {dst} failed. Reason: {e}")
+                        xprint.event('move_failed', slot=slot, src=src, dst=dst, error=e)
+                        self._failures.append((slot, src, dst, e))
+
+                if time.monotonic() - last_report >= RESHARD_PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    self._report()
+
+        self._report()
+        if self._journal is not None:
+            self._journal.close()
+        if self._failures:
+            raise ReshardException(f"{len(self._failures)} slot moves failed, "
+                                   f"{self._progress.done}/{self._progress.total} done")
+        return self
+
+
+REBALANCE_THRESHOLD = 2
+
+
+class RebalancePlanner:
+    '''
+    Compute the smallest set of (slot, src, dst) moves that brings every
+    master within `threshold` percent of its weighted share of the slots.
+    When `keys_in_slot` (slot -> number of keys) is given, donors give away
+    their emptiest slots first so the fewest keys have to be migrated.
+    '''
+    def __init__(self, nodes, weights=None, threshold=REBALANCE_THRESHOLD,
+                 keys_in_slot=None, use_empty_masters=False):
+        self._nodes = nodes
+        self._weights = weights or {}
+        self._threshold = threshold
+        self._keys_in_slot = keys_in_slot
+        self._use_empty_masters = use_empty_masters
+
+    def _weight(self, node):
+        for key in (node.node_id, str(node)):
+            if key in self._weights:
+                return self._weights[key]
+        return 1
+
+    def _masters(self):
+        return [m for m in self._nodes.masters
+                if m.slots or self._use_empty_masters or self._weight(m) != 1]
+
+    @staticmethod
+    def _targets(total, weights):
+        # Largest remainder, so integer targets add up to exactly `total`.
+        total_weight = sum(weights)
+        exact = [total * w / total_weight for w in weights]
+        targets = [int(e) for e in exact]
+        by_remainder = sorted(range(len(exact)), key=lambda i: targets[i] - exact[i])
+        for i in by_remainder[:total - sum(targets)]:
+            targets[i] += 1
+        return targets
+
+    def _is_balanced(self, counts, targets):
+        for count, target in zip(counts, targets):
+            if target == 0:
+                if count:
+                    return False
+            elif abs(count - target) * 100 / target > self._threshold:
+                return False
+        return True
+
+    @staticmethod
+    def _spread(amount, room, score):
+        '''
+        Hand out `amount` units one by one to the candidates with the best
+        score, where `room` bounds how many units each candidate can take.
+        '''
+        heap = [(score(i, 0), i) for i, r in room.items() if r > 0]
+        heapq.heapify(heap)
+        taken = dict.fromkeys(room, 0)
+        while amount > 0 and heap:
+            _, i = heapq.heappop(heap)
+            taken[i] += 1
+            amount -= 1
+            if taken[i] < room[i]:
+                heapq.heappush(heap, (score(i, taken[i]), i))
+        return taken
+
+    def _cheapest_slots(self, node, amount):
+        if self._keys_in_slot is None:
+            # Take from the end of the node's ranges to keep them contiguous.
+            slots = []
+            for start, end in reversed(list(node.slots.ranges())):
+                needed = amount - len(slots)
+                slots.extend(range(end, max(start, end - needed + 1) - 1, -1))
+                if len(slots) >= amount:
+                    break
+            return slots
+        keys = self._keys_in_slot
+        return sorted(node.slots, key=lambda slot: (keys[slot], -slot))[:amount]
+
+    def plan(self):
+        masters = self._masters()
+        if not masters:
+            return []
+        weights = [self._weight(m) for m in masters]
+        if sum(weights) <= 0:
+            raise ValueError('The sum of master weights must be positive')
+
+        counts = [len(m.slots) for m in masters]
+        targets = self._targets(sum(counts), weights)
+        if self._is_balanced(counts, targets):
+            return []
+
+        ratio = self._threshold / 100
+        lows = [math.ceil(t * (1 - ratio)) for t in targets]
+        highs = [math.floor(t * (1 + ratio)) for t in targets]
+        give = {i: max(0, c - h) for i, (c, h) in enumerate(zip(counts, highs))}
+        take = {i: max(0, l - c) for i, (c, l) in enumerate(zip(counts, lows))}
+
+        # Moving max(sum(give), sum(take)) slots is the minimum; the side that
+        # falls short is topped up by the nodes furthest from their targets.
+        shortfall = sum(take.values()) - sum(give.values())
+        if shortfall > 0:
+            room = {i: counts[i] - give[i] - lows[i]
+                    for i in range(len(masters)) if not take[i]}
+            extra = self._spread(shortfall, room, lambda i, n:
+                                 -(counts[i] - give[i] - n - targets[i]) / max(targets[i], 1))
+            for i, n in extra.items():
+                give[i] += n
+        elif shortfall < 0:
+            room = {i: highs[i] - counts[i] - take[i]
+                    for i in range(len(masters)) if not give[i]}
+            extra = self._spread(-shortfall, room, lambda i, n:
+                                 (counts[i] + take[i] + n - targets[i]) / max(targets[i], 1))
+            for i, n in extra.items():
+                take[i] += n
+
+        donated = []
+        for i, amount in sorted(give.items(), key=lambda g: -g[1]):
+            if amount:
+                donated.extend((slot, masters[i])
+                               for slot in self._cheapest_slots(masters[i], amount))
+
+        plan = []
+        for i, amount in sorted(take.items(), key=lambda t: -t[1]):
+            for slot, src in donated[len(plan):len(plan) + amount]:
+                plan.append((slot, src, masters[i]))
+        return plan
+
+CALL_ROLES = ('masters', 'replicas', 'all')
+
+
+def _decode_arg(arg):
+    try:
+        return arg.decode()
+    except UnicodeDecodeError:
+        return arg
+
+
+class CallCluster:
+    '''
+    Run the same commands on a set of nodes concurrently, pipelined per
+    node. Replies are kept per node and aggregated afterwards: errors are
+    grouped by message and numeric replies or INFO fields get their sum,
+    min and max.
+    '''
+    def __init__(self, nodes, commands, role='all', concurrency=DISCOVERY_CONCURRENCY):
+        if role not in CALL_ROLES:
+            raise ValueError(f"Unknown role '{role}' - use one of {', '.join(CALL_ROLES)}")
+        self._nodes = nodes
+        self._commands = [list(args) for args in commands]
+        self._role = role
+        self._concurrency = concurrency
+        self._results = {}
+
+    @staticmethod
+    def read_commands(lines):
+        '''
+        One inline command per line, quoted as for redis-cli (see
+        FileImportSource.split_inline); blank lines and # comments skipped.
+        Arguments that aren't valid UTF-8 after unescaping stay bytes.
+        '''
+        commands = []
+        for line in lines:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                commands.append([_decode_arg(arg) for arg in
+                                 FileImportSource.split_inline(line.encode())])
+        return commands
+
+    @property
+    def targets(self):
+        if self._role == 'masters':
+            return list(self._nodes.masters)
+        if self._role == 'replicas':
+            return list(self._nodes.replicas)
+        return list(self._nodes)
+
+    @property
+    def results(self):
+        return self._results
+
+    def _call(self, node):
+        try:
+            return node.call(self._commands)
+        except redis.exceptions.RedisError as e:
+            return [e] * len(self._commands)
+
+    def run(self, on_result=None):
+        '''
+        Call every target. `on_result(node, replies)` is called as each node
+        answers, in completion order.
+        '''
+        self._results = {}
+        with ThreadPoolExecutor(max_workers=self._concurrency) as executor:
+            futures = {executor.submit(self._call, n): n for n in self.targets}
+            for future in as_completed(futures):
+                node = futures[future]
+                self._results[node] = future.result()
+                if on_result is not None:
+                    on_result(node, self._results[node])
+        return self
+
+    def errors(self):
+        '''
+        {(command index, error message): [nodes]}
+        '''
+        grouped = {}
+        for node, replies in self._results.items():
+            for i, reply in enumerate(replies):
+                if isinstance(reply, Exception):
+                    grouped.setdefault((i, str(reply)), []).append(node)
+        return grouped
+
+    @staticmethod
+    def _numbers(reply, prefix=''):
+        if isinstance(reply, bool):
+            return
+        if isinstance(reply, (int, float)):
+            yield prefix, reply
+        elif isinstance(reply, dict):
+            for key, value in reply.items():
+                yield from CallCluster._numbers(value, f"{prefix}.{key}" if prefix else key)
+
+    def aggregate(self, fields=None):
+        '''
+        {(command index, field): (sum, (min, node), (max, node))} over the
+        numeric replies, or numeric fields of dict replies like INFO.
+        Whole-reply numbers use the field ''.
+        '''
+        values = {}
+        for node, replies in self._results.items():
+            for i, reply in enumerate(replies):
+                for field, value in self._numbers(reply):
+                    if fields and field not in fields:
+                        continue
+                    values.setdefault((i, field), []).append((value, node))
+        return {key: (sum(v for v, _ in pairs),
+                      min(pairs, key=lambda p: p[0]),
+                      max(pairs, key=lambda p: p[0]))
+                for key, pairs in values.items()}
+
+    @staticmethod
+    def format_reply(reply):
+        if isinstance(reply, Exception):
+            return f"(error) {reply}"
+        if isinstance(reply, dict):
+            return '\n'.join(
+                f"{k}:" + (','.join(f"{ik}={iv}" for ik, iv in v.items())
+                           if isinstance(v, dict) else str(v))
+                for k, v in reply.items())
+        if isinstance(reply, (list, tuple)):
+            return '\n'.join(str(r) for r in reply)
+        return str(reply)
+
+    def show_result(self, node, replies):
+        for args, reply in zip(self._commands, replies):
+            xprint(f"{node}> {' '.join(args)}")
+            xprint(self.format_reply(reply))
+
+    def show_summary(self, fields=None):
+        for (i, message), nodes in sorted(self.errors().items()):
+            xprint.error(f"{' '.join(map(str, self._commands[i]))}: {message} on {len(nodes)} "
+                         f"node(s): {', '.join(sorted(map(str, nodes)))}")
+        for (i, field), (total, low, high) in sorted(self.aggregate(fields).items()):
+            name = ' '.join(map(str, self._commands[i])) + (f" {field}" if field else '')
+            xprint(f"{name}: sum={total} min={low[0]} ({low[1]}) max={high[0]} ({high[1]})")
+
+
+CONVERGENCE_TIMEOUT = 60
+CONVERGENCE_BACKOFF_INITIAL = 0.05
+CONVERGENCE_BACKOFF_MAX = 1.0
+
+
+def wait_with_backoff(done, timeout=CONVERGENCE_TIMEOUT,
+                      initial=CONVERGENCE_BACKOFF_INITIAL, maximum=CONVERGENCE_BACKOFF_MAX):
+    '''
+    Call `done` until it returns true, sleeping initial, 2*initial, ...
+    up to `maximum` seconds between calls. False if `timeout` runs out.
+    '''
+    deadline = time.monotonic() + timeout
+    delay = initial
+    while not done():
+        if time.monotonic() + delay > deadline:
+            return False
+        time.sleep(delay)
+        delay = min(delay * 2, maximum)
+    return True
+
+
+class CreateException(Exception): pass
+class CreateCluster:
+    '''
+    Bootstrap a cluster from empty nodes. Slots are given to each master
+    as ranges with ADDSLOTSRANGE, every node MEETs the first one at once,
+    and convergence is awaited by polling the short CLUSTER INFO, then
+    comparing config digests once every node knows every other one.
+    '''
+    MIN_MASTERS = 3
+
+    def __init__(self, addrs, replicas=0, password=None, manager=None,
+                 concurrency=DISCOVERY_CONCURRENCY, timeout=CONVERGENCE_TIMEOUT):
+        self._addrs = addrs
+        self._replicas = replicas
+        self._password = password
+        self._manager = manager
+        self._concurrency = concurrency
+        self._timeout = timeout
+        self._nodes = []
+        self._executor = None
+
+    def _map(self, func, items):
+        '''
+        Run func on every item concurrently, raising one CreateException
+        that lists every failure.
+        '''
+        futures = {self._executor.submit(func, item): item for item in items}
+        results, errors = {}, []
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                results[item] = future.result()
+            except (NodeException, CreateException, redis.exceptions.RedisError) as e:
+                errors.append(f"{item}: {e}")
+        if errors:
+            raise CreateException('; '.join(sorted(errors)))
+        return [results[item] for item in items]
+
+    def _load(self, addr):
+        node = Node(addr, password=self._password, manager=self._manager)
+        node.connect()
+        node.load_info(raw=True)
+        if int(node.cluster_info()['cluster_known_nodes']) != 1 or node.slots \
+                or node.dbsize():
+            raise CreateException(f"Node {node} is not empty. Either the node already "
+                                  f"knows other nodes (check with CLUSTER NODES) or "
+                                  f"contains some key in database 0.")
+        return node
+
+    def allocate(self, nodes):
+        '''
+        Split nodes into masters and {replica: master}, spreading masters
+        over hosts first and keeping replicas off their master's host when
+        possible.
+        '''
+        num_masters = len(nodes) // (self._replicas + 1)
+        if num_masters < self.MIN_MASTERS:
+            raise CreateException(f"A Redis Cluster needs at least {self.MIN_MASTERS} "
+                                  f"master nodes; {len(nodes)} nodes with {self._replicas} "
+                                  f"replicas per master give {num_masters}.")
+        by_host = {}
+        for n in nodes:
+            by_host.setdefault(n.origin[0], deque()).append(n)
+        interleaved = []
+        while by_host:
+            for host in list(by_host):
+                interleaved.append(by_host[host].popleft())
+                if not by_host[host]:
+                    del by_host[host]
+
+        masters = interleaved[:num_masters]
+        replicas = {}
+        count = Counter({m: 0 for m in masters})
+        cursor = 0
+        for n in interleaved[num_masters:]:
+            # Round-robin over the least served masters, skipping the ones
+            # on the replica's own host when there is any other choice.
+            fewest = min(count.values())
+            order = [masters[(cursor + i) % num_masters] for i in range(num_masters)]
+            order = [m for m in order if count[m] == fewest]
+            master = next((m for m in order if m.origin[0] != n.origin[0]), order[0])
+            cursor = masters.index(master) + 1
+            count[master] += 1
+            replicas[n] = master
+        return masters, replicas
+
+    @staticmethod
+    def slot_ranges(num_masters):
+        '''
+        SlotSet of each master, slots split as evenly as possible.
+        '''
+        return [SlotSet.from_range(i * CLUSTER_HASH_SLOTS // num_masters,
+                                   (i + 1) * CLUSTER_HASH_SLOTS // num_masters - 1)
+                for i in range(num_masters)]
+
+    def _known_nodes(self, node):
+        return int(node.cluster_info()['cluster_known_nodes'])
+
+    def _met(self):
+        return all(known == len(self._nodes)
+                   for known in self._map(self._known_nodes, self._nodes))
+
+    def _settled(self, node):
+        info = node.cluster_info()
+        return int(info['cluster_known_nodes']) == len(self._nodes) \
+            and int(info['cluster_slots_assigned']) == CLUSTER_HASH_SLOTS
+
+    def _converged(self):
+        # CLUSTER INFO is a few hundred bytes; only pull CLUSTER NODES for
+        # the digests once every node reports the full membership and slots.
+        if not all(self._map(self._settled, self._nodes)):
+            return False
+        return len(set(self._map(Node.fetch_config_digest, self._nodes))) == 1
+
+    def _wait(self, what, done):
+        xprint(f">>> Waiting for {what}", end="", flush=True)
+        started = time.monotonic()
+        ok = wait_with_backoff(done, self._timeout)
+        xprint(f" ({time.monotonic() - started:.2f}s)", ignore_header=True)
+        if not ok:
+            raise CreateException(f"Timed out after {self._timeout}s waiting for {what}")
+
+    def create(self):
+        with ThreadPoolExecutor(max_workers=self._concurrency) as executor:
+            self._executor = executor
+            xprint(f">>> Connecting to {len(self._addrs)} nodes...")
+            self._nodes = self._map(self._load, self._addrs)
+            masters, replicas = self.allocate(self._nodes)
+            slots = dict(zip(masters, self.slot_ranges(len(masters))))
+
+            xprint(">>> Performing hash slots allocation on "
+                   f"{len(self._nodes)} nodes...")
+            for m in masters:
+                xprint(f"M: {m.node_id} {m}")
+                xprint(f"   slots:{slots[m].summarize()} ({len(slots[m])} slots) master")
+            for r, m in replicas.items():
+                xprint(f"S: {r.node_id} {r}")
+                xprint(f"   replicates {m.node_id}")
+
+            epochs = {n: epoch for epoch, n in enumerate(self._nodes, 1)}
+            self._map(lambda m: m.cluster_addslotsrange(*slots[m].ranges()), masters)
+            self._map(lambda n: n.cluster_set_config_epoch(epochs[n]), self._nodes)
+
+            xprint(">>> Sending CLUSTER MEET messages to join the cluster")
+            host, port = self._nodes[0].origin
+            self._map(lambda n: n.cluster_meet(host, port), self._nodes[1:])
+            self._wait("every node to meet every other", self._met)
+
+            self._map(lambda r: r.cluster_replicate(replicas[r]), list(replicas))
+            self._wait("the cluster to join", self._converged)
+            self._map(lambda n: n.load_info(with_friends=True, raw=True), self._nodes)
+        return Nodes(self._nodes, password=self._password, manager=self._manager)
+
+IMPORT_BATCH = 1000
+IMPORT_QUEUE = 8
+IMPORT_READ_SIZE = 1024 * 1024
+IMPORT_PROGRESS_INTERVAL = 1.0
+# How often the reader, blocked on a full writer queue, checks the writer
+# is still alive.
+IMPORT_QUEUE_TIMEOUT = 1.0
+_INLINE_ESCAPES = {ord('n'): ord('\n'), ord('r'): ord('\r'), ord('t'): ord('\t'),
+                   ord('b'): ord('\b'), ord('a'): ord('\a')}
+_HEX_DIGITS = frozenset(b'0123456789abcdefABCDEF')
+
+
+class ImportException(Exception): pass
+class RedisImportSource:
+    '''
+    Every key of a standalone instance as a RESTORE command, read with SCAN
+    and one pipelined PTTL + DUMP round trip per batch.
+    '''
+    def __init__(self, addr, password=None, batch=IMPORT_BATCH, match=None, replace=False):
+        self._addr = addr
+        self._password = password
+        self._batch = batch
+        self._match = match
+        self._replace = replace
+
+    def batches(self):
+        host, port = ParseHelper.parse_addr(self._addr)
+        r = ProfiledRedis(host, port, password=self._password,
+                          socket_timeout=SOCKET_TIMEOUT,
+                          socket_connect_timeout=SOCKET_CONNECT_TIMEOUT)
+        extra = (b'REPLACE',) if self._replace else ()
+        cursor = 0
+        try:
+            while True:
+                cursor, keys = r.scan(cursor, match=self._match, count=self._batch)
+                if keys:
+                    pipe = r.pipeline(transaction=False)
+                    for key in keys:
+                        pipe.pttl(key)
+                        pipe.dump(key)
+                    replies = pipe.execute()
+                    # Keys that expired or were deleted since SCAN have no payload.
+                    yield [(b'RESTORE', key, max(ttl, 0), payload) + extra
+                           for key, ttl, payload in zip(keys, replies[::2], replies[1::2])
+                           if payload is not None]
+                if cursor == 0:
+                    break
+        except redis.exceptions.RedisError as e:
+            raise ImportException(f"Sorry, can't read from '{self._addr}'. Reason: {e}")
+        finally:
+            r.close()
+
+
+class FileImportSource:
+    '''
+    Commands from a file, in batches: RESP arrays as written for
+    `redis-cli --pipe`, or one inline command per line (e.g. "SET key value"),
+    quoted as redis-cli and the server's inline protocol do.
+    The key is the first argument of each command.
+    '''
+    def __init__(self, path, batch=IMPORT_BATCH, read_size=IMPORT_READ_SIZE):
+        self._path = path
+        self._batch = batch
+        self._read_size = read_size
+
+    @staticmethod
+    def parse(buf, pos=0):
+        '''
+        Complete commands in buf from pos on, and where the unparsed rest starts.
+        '''
+        commands = []
+        size = len(buf)
+        while pos < size:
+            end = buf.find(b'\r\n' if buf[pos] == 42 else b'\n', pos)
+            if end == -1:
+                break
+            if buf[pos] != 42:  # '*'
+                args = FileImportSource.split_inline(bytes(buf[pos:end]))
+                pos = end + 1
+                if args:
+                    commands.append(args)
+                continue
+            args = []
+            cur = end + 2
+            for _ in range(int(buf[pos + 1:end])):
+                end = buf.find(b'\r\n', cur)
+                if end == -1:
+                    break
+                length = int(buf[cur + 1:end])
+                if end + 4 + length > size:
+                    break
+                args.append(bytes(buf[end + 2:end + 2 + length]))
+                cur = end + 4 + length
+            else:
+                commands.append(args)
+                pos = cur
+                continue
+            break
+        return commands, pos
+
+    @staticmethod
+    def split_inline(line):
+        '''
+        Split an inline command like Redis' sdssplitargs: "double quotes"
+        take \\n, \\t, \\xHH and similar escapes, 'single quotes' only \\',
+        and a closing quote must end the argument.
+        '''
+        if b'"' not in line and b"'" not in line:
+            return line.split()
+        args = []
+        i, size = 0, len(line)
+        while True:
+            while i < size and line[i] in b' \t\r\n\v\f':
+                i += 1
+            if i == size:
+                return args
+            arg = bytearray()
+            quote = None
+            while True:
+                if i == size:
+                    if quote is not None:
+                        raise ImportException(f"Unbalanced quotes in {line!r}")
+                    break
+                c = line[i]
+                if quote is None:
+                    if c in b' \t\r\n\v\f':
+                        break
+                    if c in b'"\'':
+                        quote = c
+                    else:
+                        arg.append(c)
+                elif c == quote:
+                    if i + 1 < size and line[i + 1] not in b' \t\r\n\v\f':
+                        raise ImportException(f"Closing quote must be followed by a "
+                                              f"space in {line!r}")
+                    i += 1
+                    break
+                elif c == 92 and i + 1 < size:  # backslash
+                    nxt = line[i + 1]
+                    if quote == 39:
+                        if nxt == 39:
+                            arg.append(39)
+                            i += 1
+                        else:
+                            arg.append(c)
+                    elif (nxt == ord('x') and i + 3 < size and line[i + 2] in _HEX_DIGITS
+                            and line[i + 3] in _HEX_DIGITS):
+                        arg.append(int(line[i + 2:i + 4], 16))
+                        i += 3
+                    else:
+                        arg.append(_INLINE_ESCAPES.get(nxt, nxt))
+                        i += 1
+                else:
+                    arg.append(c)
+                i += 1
+            args.append(bytes(arg))
+
+    def batches(self):
+        buf = bytearray()
+        batch = []
+        with open(self._path, 'rb') as f:
+            while True:
+                chunk = f.read(self._read_size)
+                buf += chunk
+                # At EOF a last inline command may lack its newline.
+                if not chunk and buf and not buf.endswith(b'\n'):
+                    buf += b'\n'
+                try:
+                    commands, pos = self.parse(buf)
+                except ImportException as e:
+                    raise ImportException(f"{e} in {self._path}") from None
+                del buf[:pos]
+                for command in commands:
+                    if len(command) < 2:
+                        raise ImportException(f"Command without a key in {self._path}: "
+                                              f"{command!r}")
+                    batch.append(command)
+                    if len(batch) >= self._batch:
+                        yield batch
+                        batch = []
+                if not chunk:
+                    break
+        if buf.strip():
+            raise ImportException(f"Truncated command at the end of {self._path}")
+        if batch:
+            yield batch
+
+
+class ImportCluster:
+    '''
+    Route commands from a source to the masters owning their keys. Slots
+    are hashed per batch, commands are grouped per master and each master
+    has its own writer sending pipelines of `batch` commands. A writer's
+    queue holds at most `queue_size` batches, and reading the source blocks
+    while it is full, so memory stays bounded whatever the source size.
+    '''
+    def __init__(self, nodes, source, batch=IMPORT_BATCH, queue_size=IMPORT_QUEUE):
+        self._nodes = nodes
+        self._source = source
+        self._batch = batch
+        self._queue_size = queue_size
+        self._imported = 0
+        self._errors = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def imported(self):
+        return self._imported
+
+    @property
+    def errors(self):
+        return self._errors
+
+    def _owners(self, masters):
+        owners = array('h', [-1]) * CLUSTER_HASH_SLOTS
+        for i, master in enumerate(masters):
+            for slot in master.slots:
+                owners[slot] = i
+        return owners
+
+    def _fail(self, message, count=1):
+        with self._lock:
+            self._errors[message] += count
+
+    def _write(self, node, commands):
+        while True:
+            batch = commands.get()
+            if batch is None:
+                return
+            try:
+                replies = node.call(batch, binary=True)
+            except redis.exceptions.RedisError as e:
+                # Keep draining, or the reader would block on a full queue.
+                self._fail(f"{node}: {e}", len(batch))
+                continue
+            failed = [r for r in replies if isinstance(r, Exception)]
+            for error in failed:
+                message = str(error)
+                if message.startswith(('MOVED', 'ASK')):
+                    # One group for all the slots that moved mid-import.
+                    message = f"{message.split(' ', 1)[0]}: slot moved during the import"
+                self._fail(message)
+            with self._lock:
+                self._imported += len(batch) - len(failed)
+            if command_profile.enabled:
+                command_profile.add_bytes(node, sum(len(arg) for args in batch for arg in args
+                                                    if isinstance(arg, (bytes, str))))
+
+    def _put(self, q, item, writer):
+        '''
+        Queue item for a writer. False when the writer is gone, rather than
+        blocking forever on its full queue.
+        '''
+        while True:
+            try:
+                q.put(item, timeout=IMPORT_QUEUE_TIMEOUT)
+                return True
+            except queue.Full:
+                if writer.done():
+                    return False
+
+    def run(self):
+        masters = list(self._nodes.masters)
+        owners = self._owners(masters)
+        queues = [queue.Queue(maxsize=self._queue_size) for _ in masters]
+        pending = [[] for _ in masters]
+        started = last = time.monotonic()
+        read = 0
+
+        with ThreadPoolExecutor(max_workers=len(masters)) as executor:
+            writers = [executor.submit(self._write, m, q) for m, q in zip(masters, queues)]
             try:
-                self._src.migrate(self._dst, keys_in_slot, self._password)
-            except redis.exceptions.ResponseError as e:
-                if self._fix and str(e).find('BUSYKEY'):
-                    self._src.migrate(dst.host, dst.port, keys_in_slot,
-                        timeout, auth=self._password, replace=True)
+                for commands in self._source.batches():
+                    slots = key_slots([command[1] for command in commands])
+                    for command, slot in zip(commands, slots):
+                        i = owners[slot]
+                        if i < 0:
+                            self._fail(f"slot {slot} is not covered")
+                            continue
+                        pending[i].append(command)
+                        if len(pending[i]) >= self._batch:
+                            if not self._put(queues[i], pending[i], writers[i]):
+                                writers[i].result()
+                            pending[i] = []
+                    read += len(commands)
+                    if time.monotonic() - last >= IMPORT_PROGRESS_INTERVAL:
+                        last = time.monotonic()
+                        xprint.verbose(f"Import: {read} read, {self._imported} imported, "
+                                       f"{read / (last - started):.0f} keys/sec")
+                        xprint.event('import_progress', read=read, imported=self._imported,
+                                     errors=sum(self._errors.values()))
+                for i, commands in enumerate(pending):
+                    if commands and not self._put(queues[i], commands, writers[i]):
+                        writers[i].result()
+            finally:
+                for q, writer in zip(queues, writers):
+                    self._put(q, None, writer)
+            for writer in writers:
+                writer.result()
+
+        elapsed = time.monotonic() - started
+        xprint(f">>> Imported {self._imported} of {read} keys in {elapsed:.2f}s "
+               f"({self._imported / elapsed if elapsed else 0:.0f} keys/sec)")
+        for message, count in self._errors.most_common():
+            xprint.error(f"{count} key(s): {message}")
+        xprint.event('import_done', read=read, imported=self._imported,
+                     errors=dict(self._errors), elapsed=round(elapsed, 3))
         return self
 
+
+def _parse_weights(nodes, weights):
+    parsed = {}
+    for weight in weights or []:
+        name, sep, value = weight.partition('=')
+        if not sep:
+            raise ValueError(f"Invalid weight '{weight}' - use <node>=<weight> format")
+        matched = [n for n in nodes.masters
+                   if n.node_id.startswith(name) or str(n) == name]
+        if len(matched) != 1:
+            raise ValueError(f"Weight '{weight}' must match exactly one master")
+        parsed[matched[0].node_id] = float(value)
+    return parsed
+
+
+def _positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {value}")
+    return number
+
+
+def _load_nodes(args, manager):
+    if getattr(args, 'offline', False):
+        if not args.snapshot:
+            raise ValueError('--offline needs --snapshot')
+        return ClusterSnapshot.read(args.snapshot, args.password).nodes
+    if not args.addr:
+        raise ValueError('Give a node address, or --offline with --snapshot')
+    if args.snapshot:
+        return ClusterSnapshot.discover(args.snapshot, args.addr, args.password, manager)
+    return Nodes.discover(args.addr, args.password, raw=True, manager=manager)
+
+
+def command_check(args, manager):
+    nodes = _load_nodes(args, manager)
+    check = CheckCluster(nodes)
+    check.check()
+    return 1 if check.num_errors else 0
+
+
+def command_census(args, manager):
+    nodes = _load_nodes(args, manager)
+    census = SlotCensus.take(nodes, concurrency=args.concurrency)
+    xprint(f">>> {census.total_keys} keys in {len(list(nodes.masters))} masters")
+    census.show_top(args.top)
+    census.show_heatmap(args.buckets)
+    return 0
+
+
+def command_fleet(args, manager):
+    with open(args.inventory) as f:
+        clusters = FleetCheck.read_inventory(f)
+    fleet = FleetCheck(clusters, args.budget).run()
+    fleet.show_report()
+    return 1 if fleet.num_errors else 0
+
+
+def command_watch(args, manager):
+    watch = TopologyWatch(args.addr, args.password, manager, args.interval,
+                          args.concurrency)
+    try:
+        watch.run(args.count)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def command_call(args, manager):
+    nodes = _load_nodes(args, manager)
+    commands = [args.command] if args.command else []
+    if args.file:
+        with open(args.file) as f:
+            commands += CallCluster.read_commands(f)
+    if not commands:
+        raise ValueError('Nothing to call - give a command or --file')
+    call = CallCluster(nodes, commands, args.role, args.concurrency)
+    if args.stream:
+        call.run(on_result=call.show_result)
+    else:
+        call.run()
+        for node in call.targets:
+            call.show_result(node, call.results[node])
+    call.show_summary(args.field)
+    return 1 if call.errors() else 0
+
+
+def command_import(args, manager):
+    if bool(args.source) == bool(args.file):
+        raise ValueError('Give exactly one of --from or --file')
+    nodes = _load_nodes(args, manager)
+    check = CheckCluster(nodes)
+    check.check(quiet=True)
+    if check.num_errors:
+        xprint.error("Please fix your cluster problems before importing")
+        return 1
+    if args.source:
+        source = RedisImportSource(args.source, args.from_password, args.batch,
+                                   args.match, args.replace)
+    else:
+        source = FileImportSource(args.file, args.batch)
+    run = ImportCluster(nodes, source, args.batch, args.queue).run()
+    return 1 if run.errors else 0
+
+
+def command_create(args, manager):
+    nodes = CreateCluster(args.addrs, args.replicas, args.password, manager,
+                          concurrency=args.concurrency, timeout=args.timeout).create()
+    check = CheckCluster(nodes)
+    check.check()
+    return 1 if check.num_errors else 0
+
+
+def command_fix(args, manager):
+    nodes = _load_nodes(args, manager)
+    FixCluster(nodes, args.password, concurrency=args.concurrency,
+               per_node=args.per_node).fix()
+    return 0
+
+
+def command_rebalance(args, manager):
+    if args.offline and (not args.simulate or args.count_keys or args.resume):
+        raise ValueError('--offline can only plan: use it with --simulate, '
+                         'without --count-keys or --resume')
+    nodes = _load_nodes(args, manager)
+    options = dict(concurrency=args.concurrency, per_source=args.per_node,
+                   per_destination=args.per_node)
+    if args.max_keys or args.max_bytes or args.latency_ceiling:
+        options['throttle'] = MigrationThrottle(
+            args.max_keys, args.max_bytes,
+            args.latency_ceiling / 1000 if args.latency_ceiling else None)
+    if args.resume:
+        if not args.journal:
+            raise ValueError('--resume needs --journal')
+        ReshardScheduler.resume(nodes, args.journal, args.password, **options).run()
+        return 0
+
+    check = CheckCluster(nodes)
+    check.check(quiet=True)
+    if check.num_errors:
+        xprint.error("Please fix your cluster problems before rebalancing")
+        return 1
+
+    keys_in_slot = SlotCensus.take(nodes).keys_in_slot if args.count_keys else None
+    plan = RebalancePlanner(nodes, _parse_weights(nodes, args.weight), args.threshold,
+                            keys_in_slot, args.use_empty_masters).plan()
+    if not plan:
+        xprint.ok(f"No rebalancing needed! All nodes are within the "
+                  f"{args.threshold}% threshold.")
+        return 0
+    if args.simulate:
+        for slot, src, dst in plan:
+            xprint(f"Moving slot {slot} from {src} to {dst}")
+        return 0
+
+    journal = ReshardJournal(args.journal) if args.journal else None
+    ReshardScheduler(nodes, plan, args.password, journal=journal, **options).run()
+    return 0
+
+
+def main(argv=None):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--password', default=None)
+    common.add_argument('--verbose', action='store_true')
+    common.add_argument('--events', metavar='PATH',
+                        help="append JSON-lines events to PATH ('-' for stdout)")
+    common.add_argument('--snapshot', metavar='PATH',
+                        help='start from this topology snapshot and keep it up to date')
+    common.add_argument('--profile', choices=PROFILE_FORMATS,
+                        help='report per-node, per-command latency at the end')
+    common.add_argument('--profile-output', metavar='PATH',
+                        help='write the json or prometheus report to PATH')
+
+    parser = argparse.ArgumentParser(prog='redis-cm', description='Redis Cluster Manager')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    check = commands.add_parser('check', parents=[common])
+    check.add_argument('addr', nargs='?')
+    check.add_argument('--offline', action='store_true',
+                       help='check the --snapshot without connecting to the cluster')
+    check.set_defaults(func=command_check)
+
+    census = commands.add_parser('census', parents=[common])
+    census.add_argument('addr')
+    census.add_argument('--top', type=int, default=10,
+                        help='show this many slots with the most keys')
+    census.add_argument('--buckets', type=int, default=64,
+                        help='slot ranges in the heatmap')
+    census.add_argument('--concurrency', type=int, default=CENSUS_CONCURRENCY)
+    census.set_defaults(func=command_census)
+
+    fleet = commands.add_parser('fleet', parents=[common])
+    fleet.add_argument('inventory',
+                       help="one cluster per line: <name> <seed>[,<seed>...] [<password>]")
+    fleet.add_argument('--budget', type=int, default=FLEET_BUDGET,
+                       help='connections open at once across all clusters')
+    fleet.set_defaults(func=command_fleet)
+
+    watch = commands.add_parser('watch', parents=[common])
+    watch.add_argument('addr')
+    watch.add_argument('--interval', type=float, default=WATCH_INTERVAL,
+                       help='seconds between polls')
+    watch.add_argument('--count', type=int, help='stop after this many polls')
+    watch.add_argument('--concurrency', type=int, default=DISCOVERY_CONCURRENCY)
+    watch.set_defaults(func=command_watch)
+
+    call = commands.add_parser('call', parents=[common])
+    call.add_argument('addr')
+    call.add_argument('command', nargs=argparse.REMAINDER,
+                      help='command and arguments; call options go before addr')
+    call.add_argument('--file', help='commands to pipeline, one per line')
+    call.add_argument('--role', choices=CALL_ROLES, default='all')
+    call.add_argument('--stream', action='store_true',
+                      help='print each node as soon as it answers')
+    call.add_argument('--field', action='append',
+                      help='only aggregate these numeric fields, e.g. used_memory')
+    call.add_argument('--concurrency', type=int, default=DISCOVERY_CONCURRENCY)
+    call.set_defaults(func=command_call)
+
+    import_ = commands.add_parser('import', parents=[common])
+    import_.add_argument('addr')
+    import_.add_argument('--from', dest='source', metavar='ADDR',
+                         help='standalone instance to copy with SCAN + DUMP/RESTORE')
+    import_.add_argument('--from-password', default=None)
+    import_.add_argument('--match', help='only keys matching this SCAN pattern')
+    import_.add_argument('--replace', action='store_true',
+                         help='overwrite keys that already exist in the cluster')
+    import_.add_argument('--file', help='RESP or inline commands, as for redis-cli --pipe')
+    import_.add_argument('--batch', type=int, default=IMPORT_BATCH,
+                         help='commands per pipeline')
+    import_.add_argument('--queue', type=int, default=IMPORT_QUEUE,
+                         help='pipelines buffered per master before reading blocks')
+    import_.set_defaults(func=command_import)
+
+    create = commands.add_parser('create', parents=[common])
+    create.add_argument('addrs', nargs='+', metavar='addr')
+    create.add_argument('--replicas', type=int, default=0)
+    create.add_argument('--concurrency', type=int, default=DISCOVERY_CONCURRENCY)
+    create.add_argument('--timeout', type=float, default=CONVERGENCE_TIMEOUT,
+                        help='seconds to wait for the nodes to agree')
+    create.set_defaults(func=command_create)
+
+    fix = commands.add_parser('fix', parents=[common])
+    fix.add_argument('addr')
+    fix.add_argument('--concurrency', type=int, default=RESHARD_CONCURRENCY)
+    fix.add_argument('--per-node', type=_positive_int, default=RESHARD_PER_SOURCE,
+                     help='concurrent slot fixes touching the same node')
+    fix.set_defaults(func=command_fix)
+
+    rebalance = commands.add_parser('rebalance', parents=[common])
+    rebalance.add_argument('addr', nargs='?')
+    rebalance.add_argument('--offline', action='store_true',
+                           help='plan from the --snapshot without connecting to the cluster')
+    rebalance.add_argument('--weight', action='append', metavar='NODE=WEIGHT')
+    rebalance.add_argument('--threshold', type=float, default=REBALANCE_THRESHOLD)
+    rebalance.add_argument('--use-empty-masters', action='store_true')
+    rebalance.add_argument('--count-keys', action='store_true',
+                           help='prefer moving slots with fewer keys')
+    rebalance.add_argument('--concurrency', type=int, default=RESHARD_CONCURRENCY)
+    rebalance.add_argument('--per-node', type=_positive_int, default=RESHARD_PER_SOURCE,
+                           help='concurrent slot migrations per source/destination node')
+    rebalance.add_argument('--journal', help='append-only journal of the reshard')
+    rebalance.add_argument('--resume', action='store_true',
+                           help='resume the reshard recorded in --journal')
+    rebalance.add_argument('--max-keys', type=float, metavar='KEYS/SEC',
+                           help='cap on keys migrated per second, for the whole job')
+    rebalance.add_argument('--max-bytes', type=float, metavar='BYTES/SEC',
+                           help='cap on bytes migrated per second, for the whole job')
+    rebalance.add_argument('--latency-ceiling', type=float, metavar='MS',
+                           help='slow down migrations while node latency is above this')
+    rebalance.add_argument('--simulate', action='store_true')
+    rebalance.set_defaults(func=command_rebalance)
+
+    args = parser.parse_args(argv)
+    if args.verbose:
+        xprint.set_loglevel(LOG_LEVEL_VERBOSE)
+    if args.events:
+        xprint.set_event_sink(args.events)
+    command_profile.enabled = args.profile is not None
+    command_profile.reset()
+
+    with ConnectionManager(args.password) as manager:
+        try:
+            return args.func(args, manager)
+        except (NodeException, CreateException, ImportException, ReshardException,
+                ReshardJournalException, FixException, SnapshotException,
+                FleetException, ValueError) as e:
+            xprint.error(str(e))
+            return 1
+        finally:
+            if args.profile:
+                command_profile.report(args.profile, args.profile_output)
+            if args.events:
+                xprint.set_event_sink(None)
+            xprint.flush()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
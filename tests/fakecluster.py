@@ -0,0 +1,712 @@
+'''
+In-process stand-in for a Redis Cluster: a small RESP server that plays any
+number of cluster nodes on 127.0.0.1, one listening port per node, all
+served from a single background thread.
+
+    with FakeCluster(masters=3, replicas=1, keys_per_slot=2) as cluster:
+        nodes = Nodes.discover([cluster.seed])
+
+Only what redis_cm needs is implemented: PING/AUTH/HELLO/INFO/CLIENT,
+CLUSTER NODES/INFO/MYID/SETSLOT/ADDSLOTS/ADDSLOTSRANGE/DELSLOTS/BUMPEPOCH/
+MEET/REPLICATE/SET-CONFIG-EPOCH/GETKEYSINSLOT/COUNTKEYSINSLOT, MIGRATE,
+MEMORY USAGE, LATENCY LATEST, MULTI/EXEC, SCAN/DUMP/RESTORE and a few key
+commands. Slot ownership is kept once for the whole cluster, as if gossip
+converged instantly; MIGRATING/IMPORTING states, config epochs and the set
+of known nodes (grown by MEET) are per node. `joined=False` starts the nodes
+unaware of each other, as for `create`; like real nodes, they report an
+empty IP for themselves until they take part in a MEET. `hosts` spreads
+the nodes over that many loopback addresses (127.0.0.1, 127.0.0.2, ...).
+`latency` delays every reply of a node without blocking the others, and a
+node set `down` drops its connections as if it had crashed.
+'''
+import hashlib
+import heapq
+import selectors
+import socket
+import threading
+import time
+from collections import Counter
+
+CLUSTER_HASH_SLOTS = 16384
+
+
+def _crc16_table():
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else crc << 1
+        table.append(crc & 0xffff)
+    return table
+
+
+_CRC16_TABLE = _crc16_table()
+
+
+def key_slot(key):
+    if isinstance(key, str):
+        key = key.encode(errors='surrogateescape')
+    start = key.find(b'{')
+    if start != -1:
+        end = key.find(b'}', start + 1)
+        if end > start + 1:
+            key = key[start + 1:end]
+    crc = 0
+    for byte in key:
+        crc = ((crc << 8) & 0xffff) ^ _CRC16_TABLE[((crc >> 8) ^ byte) & 0xff]
+    return crc % CLUSTER_HASH_SLOTS
+
+
+class Error(Exception):
+    pass
+
+
+class Status(str):
+    pass
+
+
+OK = Status('OK')
+
+
+def encode(reply):
+    if isinstance(reply, Status):
+        return b'+' + reply.encode() + b'\r\n'
+    if isinstance(reply, Error):
+        return b'-' + str(reply).encode() + b'\r\n'
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, bool):
+        reply = int(reply)
+    if isinstance(reply, int):
+        return b':%d\r\n' % reply
+    if isinstance(reply, str):
+        reply = reply.encode(errors='surrogateescape')
+    if isinstance(reply, bytes):
+        return b'$%d\r\n%s\r\n' % (len(reply), reply)
+    if isinstance(reply, dict):
+        return b'%%%d\r\n' % len(reply) + b''.join(
+            encode(k) + encode(v) for k, v in reply.items())
+    return b'*%d\r\n' % len(reply) + b''.join(encode(r) for r in reply)
+
+
+def parse_commands(buf):
+    '''
+    Split complete RESP arrays of bulk strings off `buf`.
+    Returns (commands, unconsumed bytes).
+    '''
+    commands = []
+    pos = 0
+    while pos < len(buf):
+        if buf[pos:pos + 1] != b'*':
+            # Inline command, e.g. from redis-cli or telnet.
+            end = buf.find(b'\r\n', pos)
+            if end == -1:
+                break
+            commands.append(buf[pos:end].split())
+            pos = end + 2
+            continue
+        end = buf.find(b'\r\n', pos)
+        if end == -1:
+            break
+        argc = int(buf[pos + 1:end])
+        cur = end + 2
+        args = []
+        for _ in range(argc):
+            end = buf.find(b'\r\n', cur)
+            if end == -1:
+                break
+            size = int(buf[cur + 1:end])
+            if end + 2 + size + 2 > len(buf):
+                break
+            args.append(buf[end + 2:end + 2 + size])
+            cur = end + 2 + size + 2
+        if len(args) < argc:
+            break
+        commands.append(args)
+        pos = cur
+    return commands, buf[pos:]
+
+
+class FakeNode:
+    def __init__(self, cluster, index, sock):
+        self.cluster = cluster
+        self.sock = sock
+        self.host, self.port = sock.getsockname()
+        self.node_id = hashlib.sha1(b'fake-node-%d' % index).hexdigest()
+        self.met = False
+        self.down = False
+        self.master = None
+        self.config_epoch = 0
+        self.latency = 0.0
+        self.keys = {}
+        self.slot_of = {}
+        self.migrating = {}
+        self.importing = {}
+        self.calls = Counter()
+        self.known = {self}
+
+    @property
+    def addr(self):
+        return f"{self.host}:{self.port}"
+
+    def is_master(self):
+        return self.master is None
+
+    def __repr__(self):
+        return f"FakeNode({self.addr})"
+
+    def put(self, key, value, slot=None):
+        slot = key_slot(key) if slot is None else slot
+        old = self.slot_of.get(key)
+        if old is not None and old != slot:
+            del self.keys[old][key]
+        self.keys.setdefault(slot, {})[key] = value
+        self.slot_of[key] = slot
+
+    def pop(self, key):
+        slot = self.slot_of.pop(key)
+        value = self.keys[slot].pop(key)
+        if not self.keys[slot]:
+            del self.keys[slot]
+        return slot, value
+
+    def count_keys(self, slot):
+        return len(self.keys.get(slot, ()))
+
+
+class Connection:
+    def __init__(self, node, sock):
+        self.node = node
+        self.sock = sock
+        self.buf = b''
+        self.authed = node.cluster.password is None
+        self.multi = None
+
+
+class FakeCluster:
+    def __init__(self, masters=3, replicas=0, keys_per_slot=0, value_size=100,
+                 latency=0.0, password=None, assign_slots=True, joined=True, hosts=1):
+        self.password = password
+        self._hosts = hosts
+        self.current_epoch = 0
+        self.owner = [None] * CLUSTER_HASH_SLOTS
+        self.nodes = []
+        self._by_addr = {}
+        self._by_id = {}
+        self._nodes_lines = None
+        self._nodes_text = {}
+        self._selector = selectors.DefaultSelector()
+        self._pending = []
+        self._seq = 0
+        self._lock = threading.RLock()
+        self._thread = None
+        self._running = False
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+
+        for _ in range(masters * (replicas + 1)):
+            self.add_node(latency=latency)
+        if not joined:
+            # Freshly started nodes: alone, epoch 0, no slots, no replicas.
+            for node in self.nodes:
+                node.config_epoch = 0
+            return
+        everyone = set(self.nodes)
+        for node in self.nodes:
+            node.known = everyone
+            node.met = True
+        primaries = self.nodes[:masters]
+        for i, node in enumerate(self.nodes[masters:]):
+            node.master = primaries[i % masters]
+        if assign_slots and masters:
+            per_master = CLUSTER_HASH_SLOTS // masters
+            for i, node in enumerate(primaries):
+                start = i * per_master
+                end = CLUSTER_HASH_SLOTS if i == masters - 1 else start + per_master
+                self.assign(node, range(start, end))
+                if keys_per_slot:
+                    self.fill(node, range(start, end), keys_per_slot, value_size)
+
+    def add_node(self, latency=0.0):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((f"127.0.0.{len(self.nodes) % self._hosts + 1}", 0))
+        sock.listen(128)
+        sock.setblocking(False)
+        with self._lock:
+            node = FakeNode(self, len(self.nodes), sock)
+            node.latency = latency
+            self.current_epoch += 1
+            node.config_epoch = self.current_epoch
+            self.nodes.append(node)
+            self._by_addr[node.addr] = node
+            self._by_id[node.node_id] = node
+            self._nodes_lines = None
+        self._selector.register(sock, selectors.EVENT_READ, node)
+        return node
+
+    @property
+    def seed(self):
+        return self.nodes[0].addr
+
+    @property
+    def masters(self):
+        return [n for n in self.nodes if n.is_master()]
+
+    def node(self, addr):
+        return self._by_addr[addr]
+
+    def assign(self, node, slots):
+        with self._lock:
+            for slot in slots:
+                self.owner[slot] = node
+            self._nodes_lines = None
+
+    def fill(self, node, slots, keys_per_slot, value_size=100):
+        value = b'x' * value_size
+        with self._lock:
+            for slot in slots:
+                for i in range(keys_per_slot):
+                    node.put(f"key:{slot}:{i}", value, slot)
+
+    def open_slot(self, slot, src, dst):
+        '''
+        Leave `slot` half-migrated from src to dst, as a crashed reshard would.
+        '''
+        with self._lock:
+            src.migrating[slot] = dst.node_id
+            dst.importing[slot] = src.node_id
+            self._nodes_lines = None
+
+    # -- server loop ------------------------------------------------------
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, name='fake-cluster', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._wakeup_w.fileno() < 0:
+            return
+        self._running = False
+        self._wakeup_w.send(b'x')
+        if self._thread is not None:
+            self._thread.join()
+        for key in list(self._selector.get_map().values()):
+            key.fileobj.close()
+        self._selector.close()
+        self._wakeup_w.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _serve(self):
+        while self._running:
+            timeout = None
+            if self._pending:
+                timeout = max(0, self._pending[0][0] - time.monotonic())
+            for key, _ in self._selector.select(timeout):
+                if key.fileobj is self._wakeup_r:
+                    self._wakeup_r.recv(4096)
+                elif isinstance(key.data, FakeNode):
+                    self._accept(key.fileobj, key.data)
+                else:
+                    self._read(key.data)
+            now = time.monotonic()
+            while self._pending and self._pending[0][0] <= now:
+                _, _, conn, data = heapq.heappop(self._pending)
+                self._send(conn, data)
+
+    def _accept(self, sock, node):
+        try:
+            client, _ = sock.accept()
+        except BlockingIOError:
+            return
+        if node.down:
+            client.close()
+            return
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._selector.register(client, selectors.EVENT_READ, Connection(node, client))
+
+    def _close(self, conn):
+        self._selector.unregister(conn.sock)
+        conn.sock.close()
+
+    def _send(self, conn, data):
+        if conn.sock.fileno() == -1:
+            return
+        try:
+            conn.sock.sendall(data)
+        except OSError:
+            self._close(conn)
+
+    def _read(self, conn):
+        try:
+            data = conn.sock.recv(65536)
+        except OSError:
+            data = b''
+        if not data or conn.node.down:
+            self._close(conn)
+            return
+        commands, conn.buf = parse_commands(conn.buf + data)
+        if not commands:
+            return
+        with self._lock:
+            out = b''.join(encode(self._execute(conn, args)) for args in commands)
+        if conn.node.latency:
+            self._seq += 1
+            heapq.heappush(self._pending,
+                           (time.monotonic() + conn.node.latency, self._seq, conn, out))
+        else:
+            self._send(conn, out)
+
+    # -- commands ---------------------------------------------------------
+
+    def _execute(self, conn, args):
+        if not args:
+            return Error('ERR empty command')
+        name = args[0].decode().upper()
+        conn.node.calls[name] += 1
+        if name == 'AUTH':
+            if self.password is None:
+                return Error('ERR AUTH called without any password configured')
+            if args[-1].decode() != self.password:
+                return Error('WRONGPASS invalid username-password pair')
+            conn.authed = True
+            return OK
+        if name == 'HELLO':
+            return self._cmd_hello(conn, conn.node, [a.decode(errors='surrogateescape') for a in args[1:]])
+        if not conn.authed and name not in ('HELLO', 'QUIT'):
+            return Error('NOAUTH Authentication required.')
+        if conn.multi is not None and name not in ('EXEC', 'DISCARD', 'MULTI'):
+            conn.multi.append(args)
+            return Status('QUEUED')
+        handler = getattr(self, f"_cmd_{name.lower()}", None)
+        if handler is None:
+            return Error(f"ERR unknown command '{name}'")
+        try:
+            return handler(conn, conn.node, [a.decode(errors='surrogateescape') for a in args[1:]])
+        except Error as e:
+            return e
+        except (IndexError, ValueError):
+            return Error(f"ERR wrong number of arguments for '{name}' command")
+
+    def _cmd_hello(self, conn, node, args):
+        proto = int(args[0]) if args else 2
+        if proto not in (2, 3):
+            return Error('NOPROTO unsupported protocol version')
+        options = [a.upper() for a in args]
+        if 'AUTH' in options:
+            if args[options.index('AUTH') + 2] != self.password:
+                return Error('WRONGPASS invalid username-password pair')
+            conn.authed = True
+        if not conn.authed:
+            return Error('NOAUTH HELLO must be called with the client already authenticated')
+        info = {'server': 'redis', 'version': '7.2.0', 'proto': proto, 'id': id(conn),
+                'mode': 'cluster', 'role': 'master' if node.is_master() else 'replica',
+                'modules': []}
+        if proto == 2:
+            return [item for pair in info.items() for item in pair]
+        return info
+
+    def _cmd_ping(self, conn, node, args):
+        return Status('PONG') if not args else args[0]
+
+    def _cmd_client(self, conn, node, args):
+        return OK
+
+    def _cmd_select(self, conn, node, args):
+        return OK
+
+    def _cmd_multi(self, conn, node, args):
+        conn.multi = []
+        return OK
+
+    def _cmd_discard(self, conn, node, args):
+        conn.multi = None
+        return OK
+
+    def _cmd_exec(self, conn, node, args):
+        queued, conn.multi = conn.multi, None
+        if queued is None:
+            return Error('ERR EXEC without MULTI')
+        return [self._execute(conn, a) for a in queued]
+
+    def _cmd_info(self, conn, node, args):
+        keys = len(node.slot_of)
+        return (f"# Server\r\nredis_version:7.2.0\r\nredis_mode:cluster\r\n"
+                f"tcp_port:{node.port}\r\n\r\n"
+                f"# Stats\r\ninstantaneous_ops_per_sec:{sum(node.calls.values())}\r\n\r\n"
+                f"# Replication\r\nrole:{'master' if node.is_master() else 'slave'}\r\n\r\n"
+                f"# Keyspace\r\n" + (f"db0:keys={keys},expires=0,avg_ttl=0\r\n" if keys else ''))
+
+    def _cmd_latency(self, conn, node, args):
+        return []
+
+    def _cmd_dbsize(self, conn, node, args):
+        return len(node.slot_of)
+
+    def _check_key_owner(self, node, key):
+        slot = key_slot(key)
+        owner = self.owner[slot]
+        if owner is not node and slot not in node.importing:
+            if owner is None:
+                raise Error('CLUSTERDOWN Hash slot not served')
+            raise Error(f"MOVED {slot} {owner.addr}")
+        return slot
+
+    def _cmd_set(self, conn, node, args):
+        slot = self._check_key_owner(node, args[0])
+        node.put(args[0], args[1].encode(errors='surrogateescape'), slot)
+        return OK
+
+    def _cmd_restore(self, conn, node, args):
+        slot = self._check_key_owner(node, args[0])
+        if args[0] in node.slot_of and 'REPLACE' not in (a.upper() for a in args[3:]):
+            raise Error('BUSYKEY Target key name already exists.')
+        node.put(args[0], args[2].encode(errors='surrogateescape'), slot)
+        return OK
+
+    def _cmd_dump(self, conn, node, args):
+        # The stored value stands in for the serialized payload.
+        slot = node.slot_of.get(args[0])
+        return None if slot is None else node.keys[slot][args[0]]
+
+    def _cmd_pttl(self, conn, node, args):
+        return -1 if args[0] in node.slot_of else -2
+
+    def _cmd_scan(self, conn, node, args):
+        cursor = int(args[0])
+        options = [a.upper() for a in args]
+        count = int(args[options.index('COUNT') + 1]) if 'COUNT' in options else 10
+        keys = sorted(node.slot_of)[cursor:cursor + count]
+        cursor = 0 if cursor + count >= len(node.slot_of) else cursor + count
+        return [str(cursor), keys]
+
+    def _cmd_get(self, conn, node, args):
+        self._check_key_owner(node, args[0])
+        slot = node.slot_of.get(args[0])
+        return None if slot is None else node.keys[slot][args[0]]
+
+    def _cmd_del(self, conn, node, args):
+        deleted = 0
+        for key in args:
+            if key in node.slot_of:
+                node.pop(key)
+                deleted += 1
+        return deleted
+
+    def _cmd_memory(self, conn, node, args):
+        if args[0].upper() != 'USAGE':
+            raise Error('ERR unknown subcommand')
+        slot = node.slot_of.get(args[1])
+        return None if slot is None else len(node.keys[slot][args[1]]) + 56
+
+    def _cmd_migrate(self, conn, node, args):
+        host, port, key, timeout = args[0], args[1], args[2], args[4]
+        dst = self._by_addr.get(f"{host}:{port}")
+        if dst is None:
+            return Error('IOERR error or timeout connecting to the client')
+        options = [a.upper() for a in args[5:]]
+        replace = 'REPLACE' in options
+        copy = 'COPY' in options
+        if self.password is not None:
+            if 'AUTH' not in options or args[5 + options.index('AUTH') + 1] != self.password:
+                return Error('ERR Target instance replied with error: NOAUTH '
+                             'Authentication required.')
+        keys = args[5 + options.index('KEYS') + 1:] if 'KEYS' in options else [key]
+        keys = [k for k in keys if k in node.slot_of]
+        if not keys:
+            return Status('NOKEY')
+        for k in keys:
+            slot = node.slot_of[k]
+            if self.owner[slot] is not dst and slot not in dst.importing:
+                return Error(f"ERR Target instance replied with error: MOVED {slot} "
+                             f"{self.owner[slot].addr if self.owner[slot] else '-'}")
+            if k in dst.slot_of and not replace:
+                return Error('BUSYKEY Target key name already exists.')
+        for k in keys:
+            if copy:
+                slot = node.slot_of[k]
+                value = node.keys[slot][k]
+            else:
+                slot, value = node.pop(k)
+            dst.put(k, value, slot)
+        return OK
+
+    def _cmd_cluster(self, conn, node, args):
+        sub = args[0].upper()
+        node.calls[f"CLUSTER {sub}"] += 1
+        handler = getattr(self, f"_cluster_{sub.lower().replace('-', '_')}", None)
+        if handler is None:
+            return Error(f"ERR unknown subcommand '{sub}'")
+        return handler(node, args[1:])
+
+    def _cluster_myid(self, node, args):
+        return node.node_id
+
+    def _cluster_info(self, node, args):
+        known = node.known
+        assigned = sum(1 for owner in self.owner if owner is not None and owner in known)
+        state = 'ok' if assigned == CLUSTER_HASH_SLOTS else 'fail'
+        return (f"cluster_state:{state}\r\ncluster_slots_assigned:{assigned}\r\n"
+                f"cluster_slots_ok:{assigned}\r\ncluster_slots_pfail:0\r\n"
+                f"cluster_slots_fail:0\r\ncluster_known_nodes:{len(known)}\r\n"
+                f"cluster_size:{len({o for o in self.owner if o in known})}\r\n"
+                f"cluster_current_epoch:{self.current_epoch}\r\n"
+                f"cluster_my_epoch:{(node.master or node).config_epoch}\r\n")
+
+    def _slot_ranges(self):
+        ranges = {}
+        start = None
+        for slot in range(CLUSTER_HASH_SLOTS + 1):
+            owner = self.owner[slot] if slot < CLUSTER_HASH_SLOTS else None
+            if start is not None and owner is not self.owner[start]:
+                end = slot - 1
+                ranges.setdefault(self.owner[start], []).append(
+                    str(start) if start == end else f"{start}-{end}")
+                start = None
+            if start is None and owner is not None:
+                start = slot
+        return ranges
+
+    def _node_lines(self):
+        if self._nodes_lines is None:
+            ranges = self._slot_ranges()
+            lines = {}
+            for n in self.nodes:
+                role = 'master' if n.is_master() else 'slave'
+                master_id = n.master.node_id if n.master else '-'
+                epoch = (n.master or n).config_epoch
+                lines[n] = (f"{n.node_id} {n.addr}@{n.port + 10000} {{}}{role} {master_id} "
+                            f"0 0 {epoch} connected", ' '.join(ranges.get(n, ())))
+            self._nodes_lines = lines
+            self._nodes_text = {}
+        return self._nodes_lines
+
+    def _cluster_nodes(self, node, args):
+        lines = self._node_lines()
+        text = self._nodes_text.get(node)
+        if text is None:
+            text = self._nodes_text[node] = self._render_nodes(node, lines)
+        return text
+
+    def _render_nodes(self, node, lines):
+        out = []
+        for n, (line, slots) in lines.items():
+            if n not in node.known:
+                continue
+            line = line.format('myself,' if n is node else '')
+            if n is node and not n.met:
+                line = line.replace(f" {n.host}:", ' :', 1)
+            if n is node:
+                states = [f"[{s}->-{d}]" for s, d in sorted(n.migrating.items())] + \
+                         [f"[{s}-<-{d}]" for s, d in sorted(n.importing.items())]
+                slots = ' '.join(filter(None, [slots] + states))
+            out.append(f"{line} {slots}" if slots else line)
+        return '\n'.join(out) + '\n'
+
+    def _cluster_bumpepoch(self, node, args):
+        self.current_epoch += 1
+        node.config_epoch = self.current_epoch
+        self._nodes_lines = None
+        return Status(f"BUMPED {node.config_epoch}")
+
+    def _cluster_meet(self, node, args):
+        other = self._by_addr.get(f"{args[0]}:{args[1]}")
+        if other is None:
+            raise Error(f"ERR Invalid node address specified: {args[0]}:{args[1]}")
+        # Gossip spreads the news to both sides at once.
+        known = node.known | other.known
+        for n in known:
+            n.known = known
+        node.met = other.met = True
+        self._nodes_lines = None
+        return OK
+
+    def _cluster_set_config_epoch(self, node, args):
+        if len(node.known) > 1:
+            raise Error('ERR The user can assign a config epoch only when the node '
+                        'does not know any other node.')
+        if node.config_epoch:
+            raise Error('ERR Node config epoch is already non-zero')
+        node.config_epoch = int(args[0])
+        self.current_epoch = max(self.current_epoch, node.config_epoch)
+        self._nodes_lines = None
+        return OK
+
+    def _cluster_replicate(self, node, args):
+        master = self._by_id.get(args[0])
+        if master is None or master not in node.known:
+            raise Error(f"ERR Unknown node {args[0]}")
+        if any(owner is node for owner in self.owner):
+            raise Error('ERR To set a master the node must be empty and without '
+                        'assigned slots.')
+        node.master = master
+        self._nodes_lines = None
+        return OK
+
+    def _change_slots(self, node, slots, add):
+        for slot in slots:
+            if not 0 <= slot < CLUSTER_HASH_SLOTS:
+                raise Error('ERR Invalid or out of range slot')
+            if add and self.owner[slot] is not None:
+                raise Error(f"ERR Slot {slot} is already busy")
+            if not add and self.owner[slot] is None:
+                raise Error(f"ERR Slot {slot} is already unassigned")
+        self.assign(node if add else None, slots)
+        return OK
+
+    def _cluster_addslots(self, node, args):
+        return self._change_slots(node, [int(s) for s in args], True)
+
+    def _cluster_delslots(self, node, args):
+        return self._change_slots(node, [int(s) for s in args], False)
+
+    def _cluster_addslotsrange(self, node, args):
+        slots = []
+        for start, end in zip(args[::2], args[1::2]):
+            slots.extend(range(int(start), int(end) + 1))
+        return self._change_slots(node, slots, True)
+
+    def _cluster_countkeysinslot(self, node, args):
+        return node.count_keys(int(args[0]))
+
+    def _cluster_getkeysinslot(self, node, args):
+        keys = node.keys.get(int(args[0]), {})
+        count = int(args[1])
+        return [k for k, _ in zip(keys, range(count))]
+
+    def _cluster_setslot(self, node, args):
+        slot, action = int(args[0]), args[1].upper()
+        if action == 'STABLE':
+            node.migrating.pop(slot, None)
+            node.importing.pop(slot, None)
+        elif action == 'MIGRATING':
+            if self.owner[slot] is not node:
+                raise Error(f"ERR I'm not the owner of hash slot {slot}")
+            node.migrating[slot] = args[2]
+        elif action == 'IMPORTING':
+            if self.owner[slot] is node:
+                raise Error(f"ERR I'm already the owner of hash slot {slot}")
+            node.importing[slot] = args[2]
+        elif action == 'NODE':
+            target = self._by_id.get(args[2])
+            if target is None:
+                raise Error(f"ERR I don't know about node {args[2]}")
+            if self.owner[slot] is node and target is not node and node.count_keys(slot):
+                raise Error(f"ERR Can't assign hashslot {slot} to a different node "
+                            f"while I still hold keys for this hash slot.")
+            node.migrating.pop(slot, None)
+            if target is node and node.importing.pop(slot, None) is not None:
+                self._cluster_bumpepoch(node, [])
+            self.assign(target, [slot])
+        else:
+            raise Error('ERR Invalid CLUSTER SETSLOT action or number of arguments')
+        self._nodes_lines = None
+        return OK
@@ -35,12 +35,50 @@ def add_myself_to_flags(nodes, addr):
 
 def cluster_nodes_nodes():
     nodes_nodes = []
-    default_cluster_nodes = clear_myself_flag(cluster_nodes())
-    for addr, info in default_cluster_nodes.items():
-        node = Node(addr)
-        with patch.object(node, '_cluster_nodes',
-            return_value=add_myself_to_flags(default_cluster_nodes, addr)):
+    with patch.object(Node, '_cluster_nodes', autospec=True, side_effect=cluster_nodes_of):
+        for addr in cluster_nodes():
+            node = Node(addr)
             node.load_info()
-            nodes_nodes.append(node) 
+            nodes_nodes.append(node)
     return Nodes(nodes_nodes)
 
+
+def node_info(node):
+    '''
+    What a Node loaded about itself, as a dict for comparisons.
+    '''
+    return {'node_id': node.node_id, 'host': node.host, 'port': node.port,
+            'flags': node.flags, 'slots': node.slots, 'migrating': node.migrating,
+            'importing': node.importing, 'replicate': node.replicate}
+
+
+def cluster_nodes_of(node):
+    '''
+    CLUSTER NODES as seen from `node`, for patching Node._cluster_nodes
+    with autospec=True.
+    '''
+    default_cluster_nodes = clear_myself_flag(cluster_nodes())
+    for addr in default_cluster_nodes:
+        if addr.split('@')[0] == str(node):
+            return add_myself_to_flags(default_cluster_nodes, addr)
+    raise KeyError(str(node))
+
+
+def cluster_nodes_raw(nodes):
+    '''
+    Render a parsed CLUSTER NODES dict back to the raw reply text.
+    '''
+    lines = []
+    for addr, info in nodes.items():
+        slots = []
+        for s in info['slots']:
+            if len(s) == 3:
+                slot, direction, node_id = s
+                slots.append(f"{slot}{'->-' if direction == '>' else '-<-'}{node_id}")
+            else:
+                slots.append('-'.join(s))
+        lines.append(' '.join([info['node_id'], addr, info['flags'], info['master_id'],
+                               info['last_ping_sent'], info['last_pong_rcvd'], info['epoch'],
+                               'connected' if info['connected'] else 'disconnected',
+                               *slots]))
+    return '\n'.join(lines) + '\n'
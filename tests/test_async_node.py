@@ -0,0 +1,90 @@
+import inspect
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+import redis
+from redis_cm import AsyncConnectionManager, AsyncNode, AsyncNodes, NodeException, SlotSet
+from .fixture import cluster_nodes, cluster_nodes_of, cluster_nodes_nodes
+
+
+class testAsyncNode(unittest.IsolatedAsyncioTestCase):
+    async def testLoadInfo(self):
+        node = AsyncNode('192.168.56.102:7001')
+        node._r = MagicMock()
+        node._r.cluster = AsyncMock(return_value=cluster_nodes())
+        await node.load_info(with_friends=True)
+        node._r.cluster.assert_awaited_with('NODES')
+        self.assertEqual(node.node_id, '3f6f88e6607b65327fa581ca9bccf6793cc9a66f')
+        self.assertEqual(node.slots, SlotSet.from_range(0, 5460))
+        self.assertEqual(len(node.friends), 5)
+
+    async def testSetSlot(self):
+        node = AsyncNode('192.168.56.102:7001')
+        node._r = MagicMock()
+        node._r.cluster = AsyncMock()
+        target = MagicMock(node_id='5814ec708ca5f0e8e042c54c382e4834186e78c0')
+        await node.cluster_setslot_migrating(5460, target)
+        node._r.cluster.assert_awaited_with(
+            'SETSLOT', 5460, 'MIGRATING', '5814ec708ca5f0e8e042c54c382e4834186e78c0')
+
+    async def testMigrateWithoutReadTimeout(self):
+        node = AsyncNode('192.168.56.102:7001')
+        node._r = AsyncMock()
+        target = MagicMock(host='192.168.56.102', port=7002)
+        with patch.object(redis.asyncio.StrictRedis, 'migrate',
+                          new_callable=AsyncMock) as migrate:
+            await node.migrate(target, ['a'], None)
+        migrate.assert_awaited_once()
+        node._r.migrate.assert_not_called()
+        client = node._blocking_r
+        self.assertIsNone(client.connection_pool.connection_kwargs['socket_timeout'])
+        await node.close()
+
+    async def testManager(self):
+        async with AsyncConnectionManager() as manager:
+            nodes = [AsyncNode('192.168.56.102:7001', manager=manager) for _ in range(2)]
+            with patch.object(redis.asyncio.StrictRedis, 'ping', new_callable=AsyncMock) as ping:
+                for node in nodes:
+                    await node.connect()
+            self.assertEqual(ping.await_count, 1)
+            self.assertIs(nodes[0]._r, nodes[1]._r)
+            self.assertIs(nodes[0]._blocking_client(), nodes[1]._blocking_client())
+            self.assertIsNone(nodes[0]._blocking_client()
+                              .connection_pool.connection_kwargs['socket_timeout'])
+            self.assertEqual(len(manager), 2)
+
+    def testOnlyAsyncCommands(self):
+        # Sync commands of Node aren't inherited: they would hand back
+        # un-awaited coroutines on the asyncio client.
+        for name in ('call', 'memory_usage', 'cluster_count_keys_in_slots', 'set_slot_owner',
+                     'fetch_config_digest', 'config_signature', 'ping_latency'):
+            self.assertFalse(hasattr(AsyncNode, name), name)
+        for name, attr in vars(AsyncNode).items():
+            if callable(attr) and not name.startswith('_'):
+                self.assertTrue(inspect.iscoroutinefunction(attr), name)
+        self.assertTrue(inspect.iscoroutinefunction(AsyncNodes._load_friends))
+
+    async def testDiscover(self):
+        async def connect(node):
+            if str(node) == '192.168.56.103:7002':
+                raise NodeException(f"Sorry, can't connect to node '{node}'.")
+
+        with patch.object(AsyncNode, 'connect', autospec=True, side_effect=connect), \
+             patch.object(AsyncNode, '_cluster_nodes', autospec=True,
+                          side_effect=cluster_nodes_of):
+            nodes = await AsyncNodes.discover('192.168.56.102:7001', concurrency=2)
+        expected = [n.node_id for n in cluster_nodes_nodes()
+                    if str(n) != '192.168.56.103:7002']
+        self.assertListEqual(sorted(n.node_id for n in nodes), sorted(expected))
+        self.assertListEqual(list(nodes.unreachable), ['192.168.56.103:7002'])
+        self.assertTrue(all(isinstance(n, AsyncNode) for n in nodes))
+
+    async def testDiscoverSeedFailsToLoad(self):
+        async def load(node):
+            if str(node) == '192.168.56.103:7002':
+                raise redis.exceptions.TimeoutError('Timeout reading from socket')
+            return cluster_nodes_of(node)
+
+        with patch.object(AsyncNode, 'connect', autospec=True), \
+             patch.object(AsyncNode, '_cluster_nodes', autospec=True, side_effect=load):
+            nodes = await AsyncNodes.discover(['192.168.56.103:7002', '192.168.56.102:7001'])
+        self.assertEqual(str(nodes[0]), '192.168.56.102:7001')
@@ -0,0 +1,58 @@
+import unittest
+import redis
+from redis_cm import CallCluster, ImportException, Nodes
+from tests.fakecluster import FakeCluster
+
+
+class testCallCluster(unittest.TestCase):
+    def setUp(self):
+        self.cluster = FakeCluster(masters=3, replicas=1, keys_per_slot=1).start()
+        self.addCleanup(self.cluster.stop)
+        self.nodes = Nodes.discover([self.cluster.seed], raw=True)
+
+    def testReadCommands(self):
+        lines = ['# warm up', 'SCRIPT LOAD "return 1"', '', '  CONFIG SET maxmemory 1gb']
+        self.assertListEqual(CallCluster.read_commands(lines),
+                             [['SCRIPT', 'LOAD', 'return 1'],
+                              ['CONFIG', 'SET', 'maxmemory', '1gb']])
+
+    def testReadCommandsInlineQuoting(self):
+        # Same rules as inline commands in an import file, not shell rules.
+        lines = [r'SET k "a\tb"', r"SET k 'it\'s'", r'SET k "\xff"']
+        self.assertListEqual(CallCluster.read_commands(lines),
+                             [['SET', 'k', 'a\tb'], ['SET', 'k', "it's"],
+                              ['SET', 'k', b'\xff']])
+        with self.assertRaises(ImportException):
+            CallCluster.read_commands(['SET k "open'])
+
+    def testRoles(self):
+        self.assertEqual(len(CallCluster(self.nodes, [], 'masters').targets), 3)
+        self.assertEqual(len(CallCluster(self.nodes, [], 'replicas').targets), 3)
+        self.assertEqual(len(CallCluster(self.nodes, [], 'all').targets), 6)
+        with self.assertRaises(ValueError):
+            CallCluster(self.nodes, [], 'primaries')
+
+    def testPipelinedAndAggregated(self):
+        call = CallCluster(self.nodes, [['DBSIZE'], ['INFO', 'keyspace'], ['NOPE']],
+                           role='masters')
+        streamed = []
+        call.run(on_result=lambda node, replies: streamed.append(node))
+        self.assertEqual(len(streamed), 3)
+        for n in self.cluster.masters:
+            self.assertEqual(n.calls['DBSIZE'], 1)
+
+        total, low, high = call.aggregate()[(0, '')]
+        self.assertEqual(total, 16384)
+        self.assertEqual((low[0], high[0]), (5461, 5462))
+        self.assertEqual(call.aggregate(['db0.keys'])[(1, 'db0.keys')][0], 16384)
+        self.assertNotIn((1, 'tcp_port'), call.aggregate(['db0.keys']))
+
+        errors = call.errors()
+        self.assertListEqual(list(errors), [(2, "unknown command 'NOPE'")])
+        self.assertEqual(len(errors[(2, "unknown command 'NOPE'")]), 3)
+
+    def testFormatReply(self):
+        self.assertEqual(CallCluster.format_reply({'db0': {'keys': 1, 'expires': 0}}),
+                         'db0:keys=1,expires=0')
+        self.assertEqual(CallCluster.format_reply(redis.exceptions.ResponseError('ERR x')),
+                         '(error) ERR x')
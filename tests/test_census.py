@@ -0,0 +1,79 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import MagicMock, patch
+from redis_cm import Node, SlotCensus, FixOpenSlot, main
+from .fakecluster import FakeCluster
+from .fixture import cluster_nodes_nodes
+
+
+def count_keys_in_slots(node, slots, pipeline):
+    # Every master holds (port + slot) % 7 keys in the slots it owns.
+    return [(node.port + slot) % 7 if slot in node.slots else 0 for slot in slots]
+
+
+class testSlotCensus(unittest.TestCase):
+    def setUp(self):
+        self._nodes = cluster_nodes_nodes()
+        with patch.object(Node, 'cluster_count_keys_in_slots', autospec=True,
+                          side_effect=count_keys_in_slots):
+            self._census = SlotCensus.take(self._nodes)
+
+    def testKeys(self):
+        for m in self._nodes.masters:
+            for slot in (0, 5460, 5461, 16383):
+                expected = (m.port + slot) % 7 if slot in m.slots else 0
+                self.assertEqual(self._census.keys(slot, m), expected)
+        self.assertEqual(self._census.keys(16383), (7003 + 16383) % 7)
+        self.assertEqual(len(self._census.keys_in_slot), 16384)
+
+    def testTopAndHeatmap(self):
+        top = self._census.top(5)
+        self.assertEqual(len(top), 5)
+        self.assertTrue(all(count == 6 for _, count in top))
+        heatmap = self._census.heatmap(64)
+        self.assertEqual(len(heatmap), 64)
+        self.assertEqual(sum(heatmap), self._census.total_keys)
+
+    def testFixOpenSlotUsesCensus(self):
+        fix = FixOpenSlot(self._nodes, 5460, census=self._census)
+        with patch.object(Node, 'cluster_count_keys_in_slot', autospec=True) as count:
+            best = fix.get_node_with_most_keys_in_slot(self._nodes.masters, 5460)
+        count.assert_not_called()
+        self.assertIn(5460, best.slots)
+
+
+class testCountKeysInSlots(unittest.TestCase):
+    def testPipelined(self):
+        node = Node('192.168.56.101:7001')
+        node._r = MagicMock()
+        queued = []
+        pipe = node._r.pipeline.return_value
+        pipe.cluster.side_effect = lambda command, slot: queued.append(slot)
+        pipe.execute.side_effect = lambda: [queued.pop(0) % 3 for _ in list(queued)]
+        counts = node.cluster_count_keys_in_slots(range(2500), pipeline=1000)
+        self.assertListEqual(counts, [slot % 3 for slot in range(2500)])
+        self.assertEqual(node._r.pipeline.call_count, 3)
+
+
+class testCensusCommand(unittest.TestCase):
+    def setUp(self):
+        self.cluster = FakeCluster(masters=3).start()
+        self.addCleanup(self.cluster.stop)
+
+    def testShowTopAndHeatmap(self):
+        owner = self.cluster.masters[0]
+        for slot, numkeys in ((7, 5), (100, 3), (200, 1)):
+            self.cluster.fill(owner, [slot], numkeys)
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self.assertEqual(main(['census', self.cluster.seed, '--top', '2',
+                                   '--buckets', '128']), 0)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], '>>> 9 keys in 3 masters')
+        self.assertListEqual(lines[1:4], ['>>> Top 2 slots by number of keys',
+                                          '   slot 7: 5 keys',
+                                          '   slot 100: 3 keys'])
+        self.assertEqual(lines[4], '>>> Keys per 128 slots (hottest 8 keys)')
+        self.assertListEqual(lines[5:], ['    0 |@.' + ' ' * 62 + '|',
+                                         ' 8192 |' + ' ' * 64 + '|'])
@@ -0,0 +1,58 @@
+import unittest
+from unittest.mock import patch
+from redis_cm import Node, CheckCluster, SlotSet
+from .fixture import (cluster_nodes, cluster_nodes_nodes, cluster_nodes_raw,
+                      clear_myself_flag, add_myself_to_flags)
+
+
+class testConfigDigest(unittest.TestCase):
+    def testRawMatchesParsed(self):
+        node = Node('192.168.56.102:7001')
+        with patch.object(Node, '_cluster_nodes', return_value=cluster_nodes()):
+            node.load_info()
+        digest = node.config_digest
+        with patch.object(Node, '_cluster_nodes_raw',
+                          return_value=cluster_nodes_raw(cluster_nodes())):
+            node.load_info(raw=True)
+        self.assertEqual(node.config_digest, digest)
+        self.assertEqual(len(digest), 32)
+
+
+class testCheckCluster(unittest.TestCase):
+    def setUp(self):
+        self._nodes = cluster_nodes_nodes()
+
+    def testConsistent(self):
+        check = CheckCluster(self._nodes)
+        self.assertTrue(check.is_config_consistent())
+        self.assertDictEqual(check.config_diff(), {})
+
+    def testInconsistent(self):
+        stale_addr = '192.168.56.103:7001@17001'
+        stale = clear_myself_flag(cluster_nodes())
+        stale['192.168.56.102:7001@17001']['slots'] = [['0', '5459']]
+        stale = add_myself_to_flags(stale, stale_addr)
+        node = next(n for n in self._nodes if str(n) == '192.168.56.103:7001')
+        with patch.object(Node, '_cluster_nodes', return_value=stale):
+            node.load_info()
+
+        def config_view(n):
+            nodes = stale if n is node else cluster_nodes()
+            return {info['node_id']: SlotSet(s for r in info['slots'] if len(r) != 3
+                                             for s in range(int(r[0]), int(r[-1]) + 1))
+                    for info in nodes.values() if info['slots']}
+
+        check = CheckCluster(self._nodes)
+        self.assertFalse(check.is_config_consistent())
+        with patch.object(Node, 'config_view', autospec=True, side_effect=config_view):
+            diff = check.config_diff()
+        self.assertListEqual(list(diff), [node])
+        self.assertDictEqual(diff[node], {
+            '3f6f88e6607b65327fa581ca9bccf6793cc9a66f':
+                (SlotSet.from_range(0, 5459), SlotSet.from_range(0, 5460))})
+
+    def testCheck(self):
+        check = CheckCluster(self._nodes)
+        check.check()
+        # The fixture has slot 5460 in migrating state.
+        self.assertEqual(check.num_errors, 1)
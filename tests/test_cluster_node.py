@@ -1,8 +1,8 @@
 import unittest
 from unittest.mock import patch
 import redis
-from redis_cm import Node, NodeException
-from .fixture import cluster_nodes
+from redis_cm import Node, NodeException, SlotSet
+from .fixture import cluster_nodes, node_info
 
 class testClusterNode(unittest.TestCase):
     def setUp(self):
@@ -17,12 +17,12 @@ class testClusterNode(unittest.TestCase):
                  'host': '192.168.56.102',
                  'port': 7001,
                  'flags': ['myself', 'master'], 
-                 'slots': list(range(0,5461)), 
+                 'slots': SlotSet.from_range(0, 5460), 
                  'migrating': {5460: '5814ec708ca5f0e8e042c54c382e4834186e78c0'},
                  'importing': {},
                  'replicate': None},
-                node._info)
-            self.assertListEqual(node.friends, [])
+                node_info(node))
+            self.assertEqual(node.friends, ())
  
     def testLoadInfoWithFriends(self):
         with patch.object(Node, '_cluster_nodes', return_value=self._cluster_nodes):
@@ -33,20 +33,20 @@ class testClusterNode(unittest.TestCase):
                  'host': '192.168.56.102',
                  'port': 7001,
                  'flags': ['myself', 'master'], 
-                 'slots': list(range(0,5461)), 
+                 'slots': SlotSet.from_range(0, 5460), 
                  'migrating': {5460: '5814ec708ca5f0e8e042c54c382e4834186e78c0'},
                  'importing': {},
                  'replicate': None},
-                node._info)
+                node_info(node))
             self.assertListEqual(
-                node.friends,
-                [{'192.168.56.101:7002': ['slave']},
-                 {'192.168.56.101:7003': ['master']},
-                 {'192.168.56.103:7001': ['slave']},
-                 {'192.168.56.102:7003': ['slave']},
-                 {'192.168.56.103:7002': ['master']}])
+                [(f.addr, f.flag_names()) for f in node.friends],
+                [('192.168.56.101:7002', ['slave']),
+                 ('192.168.56.101:7003', ['master']),
+                 ('192.168.56.103:7001', ['slave']),
+                 ('192.168.56.102:7003', ['slave']),
+                 ('192.168.56.103:7002', ['master'])])
 
-    @unittest.mock.patch('redis.StrictRedis')
+    @unittest.mock.patch('redis_cm.ProfiledRedis')
     def testConnect(self, mock_redis):
         r = unittest.mock.MagicMock()
         r.ping.return_value = None
@@ -56,7 +56,7 @@ class testClusterNode(unittest.TestCase):
         mock_redis.assert_called_with('192.168.56.101', 7001, password=None, socket_timeout=3, decode_responses=True)
         r.ping.assert_called()
 
-    @unittest.mock.patch('redis.StrictRedis')
+    @unittest.mock.patch('redis_cm.ProfiledRedis')
     def testConnect(self, mock_redis):
         r = unittest.mock.MagicMock()
         r.ping.side_effect = redis.exceptions.RedisError()
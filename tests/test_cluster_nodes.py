@@ -1,18 +1,91 @@
 import unittest
 from unittest.mock import patch
 import redis
-from redis_cm import Nodes
-from .fixture import cluster_nodes_nodes  
+from redis_cm import Node, NodeRecord, NodeRegistry, Nodes, NodeException, SlotSet
+from .fixture import cluster_nodes_nodes, cluster_nodes_of
 
 class testClusterNodes(unittest.TestCase):
     def setUp(self):
         self._cluster_nodes_nodes = cluster_nodes_nodes()
 
     def testCoveredSlots(self):
-        self.assertSetEqual(self._cluster_nodes_nodes.covered_slots, set(range(16384)))
+        self.assertEqual(self._cluster_nodes_nodes.covered_slots, SlotSet.all())
 
     def testOpenSlots(self):
-        self.assertListEqual(self._cluster_nodes_nodes.open_slots, [5460])
+        self.assertEqual(self._cluster_nodes_nodes.open_slots, SlotSet([5460]))
+
+    def testDiscover(self):
+        with patch.object(Node, 'connect', autospec=True), \
+             patch.object(Node, '_cluster_nodes', autospec=True,
+                          side_effect=cluster_nodes_of):
+            nodes = Nodes.discover(['192.168.56.102:7001'], concurrency=4)
+        self.assertListEqual(
+            sorted(n.node_id for n in nodes),
+            sorted(n.node_id for n in self._cluster_nodes_nodes))
+        self.assertDictEqual(nodes.unreachable, {})
+
+    def testDiscoverUnreachable(self):
+        def connect(node):
+            if str(node) == '192.168.56.103:7002':
+                raise NodeException(f"Sorry, can't connect to node '{node}'.")
+
+        with patch.object(Node, 'connect', autospec=True, side_effect=connect), \
+             patch.object(Node, '_cluster_nodes', autospec=True,
+                          side_effect=cluster_nodes_of):
+            nodes = Nodes.discover(['192.168.56.103:7002', '192.168.56.102:7001'])
+        self.assertEqual(len(list(nodes)), 5)
+        self.assertListEqual(list(nodes.unreachable), ['192.168.56.103:7002'])
+
+    def testDiscoverSeedFailsToLoad(self):
+        def load(node):
+            if str(node) == '192.168.56.103:7002':
+                raise redis.exceptions.ResponseError('ERR This instance has cluster support disabled')
+            return cluster_nodes_of(node)
+
+        with patch.object(Node, 'connect', autospec=True), \
+             patch.object(Node, '_cluster_nodes', autospec=True, side_effect=load):
+            nodes = Nodes.discover(['192.168.56.103:7002', '192.168.56.102:7001'])
+        self.assertEqual(str(nodes[0]), '192.168.56.102:7001')
+        with patch.object(Node, 'connect', autospec=True), \
+             patch.object(Node, '_cluster_nodes', autospec=True,
+                          side_effect=redis.exceptions.TimeoutError('Timeout reading')):
+            with self.assertRaises(NodeException):
+                Nodes.discover(['192.168.56.103:7002'])
+
+    def testIndexes(self):
+        nodes = self._cluster_nodes_nodes
+        a = nodes.get_by_node_id('3f6f88e6607b65327fa581ca9bccf6793cc9a66f')
+        self.assertEqual(str(a), '192.168.56.102:7001')
+        self.assertIsNone(nodes.get_by_node_id('unknown'))
+        self.assertIs(nodes.owner(0), a)
+        self.assertIs(nodes.owner(5460), a)
+        self.assertEqual(str(nodes.owner(16383)), '192.168.56.101:7003')
+        self.assertListEqual([str(r) for r in nodes.replicas_of(a)], ['192.168.56.103:7001'])
+        self.assertEqual(len(nodes.masters), 3)
+        self.assertEqual(len(nodes.replicas), 3)
+
+    def testDiscoverSharesFriends(self):
+        with patch.object(Node, 'connect', autospec=True), \
+             patch.object(Node, '_cluster_nodes', autospec=True,
+                          side_effect=cluster_nodes_of):
+            nodes = Nodes.discover(['192.168.56.102:7001'])
+        records = {}
+        for n in nodes:
+            for friend in n.friends:
+                self.assertIs(records.setdefault(friend.node_id, friend), friend)
+        self.assertEqual(len(records), 6)
+
+    def testRegistryKeepsDisagreeingViews(self):
+        def record(slots):
+            return NodeRecord('a' * 40, '10.0.0.1', 7000, 0, None, 1, True,
+                              SlotSet(slots), {}, {})
+        registry = NodeRegistry()
+        first = registry.share(record([1, 2]))
+        self.assertIs(registry.share(record([1, 2])), first)
+        # Another node still sees the slots before a move: not the same record.
+        stale = registry.share(record([1, 2, 3]))
+        self.assertIsNot(stale, first)
+        self.assertEqual(stale.slots, SlotSet([1, 2, 3]))
 
     def tearDown(self):
         pass
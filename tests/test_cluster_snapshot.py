@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+from redis_cm import (CheckCluster, ClusterSnapshot, Nodes, SnapshotException,
+                      CLUSTER_HASH_SLOTS)
+from tests.fakecluster import FakeCluster
+
+
+class testClusterSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.cluster = FakeCluster(masters=3, replicas=1).start()
+        self.addCleanup(self.cluster.stop)
+        fd, self.path = tempfile.mkstemp(suffix='.json.gz')
+        os.close(fd)
+        self.addCleanup(os.unlink, self.path)
+
+    def discover(self, **kwargs):
+        return ClusterSnapshot.discover(self.path, self.cluster.seed, **kwargs)
+
+    def calls(self, command):
+        return sum(n.calls[command] for n in self.cluster.nodes)
+
+    def testOffline(self):
+        live = Nodes.discover([self.cluster.seed], raw=True, epochs=True)
+        ClusterSnapshot.save(live, self.path)
+        self.cluster.stop()
+
+        nodes = ClusterSnapshot.read(self.path).nodes
+        self.assertEqual(len(nodes), 6)
+        self.assertSetEqual({n.node_id for n in nodes}, {n.node_id for n in live})
+        self.assertEqual(len(nodes.covered_slots), CLUSTER_HASH_SLOTS)
+        for master in live.masters:
+            restored = nodes.get_by_node_id(master.node_id)
+            self.assertEqual(restored.slots, master.slots)
+            self.assertEqual(len(nodes.replicas_of(restored)), 1)
+            self.assertEqual(restored.cluster_state, master.cluster_state)
+        check = CheckCluster(nodes)
+        check.check(quiet=True)
+        self.assertEqual(check.num_errors, 0)
+
+    def testRefreshOnlyChanged(self):
+        self.discover()
+        before, info = self.calls('CLUSTER NODES'), self.calls('CLUSTER INFO')
+        nodes = self.discover()
+        self.assertEqual(self.calls('CLUSTER NODES'), before)
+        self.assertEqual(self.calls('CLUSTER INFO'), info + 6)
+        self.assertEqual(len(nodes.masters), 3)
+
+        owner = self.cluster.owner[5]
+        other = next(n for n in self.cluster.masters if n is not owner)
+        self.cluster.open_slot(5, owner, other)
+        # Opening a slot moves no epoch: only the age bound catches it.
+        nodes = self.discover(max_age=0)
+        self.assertEqual(self.calls('CLUSTER NODES'), before + 6)
+        self.assertEqual(nodes.open_slots, {5})
+
+        # Nodes with open slots are reloaded every time.
+        before = self.calls('CLUSTER NODES')
+        self.discover()
+        self.assertEqual(self.calls('CLUSTER NODES'), before + 2)
+
+    def testUnreachableNodeBack(self):
+        down = self.cluster.masters[2]
+        down.down = True
+        nodes = self.discover()
+        self.assertEqual(len(nodes), 5)
+        self.assertListEqual(list(nodes.unreachable), [down.addr])
+
+        # Still down: the snapshot is used, and the node stays unreachable.
+        before = self.calls('CLUSTER NODES')
+        nodes = self.discover()
+        self.assertEqual(self.calls('CLUSTER NODES'), before)
+        self.assertListEqual(list(nodes.unreachable), [down.addr])
+
+        down.down = False
+        nodes = self.discover()
+        self.assertEqual(len(nodes), 6)
+        self.assertDictEqual(dict(nodes.unreachable), {})
+        self.assertEqual(len(nodes.covered_slots), CLUSTER_HASH_SLOTS)
+
+    def testMembershipChange(self):
+        self.discover()
+        joined = self.cluster.add_node()
+        for node in self.cluster.nodes:
+            node.known = set(self.cluster.nodes)
+        nodes = self.discover()
+        self.assertEqual(len(nodes), 7)
+        self.assertIsNotNone(nodes.get_by_node_id(joined.node_id))
+
+    def testUnusable(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not gzip')
+        with self.assertRaises(SnapshotException):
+            ClusterSnapshot.read(self.path)
+        self.assertEqual(len(self.discover()), 6)
+        ClusterSnapshot.read(self.path)
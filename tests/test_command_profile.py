@@ -0,0 +1,73 @@
+import json
+import os
+import tempfile
+import unittest
+from redis_cm import CommandStats, Nodes, SlotCensus, command_profile, CLUSTER_HASH_SLOTS
+from tests.fakecluster import FakeCluster
+
+
+class testCommandStats(unittest.TestCase):
+    def testQuantiles(self):
+        stats = CommandStats()
+        for ms in range(1, 101):
+            stats.add(ms / 1000)
+        stats.add(2.0, error=True)
+        self.assertEqual(stats.calls, 101)
+        self.assertEqual(stats.errors, 1)
+        self.assertEqual(stats.max, 2.0)
+        # Within one bucket (19%) of the exact value.
+        self.assertAlmostEqual(stats.p50, 0.051, delta=0.051 * 0.19)
+        self.assertAlmostEqual(stats.p99, 0.1, delta=0.1 * 0.19)
+        self.assertEqual(stats.quantile(1), 2.0)
+
+        merged = CommandStats().merge(stats).merge(stats)
+        self.assertEqual(merged.calls, 202)
+        self.assertEqual(merged.p50, stats.p50)
+
+
+class testCommandProfile(unittest.TestCase):
+    def setUp(self):
+        self.cluster = FakeCluster(masters=3, keys_per_slot=1).start()
+        self.addCleanup(self.cluster.stop)
+        command_profile.reset()
+        command_profile.enabled = True
+        self.addCleanup(setattr, command_profile, 'enabled', False)
+
+    def testRecords(self):
+        nodes = Nodes.discover([self.cluster.seed], raw=True)
+        SlotCensus.take(nodes)
+        master = nodes.masters[0]
+        master.call([['NOPE']])
+        command_profile.add_bytes(master, 100)
+
+        stats = command_profile.stats
+        addr = str(master)
+        self.assertEqual(stats[(addr, 'CLUSTER NODES')].calls, 1)
+        census = stats[(addr, 'CLUSTER COUNTKEYSINSLOT')]
+        self.assertEqual(census.commands, CLUSTER_HASH_SLOTS)
+        self.assertLess(census.calls, census.commands)
+        self.assertEqual(stats[(addr, 'NOPE')].errors, 1)
+        self.assertEqual(command_profile.by_command()['CLUSTER NODES'].calls, 3)
+        self.assertEqual(command_profile.by_node()[addr].calls,
+                         sum(s.calls for (a, _), s in stats.items() if a == addr))
+
+        report = command_profile.to_dict()
+        self.assertEqual(report['nodes'][addr]['bytes'], 100)
+        self.assertEqual(report['commands']['CLUSTER NODES']['calls'], 3)
+
+        text = command_profile.to_prometheus()
+        self.assertIn(f'redis_cm_command_duration_seconds_count{{node="{addr}",'
+                      f'command="CLUSTER NODES"}} 1', text)
+        self.assertIn(f'redis_cm_bytes_moved_total{{node="{addr}"}} 100', text)
+
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, path)
+        command_profile.report('json', path)
+        with open(path) as f:
+            self.assertEqual(json.load(f), json.loads(json.dumps(report)))
+
+    def testDisabled(self):
+        command_profile.enabled = False
+        Nodes.discover([self.cluster.seed], raw=True)
+        self.assertDictEqual(command_profile.stats, {})
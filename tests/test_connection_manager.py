@@ -0,0 +1,56 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import redis
+from redis_cm import ConnectionManager, Node, NodeException
+
+
+class testConnectionManager(unittest.TestCase):
+    @patch('redis_cm.ProfiledRedis')
+    @patch('redis.ConnectionPool')
+    def testDedupeEndpoints(self, mock_pool, mock_redis):
+        mock_redis.side_effect = lambda connection_pool: MagicMock()
+        manager = ConnectionManager(password='secret', socket_timeout=5)
+        a = manager.connect('192.168.56.101', 7001)
+        b = manager.connect('192.168.56.101', 7001)
+        c = manager.connect('192.168.56.101', 7002)
+        self.assertIs(a, b)
+        self.assertIsNot(a, c)
+        self.assertEqual(len(manager), 2)
+        a.ping.assert_called_once()
+        kwargs = mock_pool.call_args.kwargs
+        self.assertEqual(kwargs['password'], 'secret')
+        self.assertEqual(kwargs['socket_timeout'], 5)
+        self.assertTrue(kwargs['socket_keepalive'])
+
+    @patch('redis_cm.ProfiledRedis')
+    @patch('redis.ConnectionPool')
+    def testNodesShareClient(self, mock_pool, mock_redis):
+        mock_redis.side_effect = lambda connection_pool: MagicMock()
+        manager = ConnectionManager()
+        seed = Node('192.168.56.101:7001', manager=manager)
+        friend = Node('192.168.56.101:7001@17001', manager=manager)
+        seed.connect()
+        friend.connect()
+        self.assertIs(seed._r, friend._r)
+        mock_pool.assert_called_once()
+
+    @patch('redis_cm.ProfiledRedis')
+    @patch('redis.ConnectionPool')
+    def testFailedPingNotVerified(self, mock_pool, mock_redis):
+        r = MagicMock()
+        r.ping.side_effect = [redis.exceptions.ConnectionError(), True]
+        mock_redis.return_value = r
+        manager = ConnectionManager()
+        node = Node('192.168.56.101:7001', manager=manager)
+        with self.assertRaises(NodeException):
+            node.connect()
+        node.connect()
+        self.assertEqual(r.ping.call_count, 2)
+
+    @patch('redis_cm.ProfiledRedis')
+    @patch('redis.ConnectionPool')
+    def testClose(self, mock_pool, mock_redis):
+        with ConnectionManager() as manager:
+            client = manager.get('192.168.56.101', 7001)
+        client.connection_pool.disconnect.assert_called_once()
+        self.assertEqual(len(manager), 0)
@@ -0,0 +1,67 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from redis_cm import (CheckCluster, CreateCluster, CreateException, SlotSet,
+                      wait_with_backoff, CLUSTER_HASH_SLOTS)
+from tests.fakecluster import FakeCluster
+
+
+def node(host, name):
+    n = MagicMock()
+    n.host = ''
+    n.origin = (host, 7000)
+    n.__str__.return_value = name
+    return n
+
+
+class testCreateCluster(unittest.TestCase):
+    def testSlotRanges(self):
+        ranges = CreateCluster.slot_ranges(3)
+        self.assertListEqual([list(r.ranges()) for r in ranges],
+                             [[(0, 5460)], [(5461, 10921)], [(10922, 16383)]])
+        self.assertEqual(ranges[0] | ranges[1] | ranges[2], SlotSet.all())
+
+    def testAllocateSpreadsHosts(self):
+        nodes = [node(f"10.0.0.{i % 3}", f"n{i}") for i in range(6)]
+        masters, replicas = CreateCluster([], replicas=1).allocate(nodes)
+        self.assertEqual(len({m.origin[0] for m in masters}), 3)
+        self.assertTrue(all(r.origin[0] != m.origin[0] for r, m in replicas.items()))
+        self.assertEqual(sorted(list(replicas.values()), key=masters.index), masters)
+
+    def testTooFewMasters(self):
+        nodes = [node('10.0.0.1', f"n{i}") for i in range(4)]
+        with self.assertRaises(CreateException):
+            CreateCluster([], replicas=1).allocate(nodes)
+
+    def testWaitWithBackoff(self):
+        calls = []
+        with patch('redis_cm.time.sleep') as sleep:
+            self.assertTrue(wait_with_backoff(lambda: calls.append(1) or len(calls) > 4,
+                                              initial=0.1, maximum=0.3))
+        self.assertListEqual([c.args[0] for c in sleep.call_args_list],
+                             [0.1, 0.2, 0.3, 0.3])
+        self.assertFalse(wait_with_backoff(lambda: False, timeout=0.05, initial=0.01))
+
+    def testCreate(self):
+        with FakeCluster(masters=6, joined=False, hosts=3) as cluster:
+            nodes = CreateCluster([n.addr for n in cluster.nodes], replicas=1).create()
+            self.assertEqual(len(list(nodes.masters)), 3)
+            # Spread over hosts by the given addresses: the nodes themselves
+            # reported an empty IP until they were MET.
+            self.assertEqual(len({m.host for m in nodes.masters}), 3)
+            for n in nodes:
+                if n.replicate is not None:
+                    self.assertNotEqual(n.host, nodes.get_by_node_id(n.replicate).host)
+            self.assertEqual(len(nodes.covered_slots), CLUSTER_HASH_SLOTS)
+            check = CheckCluster(nodes)
+            check.check(quiet=True)
+            self.assertEqual(check.num_errors, 0)
+            # One ADDSLOTSRANGE per master instead of thousands of slots.
+            self.assertListEqual(
+                sorted(n.calls['CLUSTER ADDSLOTSRANGE'] for n in cluster.nodes),
+                [0, 0, 0, 1, 1, 1])
+            self.assertEqual(sum(n.calls['CLUSTER MEET'] for n in cluster.nodes), 5)
+
+    def testCreateNotEmpty(self):
+        with FakeCluster(masters=3) as cluster:
+            with self.assertRaises(CreateException):
+                CreateCluster([n.addr for n in cluster.nodes]).create()
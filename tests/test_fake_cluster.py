@@ -0,0 +1,76 @@
+import socket
+import threading
+import time
+import unittest
+from redis_cm import CheckCluster, FixCluster, MoveSlot, Node, Nodes, SlotCensus
+from tests.fakecluster import FakeCluster, key_slot
+
+
+class testFakeCluster(unittest.TestCase):
+    def setUp(self):
+        self.cluster = FakeCluster(masters=3, replicas=1, keys_per_slot=2,
+                                   password='secret').start()
+        self.addCleanup(self.cluster.stop)
+
+    def discover(self):
+        return Nodes.discover([self.cluster.seed], 'secret', raw=True)
+
+    def testKeySlot(self):
+        self.assertEqual(key_slot('123456789'), 12739)
+        self.assertEqual(key_slot('{user1000}.following'), key_slot('{user1000}.followers'))
+
+    def testDiscoverAndCheck(self):
+        nodes = self.discover()
+        self.assertEqual(len(list(nodes)), 6)
+        self.assertEqual(len(list(nodes.masters)), 3)
+        check = CheckCluster(nodes)
+        check.check(quiet=True)
+        self.assertEqual(check.num_errors, 0)
+        self.assertEqual(SlotCensus.take(nodes).total_keys, 2 * 16384)
+
+    def testAuthRequired(self):
+        with socket.create_connection(('127.0.0.1', self.cluster.nodes[0].port)) as sock:
+            sock.sendall(b'*1\r\n$4\r\nPING\r\n')
+            self.assertTrue(sock.recv(1024).startswith(b'-NOAUTH'))
+
+    def testMoveSlot(self):
+        nodes = self.discover()
+        src = next(n for n in nodes.masters if 0 in n.slots)
+        dst = next(n for n in nodes.masters if 0 not in n.slots)
+        dst.cluster_setslot_importing(0, src)
+        src.cluster_setslot_migrating(0, dst)
+        move = MoveSlot(0, src, dst, 'secret').move_slot()
+        for n in (dst, src):
+            n.cluster_setslot_node(0, dst)
+        self.assertEqual(move.stats.keys, 2)
+        self.assertEqual(self.cluster.owner[0].node_id, dst.node_id)
+        self.assertEqual(self.cluster.node(str(dst)).count_keys(0), 2)
+
+    def testFixOpenSlot(self):
+        owner = self.cluster.owner[5]
+        other = next(n for n in self.cluster.masters if n is not owner)
+        self.cluster.open_slot(5, owner, other)
+        nodes = self.discover()
+        check = CheckCluster(nodes)
+        check.check(quiet=True)
+        self.assertEqual(check.num_errors, 2)
+
+        FixCluster(self.discover(), 'secret').fix()
+        check = CheckCluster(self.discover())
+        check.check(quiet=True)
+        self.assertEqual(check.num_errors, 0)
+        self.assertIs(self.cluster.owner[5], other)
+
+    def testInjectedLatency(self):
+        slow = self.cluster.nodes[1]
+        slow.latency = 0.1
+        fast = Node(self.cluster.nodes[2].addr, 'secret')
+        fast.connect()
+        started = time.monotonic()
+        waiter = threading.Thread(target=Node(slow.addr, 'secret').connect)
+        waiter.start()
+        fast.load_info(raw=True)
+        # The slow node's delayed replies don't hold up the others.
+        self.assertLess(time.monotonic() - started, 0.1)
+        waiter.join()
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
@@ -0,0 +1,153 @@
+import io
+import unittest
+from array import array
+from contextlib import redirect_stderr
+from unittest.mock import patch
+from redis_cm import (CheckCluster, Node, Nodes, FixCluster, FixOpenSlot, MoveSlot,
+                      SlotCensus, SlotNotifier, SlotSet, FIX_CASE_MOVE, FIX_CASE_MOVE_TO_OWNER, FIX_CASE_MOVE_TO_TARGET,
+                      FIX_CASE_CLOSE, FIX_CASE_UNHANDLED, CLUSTER_HASH_SLOTS, main)
+from .fixture import cluster_nodes_nodes
+from .fakecluster import FakeCluster
+
+
+def census(keys):
+    '''
+    SlotCensus from {(node, slot): numkeys}.
+    '''
+    counts = {}
+    for (node, slot), numkeys in keys.items():
+        counts.setdefault(node.node_id, array('Q', [0]) * CLUSTER_HASH_SLOTS)[slot] = numkeys
+    return SlotCensus(counts)
+
+
+class testFixOpenSlot(unittest.TestCase):
+    def setUp(self):
+        self._nodes = cluster_nodes_nodes()
+        masters = {str(m): m for m in self._nodes.masters}
+        # The fixture has 5460 migrating from a to b.
+        self._a = masters['192.168.56.102:7001']
+        self._b = masters['192.168.56.103:7002']
+        self._c = masters['192.168.56.101:7003']
+
+    def testMove(self):
+        self._b._importing = {5460: self._a.node_id}
+        fix = FixOpenSlot(self._nodes, 5460, census({(self._a, 5460): 3}))
+        self.assertEqual(fix.classify(), FIX_CASE_MOVE)
+        self.assertIs(fix.owner, self._a)
+        self.assertSetEqual(fix.involved, {self._a, self._b})
+
+    def testClose(self):
+        fix = FixOpenSlot(self._nodes, 5460, census({(self._a, 5460): 3}))
+        self.assertEqual(fix.classify(), FIX_CASE_CLOSE)
+
+    def testMoveToOwner(self):
+        self._a._migrating = None
+        fix = FixOpenSlot(self._nodes, 5460, census({(self._a, 5460): 3,
+                                                     (self._c, 5460): 1}))
+        self.assertEqual(fix.classify(), FIX_CASE_MOVE_TO_OWNER)
+        self.assertIs(fix.owner, self._a)
+
+    def testMultipleOwners(self):
+        self._a._migrating = None
+        self._c._slots = self._c.slots | {5460}
+        self._nodes.reindex()
+        fix = FixOpenSlot(self._nodes, 5460, census({(self._a, 5460): 1,
+                                                     (self._c, 5460): 5}))
+        self.assertEqual(fix.classify(), FIX_CASE_MOVE_TO_OWNER)
+        self.assertIs(fix.owner, self._c)
+
+    def testMoveToTarget(self):
+        self._b._importing = {5460: self._a.node_id}
+        self._c._importing = {5460: self._a.node_id}
+        fix = FixOpenSlot(self._nodes, 5460, census({}))
+        self.assertEqual(fix.classify(), FIX_CASE_MOVE_TO_TARGET)
+
+    def testUnhandled(self):
+        self._b._importing = {5460: self._a.node_id}
+        self._c._importing = {5460: self._a.node_id}
+        fix = FixOpenSlot(self._nodes, 5460, census({(self._c, 5460): 2}))
+        self.assertEqual(fix.classify(), FIX_CASE_UNHANDLED)
+
+
+class testFixOpenSlotLive(unittest.TestCase):
+    def setUp(self):
+        self.cluster = FakeCluster(masters=4, keys_per_slot=2).start()
+        self.addCleanup(self.cluster.stop)
+        self.owner = self.cluster.owner[5]
+        self.a, self.b = [n for n in self.cluster.masters if n is not self.owner][:2]
+
+    def fix(self, case):
+        fix = FixOpenSlot(Nodes.discover([self.cluster.seed], raw=True), 5)
+        self.assertEqual(fix.classify(), case)
+        fix.fix()
+        check = CheckCluster(Nodes.discover([self.cluster.seed], raw=True), silent=True)
+        check.check(quiet=True)
+        self.assertSetEqual(set(check.open_slots), set())
+        self.assertEqual(check.num_errors, 0)
+
+    def testClose(self):
+        self.owner.migrating[5] = self.a.node_id
+        self.fix(FIX_CASE_CLOSE)
+        self.assertIs(self.cluster.owner[5], self.owner)
+        self.assertEqual(self.owner.count_keys(5), 2)
+
+    def testMove(self):
+        self.cluster.open_slot(5, self.owner, self.a)
+        self.fix(FIX_CASE_MOVE)
+        self.assertIs(self.cluster.owner[5], self.a)
+        self.assertEqual(self.a.count_keys(5), 2)
+
+    def testMoveToTarget(self):
+        self.cluster.open_slot(5, self.owner, self.a)
+        self.b.importing[5] = self.owner.node_id
+        self.fix(FIX_CASE_MOVE_TO_TARGET)
+        self.assertIs(self.cluster.owner[5], self.a)
+        self.assertEqual(self.a.count_keys(5), 2)
+        self.assertEqual(self.owner.count_keys(5), 0)
+
+    def testMoveToOwner(self):
+        self.a.importing[5] = self.owner.node_id
+        self.a.put('stray', b'v', 5)
+        self.fix(FIX_CASE_MOVE_TO_OWNER)
+        self.assertIs(self.cluster.owner[5], self.owner)
+        self.assertEqual(self.owner.count_keys(5), 3)
+        self.assertEqual(self.a.count_keys(5), 0)
+
+    def testFixClusterSharesNotifier(self):
+        slots = [slot for slot in range(CLUSTER_HASH_SLOTS)
+                 if self.cluster.owner[slot] is self.owner][:20]
+        for slot in slots:
+            self.cluster.open_slot(slot, self.owner, self.a)
+        with patch('redis_cm.SlotNotifier', wraps=SlotNotifier) as notifier:
+            FixCluster(Nodes.discover([self.cluster.seed], raw=True), per_node=4).fix()
+        notifier.assert_called_once()
+        self.assertTrue(all(self.cluster.owner[slot] is self.a for slot in slots))
+
+
+class testFixCluster(unittest.TestCase):
+    def setUp(self):
+        self._nodes = cluster_nodes_nodes()
+        masters = {str(m): m for m in self._nodes.masters}
+        a = masters['192.168.56.102:7001']
+        b = masters['192.168.56.103:7002']
+        a._migrating = {slot: b.node_id for slot in range(100)}
+        b._importing = {slot: a.node_id for slot in range(100)}
+
+    def testFix(self):
+        moved = []
+        with patch.object(Node, 'cluster_count_keys_in_slots', autospec=True,
+                          side_effect=lambda n, slots, pipeline: [int(s in n.slots) for s in slots]) as count, \
+             patch.object(MoveSlot, 'set_moving', autospec=True, side_effect=lambda m: m), \
+             patch.object(MoveSlot, 'move_slot', autospec=True,
+                          side_effect=lambda m: moved.append(m.slot) or m), \
+             patch.object(MoveSlot, 'notify', autospec=True, side_effect=lambda m, n: m):
+            FixCluster(self._nodes, concurrency=4).fix()
+        self.assertEqual(count.call_count, 3)
+        self.assertListEqual(sorted(moved), list(range(100)))
+
+    def testPerNodeAtLeastOne(self):
+        for per_node in (0, -1):
+            with self.assertRaises(ValueError):
+                FixCluster(self._nodes, per_node=per_node)
+            with self.assertRaises(SystemExit), redirect_stderr(io.StringIO()):
+                main(['fix', '192.168.56.102:7001', '--per-node', str(per_node)])
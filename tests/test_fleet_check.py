@@ -0,0 +1,124 @@
+import socket
+import threading
+import time
+import unittest
+from unittest.mock import patch
+import redis
+from redis_cm import CheckCluster, FleetCheck, FleetException
+from tests.fakecluster import FakeCluster
+
+
+class OpenConnections:
+    '''
+    Client connections open at once, counted on redis-py's side while
+    patched in.
+    '''
+    def __init__(self, test):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.peak = 0
+        connect = redis.connection.Connection._connect
+        disconnect = redis.connection.Connection.disconnect
+
+        def counted_connect(conn):
+            sock = connect(conn)
+            self._add(1)
+            return sock
+
+        def counted_disconnect(conn, *args, **kwargs):
+            connected = conn._sock is not None
+            disconnect(conn, *args, **kwargs)
+            if connected:
+                self._add(-1)
+
+        for name, func in (('_connect', counted_connect), ('disconnect', counted_disconnect)):
+            patcher = patch.object(redis.connection.Connection, name, func)
+            patcher.start()
+            test.addCleanup(patcher.stop)
+
+    def _add(self, n):
+        with self._lock:
+            self.open += n
+            self.peak = max(self.peak, self.open)
+
+
+class testFleetCheck(unittest.TestCase):
+    def setUp(self):
+        self.clusters = []
+        for i in range(4):
+            cluster = FakeCluster(masters=3, replicas=1, latency=0.05,
+                                  password='secret' if i == 1 else None).start()
+            self.addCleanup(cluster.stop)
+            self.clusters.append(cluster)
+
+    def testReadInventory(self):
+        lines = ['# name seeds password', '', 'a 10.0.0.1:7000,10.0.0.2:7000',
+                 "b 10.0.0.3:7000 'p w'"]
+        self.assertListEqual(FleetCheck.read_inventory(lines),
+                             [('a', ['10.0.0.1:7000', '10.0.0.2:7000'], None),
+                              ('b', ['10.0.0.3:7000'], 'p w')])
+        with self.assertRaises(FleetException):
+            FleetCheck.read_inventory(['a 10.0.0.1:7000', 'a 10.0.0.2:7000'])
+        with self.assertRaises(FleetException):
+            FleetCheck.read_inventory(['a'])
+        with self.assertRaises(FleetException):
+            FleetCheck.read_inventory(['bad localhost'])
+
+    def testRun(self):
+        broken = self.clusters[2]
+        owner = broken.owner[7]
+        broken.open_slot(7, owner, next(n for n in broken.masters if n is not owner))
+        self.clusters[3].assign(self.clusters[3].masters[0], [])
+        self.clusters[3].owner[100] = None
+
+        started = time.monotonic()
+        fleet = FleetCheck([(f"c{i}", [c.seed], 'secret' if i == 1 else None)
+                            for i, c in enumerate(self.clusters)], budget=8).run()
+        elapsed = time.monotonic() - started
+        results = {r['cluster']: r for r in fleet.results}
+        self.assertListEqual(list(results), ['c0', 'c1', 'c2', 'c3'])
+        self.assertEqual(results['c0']['errors'], 0)
+        self.assertEqual(results['c1']['nodes'], 6)
+        self.assertListEqual(results['c2']['open_slots'], [7])
+        self.assertEqual(results['c3']['uncovered_slots'], '100')
+        self.assertEqual(fleet.num_errors, 2)
+        # Concurrent: well under the sum of the per-cluster times.
+        self.assertLess(elapsed, sum(r['elapsed'] for r in fleet.results) * 0.75)
+
+    def testUnreachable(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        fleet = FleetCheck([('up', [self.clusters[0].seed], None),
+                            ('down', [f"127.0.0.1:{port}"], None)]).run()
+        down = fleet.results[1]
+        self.assertIn("can't connect", down['error'])
+        self.assertEqual(fleet.results[0]['errors'], 0)
+        self.assertEqual(fleet.num_errors, 1)
+
+    def testOneBadCluster(self):
+        fleet = FleetCheck([('bad', ['localhost'], None),
+                            ('good', [self.clusters[0].seed], None)]).run()
+        self.assertIn('localhost', fleet.results[0]['error'])
+        self.assertEqual(fleet.results[1]['errors'], 0)
+        self.assertEqual(fleet.num_errors, 1)
+
+    def testBudgetBelowClusters(self):
+        for cluster in self.clusters:
+            for node in cluster.nodes:
+                node.latency = 0
+        fleet = FleetCheck([(f"c{i}", [c.seed], 'secret' if i == 1 else None)
+                            for i, c in enumerate(self.clusters)], budget=2).run()
+        self.assertListEqual([r['nodes'] for r in fleet.results], [6, 6, 6, 6])
+
+    def testSilentPrinterShared(self):
+        self.assertIs(CheckCluster(silent=True)._xprint, CheckCluster(silent=True)._xprint)
+
+    def testBudgetBoundsConnections(self):
+        with FakeCluster(masters=10, replicas=1) as cluster:
+            connections = OpenConnections(self)
+            fleet = FleetCheck([(f"c{i}", [cluster.seed], None) for i in range(3)],
+                               budget=4).run()
+        self.assertListEqual([r['nodes'] for r in fleet.results], [20, 20, 20])
+        self.assertLessEqual(connections.peak, 4)
+        self.assertEqual(connections.open, 0)
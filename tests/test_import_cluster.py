@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from redis_cm import (FileImportSource, ImportCluster, ImportException, Node, Nodes,
+                      RedisImportSource, key_slot, key_slots)
+from tests.fakecluster import FakeCluster
+
+
+class testKeySlot(unittest.TestCase):
+    def testKeySlot(self):
+        self.assertEqual(key_slot('123456789'), 12739)
+        self.assertEqual(key_slot(b'foo'), 12182)
+        self.assertEqual(key_slot('{user1000}.following'), key_slot('user1000'))
+        # Empty hash tags hash the whole key.
+        self.assertEqual(key_slot('foo{}{bar}'), 8363)
+        self.assertEqual(key_slot('foo{{bar}}zap'), key_slot('{bar'))
+
+    def testKeySlots(self):
+        keys = [b'123456789', b'{user1000}.following', b'foo{}{bar}', b'\xff\x00']
+        self.assertListEqual(list(key_slots(keys)), [key_slot(k) for k in keys])
+
+
+class testFileImportSource(unittest.TestCase):
+    def source(self, data, **kwargs):
+        fd, path = tempfile.mkstemp()
+        self.addCleanup(os.unlink, path)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        return FileImportSource(path, **kwargs)
+
+    def testParse(self):
+        data = (b'*3\r\n$3\r\nSET\r\n$1\r\na\r\n$4\r\n\r\n\r\n\r\n'
+                b'SET b 2\r\n'
+                b'*3\r\n$3\r\nSET\r\n$1\r\nc\r\n$3\r\n')
+        commands, pos = FileImportSource.parse(data)
+        self.assertListEqual(commands, [[b'SET', b'a', b'\r\n\r\n'], [b'SET', b'b', b'2']])
+        self.assertEqual(data[pos:], b'*3\r\n$3\r\nSET\r\n$1\r\nc\r\n$3\r\n')
+
+    def testParseQuoted(self):
+        commands, _ = FileImportSource.parse(b'SET "q r" z\nSET \'it\\\'s\' "a\\x41\\n"\n')
+        self.assertListEqual(commands, [[b'SET', b'q r', b'z'], [b'SET', b"it's", b'aA\n']])
+        for line in (b'SET "q r z\n', b'SET "q"r z\n'):
+            with self.assertRaises(ImportException):
+                FileImportSource.parse(line)
+
+    def testBatchesAcrossReads(self):
+        data = b''.join(b'*3\r\n$3\r\nSET\r\n$2\r\nk%d\r\n$1\r\nv\r\n' % i for i in range(10))
+        source = self.source(data + b'SET last v', batch=4, read_size=7)
+        batches = list(source.batches())
+        self.assertListEqual([len(b) for b in batches], [4, 4, 3])
+        self.assertListEqual(batches[-1][-1], [b'SET', b'last', b'v'])
+
+    def testTruncated(self):
+        with self.assertRaises(ImportException):
+            list(self.source(b'*3\r\n$3\r\nSET\r\n').batches())
+
+
+class testImportCluster(unittest.TestCase):
+    def setUp(self):
+        self.cluster = FakeCluster(masters=3).start()
+        self.addCleanup(self.cluster.stop)
+        self.source = FakeCluster(masters=1, assign_slots=False).start()
+        self.addCleanup(self.source.stop)
+        for i in range(500):
+            self.source.nodes[0].put(f"key:{i}", b'\xff\x00%d' % i, 0)
+        self.nodes = Nodes.discover([self.cluster.seed], raw=True)
+
+    def testImport(self):
+        run = ImportCluster(self.nodes, RedisImportSource(self.source.seed, batch=50),
+                            batch=20, queue_size=1).run()
+        self.assertEqual(run.imported, 500)
+        self.assertFalse(run.errors)
+        for master in self.cluster.masters:
+            for key, slot in master.slot_of.items():
+                self.assertIs(self.cluster.owner[slot], master)
+        owner = self.cluster.owner[key_slot('key:7')]
+        self.assertEqual(owner.keys[key_slot('key:7')]['key:7'], b'\xff\x007')
+
+    def testWriterDies(self):
+        # A writer killed by a non-Redis error must not leave the reader
+        # blocked on its full queue.
+        with patch.object(Node, 'call', autospec=True, side_effect=ValueError('boom')), \
+             patch('redis_cm.IMPORT_QUEUE_TIMEOUT', 0.01):
+            with self.assertRaises(ValueError):
+                ImportCluster(self.nodes, RedisImportSource(self.source.seed, batch=50),
+                              batch=5, queue_size=1).run()
+
+    def testImportErrors(self):
+        ImportCluster(self.nodes, RedisImportSource(self.source.seed)).run()
+        run = ImportCluster(self.nodes, RedisImportSource(self.source.seed)).run()
+        self.assertEqual(run.imported, 0)
+        self.assertDictEqual(dict(run.errors),
+                             {'BUSYKEY Target key name already exists.': 500})
+        run = ImportCluster(self.nodes,
+                            RedisImportSource(self.source.seed, replace=True)).run()
+        self.assertEqual(run.imported, 500)
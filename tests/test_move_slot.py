@@ -0,0 +1,169 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import redis
+from redis_cm import AdaptiveBatch, MigrationThrottle, MoveSlot, MoveSlotException
+
+
+def slot_keys_source(keys, sizes=None):
+    '''
+    A source node mock whose slot holds `keys` until they are migrated.
+    '''
+    remaining = list(keys)
+    sizes = sizes or {}
+    src = MagicMock()
+    src.migrated = []
+
+    def get_keys(slot, count):
+        return remaining[:count]
+
+    def migrate_and_get_keys(dst, keys_in_slot, slot, count, password,
+                             timeout=60, replace=False):
+        for key in keys_in_slot:
+            remaining.remove(key)
+        dst.received.extend(keys_in_slot)
+        src.migrated.append((list(keys_in_slot), timeout))
+        return remaining[:count]
+
+    def migrate(dst, keys_in_slot, password, timeout=60, replace=False):
+        migrate_and_get_keys(dst, keys_in_slot, None, 0, password, timeout, replace)
+
+    src.cluster_get_keys_in_slot.side_effect = get_keys
+    src.migrate_and_get_keys_in_slot.side_effect = migrate_and_get_keys
+    src.migrate.side_effect = migrate
+    src.memory_usage.side_effect = lambda keys: [sizes.get(k, 100) for k in keys]
+    return src
+
+
+class testAdaptiveBatch(unittest.TestCase):
+    def testGrowsWhenFast(self):
+        batch = AdaptiveBatch(10, 1000, latency_budget=0.1)
+        for _ in range(20):
+            batch.update(batch.size, 0.001)
+        self.assertEqual(batch.size, 1000)
+
+    def testShrinksWhenSlow(self):
+        batch = AdaptiveBatch(10, 1000, latency_budget=0.1)
+        batch._size = 1000
+        for _ in range(20):
+            batch.update(batch.size, batch.size * 0.01)
+        self.assertEqual(batch.size, 10)
+
+    def testConvergesToBudget(self):
+        batch = AdaptiveBatch(10, 1000, latency_budget=0.1)
+        for _ in range(30):
+            batch.update(batch.size, batch.size * 0.001)
+        self.assertAlmostEqual(batch.size, 100, delta=2)
+
+    def testInvalidBounds(self):
+        with self.assertRaises(ValueError):
+            AdaptiveBatch(100, 10)
+
+
+class testMigrationThrottle(unittest.TestCase):
+    def testRateLimit(self):
+        throttle = MigrationThrottle(ops_per_sec=100)
+        with patch('redis_cm.time.sleep') as sleep:
+            throttle.acquire(50)
+            throttle.acquire(50)
+            throttle.acquire(50)
+        slept = sum(call.args[0] for call in sleep.call_args_list)
+        self.assertAlmostEqual(slept, 1.5, delta=0.1)
+
+    def testBacksOffOnLatency(self):
+        node = MagicMock()
+        node.ping_latency.return_value = 0.05
+        node.latency_latest.return_value = 0.0
+        node.instantaneous_ops_per_sec.return_value = 5000
+        throttle = MigrationThrottle(ops_per_sec=1000, latency_ceiling=0.01,
+                                     sample_interval=0)
+        with patch('redis_cm.time.sleep'):
+            throttle.acquire(10, nodes=[node])
+        self.assertAlmostEqual(throttle.ops_per_sec, 700)
+        self.assertEqual(throttle.node_ops, 5000)
+        self.assertLess(throttle.limit_batch(100), 100)
+
+        node.ping_latency.return_value = 0.001
+        for _ in range(10):
+            with patch('redis_cm.time.sleep'):
+                throttle.acquire(10, nodes=[node])
+        self.assertEqual(throttle.ops_per_sec, 1000)
+        self.assertEqual(throttle.limit_batch(100), 100)
+
+    def testMoveSlotThrottled(self):
+        keys = [f"key:{i}" for i in range(100)]
+        src = slot_keys_source(keys)
+        dst = MagicMock()
+        dst.received = []
+        throttle = MagicMock()
+        throttle.limit_batch.side_effect = lambda size: min(size, 10)
+        MoveSlot(100, src, dst, min_batch=50, max_batch=50, throttle=throttle).move_slot()
+        self.assertListEqual(dst.received, keys)
+        self.assertEqual(throttle.acquire.call_count, 10)
+        src.cluster_get_keys_in_slot.assert_called_once_with(100, 10)
+
+
+class testMoveSlot(unittest.TestCase):
+    def testMoveSlot(self):
+        keys = [f"key:{i}" for i in range(1000)]
+        src = slot_keys_source(keys)
+        dst = MagicMock()
+        dst.received = []
+        move = MoveSlot(100, src, dst, min_batch=10, max_batch=200).move_slot()
+        self.assertListEqual(dst.received, keys)
+        self.assertEqual(move.stats.keys, 1000)
+        self.assertLess(move.stats.batches, 100)
+        src.cluster_get_keys_in_slot.assert_called_once_with(100, 10)
+
+    def testMoveSlotError(self):
+        src = MagicMock()
+        src.cluster_get_keys_in_slot.return_value = ['a']
+        src.memory_usage.return_value = [100]
+        src.migrate_and_get_keys_in_slot.side_effect = \
+            redis.exceptions.ResponseError('BUSYKEY Target key name already exists.')
+        with self.assertRaises(MoveSlotException):
+            MoveSlot(100, src, MagicMock()).move_slot()
+
+    def testMoveSlotFixReplace(self):
+        src = MagicMock()
+        src.cluster_get_keys_in_slot.return_value = ['a']
+        src.memory_usage.return_value = [100]
+        src.migrate_and_get_keys_in_slot.side_effect = [
+            redis.exceptions.ResponseError('BUSYKEY Target key name already exists.'),
+            []]
+        move = MoveSlot(100, src, MagicMock(), fix=True).move_slot()
+        self.assertEqual(move.stats.keys, 1)
+        self.assertTrue(src.migrate_and_get_keys_in_slot.call_args.kwargs['replace'])
+
+    def testBatchesBySize(self):
+        keys = [f"key:{i}" for i in range(20)]
+        sizes = {k: 300 for k in keys}
+        sizes['key:5'] = 10000
+        src = slot_keys_source(keys, sizes)
+        dst = MagicMock()
+        dst.received = []
+        move = MoveSlot(100, src, dst, min_batch=20, max_batch=20,
+                        max_batch_bytes=1000, big_key_bytes=5000,
+                        timeout=1000).move_slot()
+        self.assertListEqual(sorted(dst.received), sorted(keys))
+        batches = [batch for batch, _ in src.migrated]
+        self.assertIn(['key:5'], batches)
+        self.assertTrue(all(len(b) <= 3 for b in batches))
+        # 10000 bytes at the minimum assumed rate still fit the base timeout.
+        self.assertTrue(all(timeout == 1000 for _, timeout in src.migrated))
+        self.assertEqual(move.stats.bytes, 19 * 300 + 10000)
+
+    def testBigKeyTimeout(self):
+        src = slot_keys_source(['big'], {'big': 100 * 1024 * 1024})
+        dst = MagicMock()
+        dst.received = []
+        MoveSlot(100, src, dst, timeout=1000).move_slot()
+        self.assertListEqual(src.migrated, [(['big'], 10000)])
+
+    def testWithoutKeySizes(self):
+        src = slot_keys_source(['a', 'b'])
+        src.memory_usage.side_effect = None
+        src.memory_usage.return_value = None
+        dst = MagicMock()
+        dst.received = []
+        MoveSlot(100, src, dst).move_slot()
+        self.assertListEqual(src.migrated[0][0], ['a', 'b'])
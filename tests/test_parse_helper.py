@@ -0,0 +1,59 @@
+import unittest
+from unittest.mock import patch
+from redis_cm import (Node, ParseHelper, ParseHelperError, SlotSet,
+                      NODE_FLAG_MYSELF, NODE_FLAG_MASTER, NODE_FLAG_SLAVE)
+from .fixture import cluster_nodes, cluster_nodes_raw, node_info
+
+
+class testParseClusterNodes(unittest.TestCase):
+    def setUp(self):
+        self._raw = cluster_nodes_raw(cluster_nodes())
+
+    def testParse(self):
+        records = {r.addr: r for r in ParseHelper.parse_cluster_nodes(self._raw)}
+        self.assertEqual(len(records), 6)
+
+        myself = records['192.168.56.102:7001']
+        self.assertEqual(myself.node_id, '3f6f88e6607b65327fa581ca9bccf6793cc9a66f')
+        self.assertEqual(myself.flags, NODE_FLAG_MYSELF | NODE_FLAG_MASTER)
+        self.assertListEqual(myself.flag_names(), ['myself', 'master'])
+        self.assertIsNone(myself.master_id)
+        self.assertEqual(myself.slots, SlotSet.from_range(0, 5460))
+        self.assertDictEqual(myself.migrating,
+                             {5460: '5814ec708ca5f0e8e042c54c382e4834186e78c0'})
+        self.assertDictEqual(myself.importing, {})
+        self.assertEqual(myself.config_epoch, 5)
+        self.assertTrue(myself.connected)
+
+        slave = records['192.168.56.101:7002']
+        self.assertTrue(slave.has_flag(NODE_FLAG_SLAVE))
+        self.assertEqual(slave.master_id, '5814ec708ca5f0e8e042c54c382e4834186e78c0')
+        self.assertFalse(slave.slots)
+
+    def testParseMyselfOnly(self):
+        records = ParseHelper.parse_cluster_nodes(self._raw, myself_only=True)
+        self.assertListEqual([r.addr for r in records], ['192.168.56.102:7001'])
+
+    def testParseImportingAndHostname(self):
+        records = ParseHelper.parse_cluster_nodes(
+            "e7d1eecce10fd6bb5eb35b9f99a514335d9ba9ca 127.0.0.1:30001@31001,host1 "
+            "myself,master - 0 0 1 connected 0-10 12 [11-<-292f8b365bb7edb5e285caf0b7e6ddc7265d2f4f]\n")
+        self.assertEqual(records[0].host, '127.0.0.1')
+        self.assertEqual(records[0].slots, SlotSet([*range(11), 12]))
+        self.assertDictEqual(records[0].importing,
+                             {11: '292f8b365bb7edb5e285caf0b7e6ddc7265d2f4f'})
+
+    def testInvalidAddr(self):
+        with self.assertRaises(ParseHelperError):
+            ParseHelper.parse_cluster_nodes("abc 127.0.0.1 master - 0 0 1 connected\n")
+
+    def testLoadInfoRawMatchesParsed(self):
+        node = Node('192.168.56.102:7001')
+        with patch.object(Node, '_cluster_nodes', return_value=cluster_nodes()):
+            node.load_info(with_friends=True)
+        info, friends = node_info(node), [(f.addr, f.flags) for f in node.friends]
+
+        with patch.object(Node, '_cluster_nodes_raw', return_value=self._raw):
+            node.load_info(with_friends=True, raw=True)
+        self.assertDictEqual(node_info(node), info)
+        self.assertListEqual([(f.addr, f.flags) for f in node.friends], friends)
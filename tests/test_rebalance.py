@@ -0,0 +1,55 @@
+import unittest
+from collections import Counter
+from redis_cm import RebalancePlanner, CLUSTER_HASH_SLOTS
+from .fixture import cluster_nodes_nodes
+
+
+def apply_plan(nodes, plan):
+    counts = Counter({m: len(m.slots) for m in nodes.masters})
+    for slot, src, dst in plan:
+        assert slot in src.slots
+        counts[src] -= 1
+        counts[dst] += 1
+    return counts
+
+
+class testRebalancePlanner(unittest.TestCase):
+    def setUp(self):
+        self._nodes = cluster_nodes_nodes()
+        self._first = next(m for m in self._nodes.masters if 0 in m.slots)
+
+    def testBalanced(self):
+        self.assertListEqual(RebalancePlanner(self._nodes).plan(), [])
+
+    def testWeights(self):
+        planner = RebalancePlanner(self._nodes, weights={self._first.node_id: 2})
+        plan = planner.plan()
+        counts = apply_plan(self._nodes, plan)
+        self.assertEqual(sum(counts.values()), CLUSTER_HASH_SLOTS)
+        self.assertTrue(all(dst is self._first for _, _, dst in plan))
+        # The others may keep at most 4096 * 1.02 slots each, so exactly
+        # (5462 - 4177) + (5461 - 4177) slots have to leave them.
+        self.assertEqual(len(plan), 2569)
+        self.assertGreaterEqual(counts[self._first], 8029)
+        self.assertTrue(all(count <= 4177 for m, count in counts.items()
+                            if m is not self._first))
+        self.assertEqual(len(set(slot for slot, _, _ in plan)), len(plan))
+
+    def testDrainWithZeroWeight(self):
+        plan = RebalancePlanner(self._nodes, weights={str(self._first): 0}).plan()
+        counts = apply_plan(self._nodes, plan)
+        self.assertEqual(counts[self._first], 0)
+        self.assertEqual(len(plan), 5461)
+        for m, count in counts.items():
+            if m is not self._first:
+                self.assertAlmostEqual(count, CLUSTER_HASH_SLOTS / 2, delta=164)
+
+    def testPreferEmptySlots(self):
+        keys_in_slot = [100] * CLUSTER_HASH_SLOTS
+        for slot in range(5461, 5461 + 2000):
+            keys_in_slot[slot] = 0
+        plan = RebalancePlanner(self._nodes, weights={self._first.node_id: 1.5},
+                                keys_in_slot=keys_in_slot).plan()
+        moved = [slot for slot, src, _ in plan if 5461 in src.slots]
+        self.assertTrue(moved)
+        self.assertTrue(all(keys_in_slot[slot] == 0 for slot in moved))
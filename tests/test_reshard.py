@@ -0,0 +1,188 @@
+import threading
+import time
+import unittest
+from collections import Counter
+from unittest.mock import MagicMock, patch
+import redis
+from redis_cm import (Nodes, ReshardScheduler, ReshardException, ReshardJournal,
+                      ReshardJournalException, MoveSlot, MoveSlotException,
+                      SlotNotifier, JOURNAL_MOVING, JOURNAL_DRAINED, JOURNAL_NOTIFIED)
+from tests.fakecluster import FakeCluster
+
+
+class ConcurrencyTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources = Counter()
+        self._destinations = Counter()
+        self.max_source = 0
+        self.max_destination = 0
+        self.max_running = 0
+        self.moved = []
+
+    def move(self, scheduler, slot, src, dst):
+        with self._lock:
+            self._sources[src] += 1
+            self._destinations[dst] += 1
+            self.max_source = max(self.max_source, self._sources[src])
+            self.max_destination = max(self.max_destination, self._destinations[dst])
+            self.max_running = max(self.max_running,
+                                   sum(self._sources.values()))
+        time.sleep(0.002)
+        with self._lock:
+            self._sources[src] -= 1
+            self._destinations[dst] -= 1
+            self.moved.append(slot)
+        move = MagicMock()
+        move.stats.keys = 1
+        return move
+
+
+class testReshardScheduler(unittest.TestCase):
+    def setUp(self):
+        self._masters = [MagicMock(name=f"master{i}") for i in range(6)]
+
+    def _plan(self, nslots):
+        srcs, dsts = self._masters[:3], self._masters[3:]
+        return [(slot, srcs[slot % 3], dsts[(slot // 3) % 3])
+                for slot in range(nslots)]
+
+    def testRun(self):
+        tracker = ConcurrencyTracker()
+        plan = self._plan(300)
+        with patch.object(ReshardScheduler, '_move', autospec=True,
+                          side_effect=tracker.move):
+            scheduler = ReshardScheduler(MagicMock(), plan, concurrency=8,
+                                         per_source=2, per_destination=2).run()
+        self.assertListEqual(sorted(tracker.moved), list(range(300)))
+        self.assertLessEqual(tracker.max_source, 2)
+        self.assertLessEqual(tracker.max_destination, 2)
+        self.assertGreater(tracker.max_running, 1)
+        self.assertEqual(scheduler.progress.done, 300)
+        self.assertEqual(scheduler.progress.keys, 300)
+
+    def testPerNodeAtLeastOne(self):
+        for per_node in (0, -1):
+            with self.assertRaises(ValueError):
+                ReshardScheduler(MagicMock(), self._plan(3), per_source=per_node)
+            with self.assertRaises(ValueError):
+                ReshardScheduler(MagicMock(), self._plan(3), per_destination=per_node)
+
+    def testRunStopsOnFailure(self):
+        tracker = ConcurrencyTracker()
+
+        def move(scheduler, slot, src, dst):
+            if slot == 5:
+                raise MoveSlotException('failed')
+            return tracker.move(scheduler, slot, src, dst)
+
+        with patch.object(ReshardScheduler, '_move', autospec=True,
+                          side_effect=move):
+            scheduler = ReshardScheduler(MagicMock(), self._plan(300), concurrency=4)
+            with self.assertRaises(ReshardException):
+                scheduler.run()
+        self.assertEqual(len(scheduler.failures), 1)
+        self.assertLess(len(tracker.moved), 299)
+
+
+class testSlotNotifier(unittest.TestCase):
+    def setUp(self):
+        self.cluster = FakeCluster(masters=4).start()
+        self.addCleanup(self.cluster.stop)
+        self.nodes = Nodes.discover([self.cluster.seed], raw=True)
+        masters = sorted(self.nodes.masters, key=lambda n: min(n.slots))
+        self.src, self.dst = masters[0], masters[1]
+        self.others = [self.cluster.node(str(n)) for n in masters[2:]]
+
+    def setslots(self):
+        return [n.calls['CLUSTER SETSLOT'] for n in self.others]
+
+    def testCoalesced(self):
+        notifier = SlotNotifier(self.nodes, batch=10, interval=60)
+        notifier.add(0, self.src, self.dst)
+        # Nothing was flushed yet, so the first slot goes out at once.
+        self.assertListEqual(self.setslots(), [1, 1])
+        for slot in range(1, 25):
+            notifier.add(slot, self.src, self.dst)
+        self.assertListEqual(self.setslots(), [21, 21])
+        notifier.close()
+        self.assertListEqual(self.setslots(), [25, 25])
+        self.assertEqual(self.cluster.node(str(self.src)).calls['CLUSTER SETSLOT'], 0)
+        self.assertFalse(notifier.failures)
+
+    def testFailuresReported(self):
+        down = MagicMock()
+        down.call.side_effect = redis.exceptions.ConnectionError('down')
+        nodes = MagicMock()
+        nodes.masters = [self.src, self.dst, down]
+        with SlotNotifier(nodes) as notifier:
+            notifier.add(0, self.src, self.dst)
+        self.assertListEqual(notifier.failures, [(0, down, down.call.side_effect)])
+
+    def testReshard(self):
+        plan = [(slot, self.src, self.dst) for slot in range(40)]
+        ReshardScheduler(self.nodes, plan, concurrency=4).run()
+        for slot in range(40):
+            self.assertEqual(self.cluster.owner[slot].node_id, self.dst.node_id)
+        self.assertListEqual(self.setslots(), [40, 40])
+
+
+class testReshardJournal(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self._dir = tempfile.TemporaryDirectory()
+        self._path = f"{self._dir.name}/reshard.journal"
+        self._masters = [MagicMock(node_id=f"{i:040x}") for i in range(2)]
+        self._nodes = MagicMock()
+        self._nodes.get_by_node_id.side_effect = \
+            lambda node_id: next(m for m in self._masters if m.node_id == node_id)
+        self._plan = [(slot, self._masters[0], self._masters[1]) for slot in range(4)]
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _run(self, scheduler):
+        steps = []
+        with patch.object(MoveSlot, 'set_moving', autospec=True,
+                          side_effect=lambda m: steps.append(('set_moving', m.slot)) or m), \
+             patch.object(MoveSlot, 'move_slot', autospec=True,
+                          side_effect=lambda m: steps.append(('move_slot', m.slot)) or m), \
+             patch.object(MoveSlot, 'notify', autospec=True,
+                          side_effect=lambda m, nodes: steps.append(('notify', m.slot)) or m):
+            scheduler.run()
+        return steps
+
+    def testJournal(self):
+        self._run(ReshardScheduler(self._nodes, self._plan, concurrency=1,
+                                   journal=ReshardJournal(self._path)))
+        plan, states = ReshardJournal.load(self._path)
+        self.assertListEqual(plan, [(slot, self._masters[0].node_id,
+                                     self._masters[1].node_id) for slot in range(4)])
+        self.assertDictEqual(states, dict.fromkeys(range(4), JOURNAL_NOTIFIED))
+
+    def testResume(self):
+        journal = ReshardJournal(self._path)
+        journal.write_plan(self._plan)
+        journal.record(JOURNAL_MOVING, 0)
+        journal.record(JOURNAL_DRAINED, 0, keys=10)
+        journal.record(JOURNAL_NOTIFIED, 0)
+        journal.record(JOURNAL_MOVING, 1)
+        journal.record(JOURNAL_DRAINED, 1, keys=10)
+        journal.record(JOURNAL_MOVING, 2)
+        journal.close()
+        with open(self._path, 'a') as f:
+            f.write('{"event": "notif')
+
+        scheduler = ReshardScheduler.resume(self._nodes, self._path, concurrency=1)
+        steps = self._run(scheduler)
+        self.assertNotIn(0, [slot for _, slot in steps])
+        self.assertListEqual([step for step in steps if step[1] == 1], [('notify', 1)])
+        self.assertListEqual([step for step in steps if step[1] == 2],
+                             [('set_moving', 2), ('move_slot', 2), ('notify', 2)])
+        self.assertEqual(scheduler.progress.total, 3)
+        _, states = ReshardJournal.load(self._path)
+        self.assertDictEqual(states, dict.fromkeys(range(4), JOURNAL_NOTIFIED))
+
+    def testLoadWithoutPlan(self):
+        with self.assertRaises(ReshardJournalException):
+            ReshardJournal.load(self._path)
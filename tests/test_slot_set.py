@@ -0,0 +1,39 @@
+import unittest
+from redis_cm import SlotSet, summarize_slots, parse_slots, CLUSTER_HASH_SLOTS
+
+
+class testSlotSet(unittest.TestCase):
+    def testRanges(self):
+        slots = SlotSet([0, 1, 2, 5, 7, 8, 16383])
+        self.assertListEqual(list(slots.ranges()),
+                             [(0, 2), (5, 5), (7, 8), (16383, 16383)])
+        self.assertEqual(slots.summarize(), '0-2,5,7-8,16383')
+        self.assertListEqual(list(slots), [0, 1, 2, 5, 7, 8, 16383])
+        self.assertEqual(len(slots), 7)
+
+    def testSetOperations(self):
+        a = SlotSet.from_range(0, 5460)
+        b = SlotSet.from_range(5461, 10922)
+        self.assertEqual(len(a | b), 10923)
+        self.assertEqual(a | b, SlotSet.from_range(0, 10922))
+        self.assertEqual((a | b) - b, a)
+        self.assertFalse(a & b)
+        self.assertIn(5460, a)
+        self.assertNotIn(5461, a)
+        self.assertNotIn(-1, a)
+        self.assertEqual(len(SlotSet.all()), CLUSTER_HASH_SLOTS)
+
+    def testMutation(self):
+        slots = SlotSet()
+        slots.add(10)
+        slots.update([11, 12])
+        slots.discard(11)
+        self.assertEqual(slots, {10, 12})
+        copied = slots.copy()
+        copied.add(13)
+        self.assertNotIn(13, slots)
+
+    def testHelpers(self):
+        self.assertEqual(summarize_slots([3, 1, 2, 9]), '1-3,9')
+        self.assertEqual(parse_slots([['0', '10'], ['12']]),
+                         SlotSet.from_ranges([(0, 10), (12, 12)]))
@@ -0,0 +1,81 @@
+import unittest
+from redis_cm import (NodeRecord, SlotSet, TopologyWatch, NODE_FLAG_FAIL,
+                      NODE_FLAG_MASTER, NODE_FLAG_MYSELF, NODE_FLAG_SLAVE)
+from tests.fakecluster import FakeCluster
+
+
+def record(node_id, port, slots=(), flags=NODE_FLAG_MASTER, master_id=None):
+    return NodeRecord(node_id, '127.0.0.1', port, flags, master_id, 0, True,
+                      SlotSet.from_ranges(slots), {}, {})
+
+
+def events(changes):
+    return [event for event, _ in changes]
+
+
+class testTopologyWatchDiff(unittest.TestCase):
+    def setUp(self):
+        self.old = {'a': record('a', 1, [(0, 99)], NODE_FLAG_MASTER | NODE_FLAG_MYSELF),
+                    'b': record('b', 2, [(100, 199)]),
+                    'c': record('c', 3, flags=NODE_FLAG_SLAVE, master_id='a')}
+
+    def testUnchanged(self):
+        new = {node_id: record(r.node_id, r.port, list(r.slots.ranges()),
+                               r.flags & ~NODE_FLAG_MYSELF, r.master_id)
+               for node_id, r in self.old.items()}
+        # Only the observer moved: nothing to report.
+        self.assertListEqual(TopologyWatch.diff(self.old, new), [])
+
+    def testFailover(self):
+        new = {'a': record('a', 1, [(0, 99)], NODE_FLAG_MASTER | NODE_FLAG_FAIL),
+               'b': record('b', 2, [(100, 199)]),
+               'c': record('c', 3, flags=NODE_FLAG_MASTER)}
+        self.assertListEqual(TopologyWatch.diff(self.old, new), [
+            ('flags_changed', {'node': '127.0.0.1:1', 'old': 'master',
+                               'new': 'master,fail'}),
+            ('flags_changed', {'node': '127.0.0.1:3', 'old': 'slave', 'new': 'master'}),
+            ('role_changed', {'node': '127.0.0.1:3', 'role': 'master'})])
+
+        new['a'].slots, new['c'].slots = SlotSet(), SlotSet.from_range(0, 99)
+        changes = dict(TopologyWatch.diff(self.old, new))
+        self.assertDictEqual(changes['slots_moved'], {'src': '127.0.0.1:1',
+                                                      'dst': '127.0.0.1:3',
+                                                      'slots': '0-99', 'count': 100})
+        self.assertNotIn('slots_unassigned', changes)
+
+    def testMembership(self):
+        new = dict(self.old)
+        del new['b']
+        new['d'] = record('d', 4, [(100, 149)])
+        self.assertListEqual(TopologyWatch.diff(self.old, new), [
+            ('node_added', {'node': '127.0.0.1:4', 'node_id': 'd', 'role': 'master'}),
+            ('node_removed', {'node': '127.0.0.1:2', 'node_id': 'b'}),
+            ('slots_moved', {'src': '127.0.0.1:2', 'dst': '127.0.0.1:4',
+                             'slots': '100-149', 'count': 50}),
+            ('slots_unassigned', {'src': '127.0.0.1:2', 'count': 50,
+                                  'slots': '150-199'})])
+
+
+class testTopologyWatch(unittest.TestCase):
+    def setUp(self):
+        self.cluster = FakeCluster(masters=3, replicas=1).start()
+        self.addCleanup(self.cluster.stop)
+        self.watch = TopologyWatch(self.cluster.seed)
+
+    def testPoll(self):
+        self.assertListEqual(self.watch.poll(), [])
+        self.assertEqual(len(self.watch.records), 6)
+        self.assertListEqual(self.watch.poll(), [])
+
+        src, dst = self.cluster.masters[0], self.cluster.masters[1]
+        self.cluster.open_slot(0, src, dst)
+        self.assertListEqual(sorted(self.watch.poll(), key=lambda c: c[1]['state']), [
+            ('slot_opened', {'node': dst.addr, 'slot': 0, 'state': 'importing',
+                             'peer': src.addr}),
+            ('slot_opened', {'node': src.addr, 'slot': 0, 'state': 'migrating',
+                             'peer': dst.addr})])
+
+        del src.migrating[0], dst.importing[0]
+        self.cluster.assign(dst, [0])
+        self.assertListEqual(sorted(events(self.watch.poll())),
+                             ['slot_closed', 'slot_closed', 'slots_moved'])
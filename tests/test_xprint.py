@@ -0,0 +1,103 @@
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+from xprint import XPrint, BUFFER_SIZE, LOG_LEVEL_VERBOSE
+
+
+class Terminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
+class Addr:
+    def __str__(self):
+        return 'a:1'
+
+
+class testXPrint(unittest.TestCase):
+    def setUp(self):
+        self.out = io.StringIO()
+        patcher = patch('sys.stdout', self.out)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.xprint = XPrint()
+
+    def testLazyMessage(self):
+        message = MagicMock(return_value='expensive')
+        self.xprint.verbose(message)
+        message.assert_not_called()
+        self.assertFalse(self.xprint.enabled(LOG_LEVEL_VERBOSE))
+
+        self.xprint.set_loglevel(LOG_LEVEL_VERBOSE)
+        self.xprint.verbose(message, 'and cheap')
+        self.xprint.flush()
+        message.assert_called_once_with()
+        self.assertEqual(self.out.getvalue(), '[VERBOSE] expensive and cheap\n')
+
+    def testBufferedOffTerminal(self):
+        self.xprint.info('one')
+        self.xprint('two', end='')
+        self.assertEqual(self.out.getvalue(), '')
+        self.xprint(' three', flush=True)
+        self.assertEqual(self.out.getvalue(), '[INFO] one\ntwo three\n')
+
+        self.xprint('x' * BUFFER_SIZE)
+        self.assertTrue(self.out.getvalue().endswith('x' * BUFFER_SIZE + '\n'))
+
+    def testFlushedWithinInterval(self):
+        # Off a terminal, lines still show up well before exit or flush().
+        with patch('xprint.EVENT_FLUSH_INTERVAL', 0.05):
+            self.xprint.set_event_sink('-')
+            self.xprint.info('progress')
+            self.xprint.event('reshard_progress', done=1)
+            self.assertEqual(self.out.getvalue(), '')
+            deadline = time.monotonic() + 5
+            while 'reshard_progress' not in self.out.getvalue():
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+        self.assertTrue(self.out.getvalue().startswith('[INFO] progress\n{'))
+
+        self.xprint.warning('careful')
+        self.assertTrue(self.out.getvalue().endswith('[WARNING] careful\n'))
+
+    def testTerminal(self):
+        terminal = Terminal()
+        with patch('sys.stdout', terminal):
+            self.xprint.ok('done', ignore_header=True)
+            self.assertIn('done', terminal.getvalue())
+            self.assertIn('\x1b[', terminal.getvalue())
+
+    def testRedirectedStdout(self):
+        self.xprint.info('first')
+        other = io.StringIO()
+        with patch('sys.stdout', other):
+            self.xprint.info('second')
+            self.xprint.flush()
+        self.assertEqual(self.out.getvalue(), '[INFO] first\n')
+        self.assertEqual(other.getvalue(), '[INFO] second\n')
+
+    def testEvents(self):
+        fields = MagicMock(return_value=[1, 2])
+        self.xprint.event('ignored', slots=fields)
+        fields.assert_not_called()
+        self.assertFalse(self.xprint.events_enabled)
+
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, path)
+        self.xprint.set_event_sink(path)
+        self.xprint.event('slot_moved', slot=5, src=Addr(),
+                          slots=fields, latency_ms=1.5)
+        self.xprint.set_event_sink(None)
+
+        with open(path) as f:
+            events = [json.loads(line) for line in f]
+        self.assertEqual(len(events), 1)
+        self.assertIn('ts', events[0])
+        del events[0]['ts']
+        self.assertDictEqual(events[0], {'event': 'slot_moved', 'slot': 5, 'src': 'a:1',
+                                         'slots': [1, 2], 'latency_ms': 1.5})
@@ -1,5 +1,9 @@
+import atexit
+import json
 import sys
-from termcolor import colored, cprint
+import threading
+import time
+from termcolor import colored
 
 _LOG_OK = 'OK'
 _LOG_FAIL = 'FAIL'
@@ -14,9 +18,11 @@ LOG_LEVEL_INFO = 2
 LOG_LEVEL_WARNING = 3
 LOG_LEVEL_ERROR = 4 
 LOG_LEVEL_NONE = 99
+# Not even plain messages.
+LOG_LEVEL_SILENT = 100
 
 _LOG_LEVELS = [LOG_LEVEL_VERBOSE, LOG_LEVEL_INFO, LOG_LEVEL_WARNING,
-               LOG_LEVEL_ERROR, LOG_LEVEL_NONE]
+               LOG_LEVEL_ERROR, LOG_LEVEL_NONE, LOG_LEVEL_SILENT]
 
 # https://en.wikipedia.org/wiki/ANSI_escape_code#SGR_parameters
 # https://en.wikipedia.org/wiki/ANSI_escape_code#3/4_bit
@@ -30,11 +36,33 @@ _LOG_LEVELS_COLORS = {
     _LOG_PRINT: (LOG_LEVEL_NONE, None, []),
 }
 
+# Off a terminal, lines are collected and written in chunks of this size.
+BUFFER_SIZE = 65536
+# Buffered lines and events are flushed at least this often (seconds) so
+# tailers stay current.
+EVENT_FLUSH_INTERVAL = 1.0
+# Written out at once, whatever the buffering.
+_UNBUFFERED = (_LOG_WARNING, _LOG_ERROR, _LOG_FAIL)
+
+
+def _render(arg):
+    # Callables are only evaluated when their level is printed.
+    return str(arg() if callable(arg) else arg)
+
 
 class XPrint:
 
     def __init__(self, level=LOG_LEVEL_INFO):
         self._log_level = level
+        self._lock = threading.Lock()
+        self._out = None
+        self._buffer = []
+        self._buffered = 0
+        self._timer = None
+        self._events = None
+        self._close_events = False
+        self._events_flushed = 0
+        atexit.register(self.flush)
 
     def __call__(self, *msg, **kwargs):
         self._xprint(_LOG_PRINT, *msg, **kwargs)
@@ -45,19 +73,107 @@ class XPrint:
     
         self._log_level = level
 
+    def enabled(self, level):
+        return self._log_level <= level
+
+    @property
+    def events_enabled(self):
+        return self._events is not None
+
     def _xprint(self, header, *msg, **kwargs):
         level, color, attrs = _LOG_LEVELS_COLORS.get(header) or (None, None, None)
         if level and self._log_level > level:
             return
    
-        ignore_header = kwargs.get('ignore_header')
-        if ignore_header is not None:
-            del kwargs['ignore_header']
+        ignore_header = kwargs.pop('ignore_header', None)
+        end = kwargs.pop('end', '\n')
+        flush = kwargs.pop('flush', False)
 
         _header = f"[{header}] " if header and not ignore_header else "" 
-        _msg = ' '.join(map(str, msg))
-        cprint(f"{_header}{_msg}", color, attrs=attrs, **kwargs)
-                   
+        _msg = ' '.join(map(_render, msg))
+        out = sys.stdout
+        line = f"{_header}{_msg}"
+        if out.isatty():
+            line, flush = colored(line, color, attrs=attrs), True
+        elif header in _UNBUFFERED:
+            flush = True
+        with self._lock:
+            self._write(out, line + end, flush)
+
+    def _write(self, out, line, flush=False):
+        if out is not self._out:
+            # stdout was redirected: the buffered lines belong to the old one.
+            self._flush_buffer()
+            self._out = out
+        self._buffer.append(line)
+        self._buffered += len(line)
+        if flush or self._buffered >= BUFFER_SIZE:
+            self._flush_buffer()
+        elif self._timer is None:
+            # Nothing waits in the buffer longer than EVENT_FLUSH_INTERVAL.
+            self._timer = threading.Timer(EVENT_FLUSH_INTERVAL, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_buffer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        buffered, self._buffer, self._buffered = self._buffer, [], 0
+        if self._out is None or self._out.closed:
+            return
+        if buffered:
+            self._out.write(''.join(buffered))
+        self._out.flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush_buffer()
+            if self._events not in (None, '-'):
+                self._events.flush()
+
+    def set_event_sink(self, sink):
+        '''
+        Write `event()` records as JSON lines to `sink`: a path (appended to),
+        '-' for stdout, an open file, or None to stop.
+        '''
+        with self._lock:
+            if self._events == '-':
+                self._flush_buffer()
+            elif self._events is not None:
+                self._events.flush()
+                if self._close_events:
+                    self._events.close()
+            self._close_events = isinstance(sink, str) and sink != '-'
+            if self._close_events:
+                sink = open(sink, 'a')
+            self._events = sink
+
+    def event(self, name, /, **fields):
+        '''
+        Record a structured event, e.g. event('slot_moved', slot=1, keys=10).
+        Callable values are only evaluated when a sink is set; anything JSON
+        can't encode, such as a Node, is written with str().
+        '''
+        if self._events is None:
+            return
+        record = {'ts': round(time.time(), 6), 'event': name}
+        for key, value in fields.items():
+            record[key] = value() if callable(value) else value
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock:
+            if self._events is None:
+                return
+            if self._events == '-':
+                # Share the message buffer so events and messages stay in order.
+                self._write(sys.stdout, line, sys.stdout.isatty())
+                return
+            self._events.write(line)
+            now = time.monotonic()
+            if now - self._events_flushed >= EVENT_FLUSH_INTERVAL:
+                self._events_flushed = now
+                self._events.flush()
+
     def verbose(self, *msg, **kwargs):
         self._xprint(_LOG_VERBOSE, *msg, **kwargs) 
      
@@ -85,6 +201,6 @@ class XPrint:
 xprint = XPrint()
 
 
-__all__ = ['xprint', 
+__all__ = ['xprint', 'BUFFER_SIZE', 'EVENT_FLUSH_INTERVAL',
            'LOG_LEVEL_ERROR', 'LOG_LEVEL_INFO', 'LOG_LEVEL_NONE',
-           'LOG_LEVEL_VERBOSE', 'LOG_LEVEL_WARNING'] 
+           'LOG_LEVEL_SILENT', 'LOG_LEVEL_VERBOSE', 'LOG_LEVEL_WARNING', 'XPrint'] 